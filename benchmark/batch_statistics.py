@@ -0,0 +1,92 @@
+"""
+Benchmark of the batch statistics endpoint.
+
+Computes the statistics of a list of symbols against a running instance of the
+API, once with one `/api/statistics` call by symbol and once with a single
+`/api/statistics/batch` call, and prints the time of both as JSON.
+
+Responses are cached by the API, so run it against an instance started with
+`CACHE_ENABLED=false` or the repeated rounds only measure the cache.
+
+Example:
+    python -m benchmark.batch_statistics --base-url http://localhost:5000 --symbols IBM,AAPL,MSFT --start-date 2023-01-01 --end-date 2023-06-01
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+async def single_calls(client: httpx.AsyncClient, base_url: str, symbols: list[str], start_date: str, end_date: str, concurrency: int):
+    """ Requests the statistics of every symbol with its own call, `concurrency` calls at a time. """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(symbol):
+        async with semaphore:
+            response = await client.get(f"{base_url}/api/statistics", params={"symbol": symbol, "start_date": start_date, "end_date": end_date})
+            response.raise_for_status()
+
+    await asyncio.gather(*(call(symbol) for symbol in symbols))
+
+
+async def batch_call(client: httpx.AsyncClient, base_url: str, symbols: list[str], start_date: str, end_date: str):
+    """ Requests the statistics of every symbol with a single call. """
+    response = await client.get(f"{base_url}/api/statistics/batch", params={"symbols": ",".join(symbols), "start_date": start_date, "end_date": end_date})
+    response.raise_for_status()
+
+
+async def run(base_url: str, symbols: list[str], start_date: str, end_date: str, concurrency: int, rounds: int) -> dict:
+    """
+    Runs the benchmark.
+
+    Arguments:
+        base_url (str): URL of the API.
+        symbols (list[str]): Symbols to compute the statistics of.
+        start_date (str): Start of the date range.
+        end_date (str): End of the date range.
+        concurrency (int): Number of single calls sent at the same time.
+        rounds (int): Number of times each mode is measured.
+
+    Returns:
+        results (dict): Mean and best time of each mode in milliseconds.
+    """
+    timings = {"single": [], "batch": []}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await single_calls(client, base_url, symbols, start_date, end_date, concurrency)
+            timings["single"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await batch_call(client, base_url, symbols, start_date, end_date)
+            timings["batch"].append(time.perf_counter() - start)
+
+    summary = lambda values: {"mean": round(statistics.fmean(values) * 1000, 3), "best": round(min(values) * 1000, 3)}
+
+    return {
+        "symbols": len(symbols),
+        "concurrency": concurrency,
+        "rounds": rounds,
+        "single_ms": summary(timings["single"]),
+        "batch_ms": summary(timings["batch"]),
+        "speedup": round(statistics.fmean(timings["single"]) / statistics.fmean(timings["batch"]), 2)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares one statistics call by symbol against a single batch call")
+    parser.add_argument("--base-url", default="http://localhost:5000", help="URL of the API")
+    parser.add_argument("--symbols", required=True, help="Comma separated symbols")
+    parser.add_argument("--start-date", required=True, help="Start of the date range, YYYY-MM-DD")
+    parser.add_argument("--end-date", required=True, help="End of the date range, YYYY-MM-DD")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of single calls sent at the same time")
+    parser.add_argument("--rounds", type=int, default=5, help="Number of times each mode is measured")
+    args = parser.parse_args()
+
+    symbols = [symbol.strip() for symbol in args.symbols.split(",") if symbol.strip()]
+    print(json.dumps(asyncio.run(run(args.base_url, symbols, args.start_date, args.end_date, args.concurrency, args.rounds)), indent=2))
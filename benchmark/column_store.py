@@ -0,0 +1,111 @@
+"""
+Latency of the column store against the SQL path.
+
+Loads the column store from the database configured for the API and then
+answers the same requests with the crud functions and with the store, one at
+a time, printing the latency percentiles of both as JSON. Requests are spread
+over the synthetic symbols stored by benchmark.data.
+
+Example:
+    python -m benchmark.data --symbols 100 --start-date 2010-01-01 --end-date 2020-01-01
+    python -m benchmark.column_store --symbols 100 --start-date 2010-01-01 --end-date 2020-01-01
+"""
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+
+from datetime import date, timedelta
+
+from benchmark.data import symbol_names, trading_days
+from financial import crud
+from financial.database import get_engine, get_sessionmaker
+from financial.store import ColumnStore
+
+# Entries by page of the financial data requests.
+PAGE_LIMIT = 100
+
+
+def requests(start: date, end: date) -> dict:
+    """ Arguments of the crud function of every kind of request, after the symbol """
+    pages = math.ceil(sum(1 for _ in trading_days(start, end)) / PAGE_LIMIT)
+
+    return {
+        "count": ("count_financial_data", (start, end), {}),
+        "page_shallow": ("get_financial_data_by_symbol", (start, end), {"offset": 0, "limit": PAGE_LIMIT + 1}),
+        "page_deep": ("get_financial_data_by_symbol", (start, end), {"offset": max(0, pages - 1) * PAGE_LIMIT, "limit": PAGE_LIMIT + 1}),
+        "statistics_short": ("get_financial_statistics", (end - timedelta(days=30), end), {}),
+        "statistics_multi_year": ("get_financial_statistics", (start, end), {}),
+    }
+
+
+def summary(timings: list[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        "mean_us": round(statistics.fmean(timings) * 1e6, 1),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 1),
+        "p99_us": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6, 1),
+    }
+
+
+async def run(symbols: int, start: date, end: date, rounds: int) -> dict:
+    '''
+    Runs the benchmark.
+
+    Arguments:
+        symbols (int): Number of synthetic symbols requested, in turns.
+        start (date): First date of the synthetic entries.
+        end (date): End of the synthetic entries.
+        rounds (int): Number of requests of every kind.
+
+    Returns:
+        results (dict): Load time and size of the store, and latency percentiles by request and path.
+    '''
+    engine = get_engine()
+    store = ColumnStore(engine)
+
+    load_start = time.perf_counter()
+    await store.reload()
+    results = {"store": {**store.status(), "load_seconds": round(time.perf_counter() - load_start, 3)}, "requests": {}}
+
+    names = symbol_names(symbols)
+
+    for name, (function, dates, options) in requests(start, end).items():
+        sql, memory = [], []
+
+        async with get_sessionmaker()() as db:
+            for number in range(rounds):
+                symbol = names[number % len(names)]
+
+                request_start = time.perf_counter()
+                expected = await getattr(crud, function)(db, symbol, *dates, **options)
+                sql.append(time.perf_counter() - request_start)
+
+                request_start = time.perf_counter()
+                result = getattr(store, function)(symbol, *dates, **options)
+                memory.append(time.perf_counter() - request_start)
+
+                # Both paths must agree, or the comparison means nothing.
+                if function == "get_financial_data_by_symbol":
+                    result, expected = [tuple(entry) for entry in result], [tuple(row) for row in expected]
+                elif function == "get_financial_statistics":
+                    result, expected = result.count, expected.count
+                assert result == expected, f"{name} differs for {symbol}"
+
+        results["requests"][name] = {"sql": summary(sql), "store": summary(memory), "speedup": round(statistics.fmean(sql) / statistics.fmean(memory), 1)}
+
+    await engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the latency of the column store and the database")
+    parser.add_argument("--symbols", type=int, default=100, help="Number of synthetic symbols loaded with benchmark.data")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2010, 1, 1), help="First date of the synthetic entries, YYYY-MM-DD")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date(2020, 1, 1), help="End of the synthetic entries, YYYY-MM-DD")
+    parser.add_argument("--rounds", type=int, default=500, help="Number of requests of every kind")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args.symbols, args.start_date, args.end_date, args.rounds)), indent=2))
@@ -0,0 +1,64 @@
+"""
+Compares two results of benchmark.suite.
+
+Prints the change of the throughput and p99 latency of every load profile and
+of the ingest throughput, and exits with 1 if any of them got worse by more
+than the threshold, so it can gate a commit.
+
+Example:
+    python -m benchmark.compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def changes(baseline: dict, current: dict) -> list[dict]:
+    '''
+    Relative change of every metric measured in both results. Positive changes are improvements.
+
+    Arguments:
+        baseline (dict): Results of benchmark.suite to compare against.
+        current (dict): Results of benchmark.suite to compare.
+
+    Returns:
+        changes (list[dict]): Name, baseline value, current value and change of every metric.
+    '''
+    metrics = []
+
+    # Metrics where higher is better are compared as current / baseline, the others as baseline / current.
+    for profile, result in current.get("profiles", {}).items():
+        if profile in baseline.get("profiles", {}):
+            before = baseline["profiles"][profile]
+            metrics.append((f"{profile}.requests_per_second", before["requests_per_second"], result["requests_per_second"], True))
+            metrics.append((f"{profile}.latency_ms.p99", before["latency_ms"]["p99"], result["latency_ms"]["p99"], False))
+
+    for mode, phases in current.get("ingest", {}).items():
+        for phase, result in phases.items():
+            before = baseline.get("ingest", {}).get(mode, {}).get(phase)
+            if before:
+                metrics.append((f"ingest.{mode}.{phase}.rows_per_second", before["rows_per_second"], result["rows_per_second"], True))
+
+    return [
+        {"metric": name, "baseline": before, "current": after, "change": round((after / before if higher_is_better else before / after) - 1, 4)}
+        for name, before, after, higher_is_better in metrics if before and after
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares two results of the benchmark suite")
+    parser.add_argument("baseline", help="Results to compare against")
+    parser.add_argument("current", help="Results to compare")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative loss considered a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    results = changes(baseline, current)
+    regressions = [change for change in results if change["change"] < -args.threshold]
+
+    print(json.dumps({"baseline": baseline.get("commit"), "current": current.get("commit"), "changes": results, "regressions": regressions}, indent=2))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,157 @@
+"""
+Synthetic data for the benchmarks.
+
+Generates daily entries of any number of symbols over any range of dates and
+stores them with the ingester, so the database ends up as it would after a
+backfill, partitions and running totals included. Prices follow a random walk
+seeded by symbol, so the same arguments always produce the same entries.
+
+Symbols are named after a prefix, SYN0000, SYN0001... and can be removed with --drop.
+
+With --responses the entries are written as API responses to a response cache
+instead, so the whole ingester, parsing included, can be run offline on them
+with --replay.
+
+Example:
+    python -m benchmark.data --symbols 1000 --start-date 2010-01-01 --end-date 2020-01-01
+    python -m benchmark.data --symbols 1000 --start-date 2010-01-01 --end-date 2020-01-01 --responses responses
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+
+from collections.abc import Iterator
+from datetime import date, timedelta
+
+import psycopg2
+
+from get_raw_data import ResponseCache, last_trading_day, persist_data, persist_data_bulk, setup_db_connection
+
+SYMBOL_PREFIX = "SYN"
+
+
+def symbol_names(count: int, prefix: str = SYMBOL_PREFIX) -> list[str]:
+    """ Names of the synthetic symbols """
+    return [f"{prefix}{number:04d}" for number in range(count)]
+
+
+def trading_days(start: date, end: date) -> Iterator[date]:
+    """ Weekdays from start until end, excluded """
+    day = start
+    while day < end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def generate_entries(symbol: str, start: date, end: date, seed: int = 0) -> Iterator[tuple]:
+    '''
+    Generates the daily entries of a symbol.
+
+    Arguments:
+        symbol (str): Symbol of the entries.
+        start (date): First date.
+        end (date): Entries from this date onwards are not generated.
+        seed (int): Seed of the random walk, combined with the symbol.
+
+    Yields:
+        (symbol, date, open, close, volume) tuples, formatted as the ones of iter_daily_entries.
+    '''
+    rand = random.Random(f"{seed}:{symbol}")
+    price = rand.uniform(10, 500)
+
+    for day in trading_days(start, end):
+        open_price = price * rand.lognormvariate(0, 0.005)
+        price = max(0.01, open_price * rand.lognormvariate(0, 0.02))
+        yield (symbol, day.isoformat(), f"{open_price:.4f}", f"{price:.4f}", str(int(rand.lognormvariate(13, 1))))
+
+
+def load(db: psycopg2.extensions.connection, symbols: list[str], start: date, end: date, seed: int = 0, bulk: bool = True) -> dict:
+    '''
+    Stores the synthetic entries of every symbol.
+
+    Arguments:
+        db (psycopg2.connection): Database connection handler.
+        symbols (list[str]): Symbols to generate.
+        start (date): First date.
+        end (date): Entries from this date onwards are not generated.
+        seed (int): Seed of the random walks.
+        bulk (bool): Whether to store the entries with persist_data_bulk or persist_data.
+
+    Returns:
+        results (dict): Entries written, seconds taken and entries per second.
+    '''
+    persist = persist_data_bulk if bulk else persist_data
+    rows = 0
+
+    start_time = time.perf_counter()
+    for symbol in symbols:
+        rows += persist(db, symbol, generate_entries(symbol, start, end, seed))
+    seconds = time.perf_counter() - start_time
+
+    return {"symbols": len(symbols), "rows": rows, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds, 1) if seconds else None}
+
+
+def write_responses(cache: ResponseCache, symbols: list[str], start: date, end: date, seed: int = 0) -> dict:
+    '''
+    Writes the synthetic entries of every symbol to a response cache, as full
+    responses of the API retrieved today, newest entries first.
+
+    Arguments:
+        cache (ResponseCache): Cache to write to.
+        symbols (list[str]): Symbols to generate.
+        start (date): First date.
+        end (date): Entries from this date onwards are not generated.
+        seed (int): Seed of the random walks.
+
+    Returns:
+        results (dict): Responses and entries written, and their size in bytes.
+    '''
+    rows, size = 0, 0
+
+    for symbol in symbols:
+        series = {day: {"1. open": open_price, "4. close": close_price, "6. volume": volume}
+            for (_, day, open_price, close_price, volume) in reversed(list(generate_entries(symbol, start, end, seed)))}
+        body = json.dumps({"Meta Data": {"2. Symbol": symbol}, "Time Series (Daily)": series}).encode()
+
+        cache.put(symbol, "full", last_trading_day(date.today()), io.BytesIO(body))
+        rows += len(series)
+        size += len(body)
+
+    return {"symbols": len(symbols), "rows": rows, "bytes": size}
+
+
+def drop(db: psycopg2.extensions.connection, prefix: str = SYMBOL_PREFIX):
+    """ Removes the entries and running totals of the synthetic symbols """
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM financial_data WHERE symbol LIKE %s", (f"{prefix}%",))
+    cursor.execute("DELETE FROM financial_data_rollup WHERE symbol LIKE %s", (f"{prefix}%",))
+    db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stores synthetic daily entries for the benchmarks")
+    parser.add_argument("--symbols", type=int, default=100, help="Number of symbols")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2010, 1, 1), help="First date, YYYY-MM-DD")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date(2020, 1, 1), help="Entries from this date onwards are not generated, YYYY-MM-DD")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random walks")
+    parser.add_argument("--prefix", default=SYMBOL_PREFIX, help="Prefix of the symbol names")
+    parser.add_argument("--drop", action="store_true", help="Only remove the synthetic symbols")
+    parser.add_argument("--responses", help="Folder of a response cache to write the entries to as API responses, instead of the database")
+    args = parser.parse_args()
+
+    if args.responses:
+        # No eviction, the responses are all needed by the replay.
+        cache = ResponseCache(args.responses, max_bytes=sys.maxsize)
+        print(json.dumps(write_responses(cache, symbol_names(args.symbols, args.prefix), args.start_date, args.end_date, args.seed), indent=2))
+        sys.exit(0)
+
+    connection = setup_db_connection()
+
+    if args.drop:
+        drop(connection, args.prefix)
+    else:
+        print(json.dumps(load(connection, symbol_names(args.symbols, args.prefix), args.start_date, args.end_date, args.seed), indent=2))
@@ -0,0 +1,80 @@
+"""
+Ingest throughput benchmark.
+
+Stores synthetic entries with persist_data and persist_data_bulk and prints the
+entries written per second as JSON. Every mode is measured three times: writing
+new entries, writing the same entries again, which the ingester skips, and
+writing them with changed prices. The synthetic symbols are removed afterwards.
+
+Example:
+    python -m benchmark.ingest --symbols 20 --start-date 2015-01-01 --end-date 2020-01-01
+"""
+import argparse
+import json
+import time
+
+from datetime import date
+
+import psycopg2
+
+from benchmark.data import drop, generate_entries, symbol_names
+from get_raw_data import persist_data, persist_data_bulk, setup_db_connection
+
+# Symbols of this benchmark, apart from the ones of benchmark.data.
+SYMBOL_PREFIX = "INGEST"
+
+MODES = {"executemany": persist_data, "copy": persist_data_bulk}
+
+
+def measure(db: psycopg2.extensions.connection, persist, symbols: list[str], start: date, end: date, seed: int) -> dict:
+    """ Stores the entries of every symbol and returns the throughput """
+    entries = {symbol: list(generate_entries(symbol, start, end, seed)) for symbol in symbols}
+    rows = sum(len(symbol_entries) for symbol_entries in entries.values())
+
+    start_time = time.perf_counter()
+    written = sum(persist(db, symbol, symbol_entries) for symbol, symbol_entries in entries.items())
+    seconds = time.perf_counter() - start_time
+
+    return {"rows": rows, "written": written, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds, 1)}
+
+
+def run(db: psycopg2.extensions.connection, symbols: int, start: date, end: date, modes: list[str] = list(MODES)) -> dict:
+    '''
+    Runs the benchmark.
+
+    Arguments:
+        db (psycopg2.connection): Database connection handler.
+        symbols (int): Number of symbols stored by every measure.
+        start (date): First date of the entries.
+        end (date): Entries from this date onwards are not generated.
+        modes (list[str]): Names of the ingest functions to measure, from MODES.
+
+    Returns:
+        results (dict): Throughput of new, unchanged and changed entries by mode.
+    '''
+    names = symbol_names(symbols, SYMBOL_PREFIX)
+    results = {}
+
+    try:
+        for mode in modes:
+            drop(db, SYMBOL_PREFIX)
+            results[mode] = {
+                "new": measure(db, MODES[mode], names, start, end, seed=0),
+                "unchanged": measure(db, MODES[mode], names, start, end, seed=0),
+                "changed": measure(db, MODES[mode], names, start, end, seed=1),
+            }
+    finally:
+        drop(db, SYMBOL_PREFIX)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the throughput of the ingester")
+    parser.add_argument("--symbols", type=int, default=20, help="Number of symbols")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2015, 1, 1), help="First date, YYYY-MM-DD")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date(2020, 1, 1), help="Entries from this date onwards are not generated, YYYY-MM-DD")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated ingest functions to measure")
+    args = parser.parse_args()
+
+    print(json.dumps(run(setup_db_connection(), args.symbols, args.start_date, args.end_date, args.modes.split(",")), indent=2))
@@ -0,0 +1,85 @@
+"""
+Concurrent load benchmark for the API.
+
+Sends requests to a running instance of the API from a number of concurrent
+clients during a fixed amount of time and prints the throughput and latency
+percentiles as JSON, so results of different commits can be compared.
+
+Example:
+    python -m benchmark.load_api --url 'http://localhost:5000/api/statistics?symbol=IBM&start_date=2023-01-01&end_date=2023-06-01' --concurrency 50 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+
+from collections.abc import Iterator
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, urls: Iterator[str], deadline: float, latencies: list[float], errors: list[int]):
+    """ Sends requests one after the other until the deadline is reached. """
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(next(urls))
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError:
+            errors.append(0)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str | list[str], concurrency: int, duration: float) -> dict:
+    """
+    Runs the benchmark.
+
+    Arguments:
+        url (str | list[str]): Full URL (including query parameters) to request. Requests go in turns to every URL of a list.
+        concurrency (int): Number of clients sending requests at the same time.
+        duration (float): Seconds the benchmark runs for.
+
+    Returns:
+        results (dict): Throughput and latency percentiles in milliseconds.
+    """
+    latencies = []
+    errors = []
+    urls = itertools.cycle([url] if isinstance(url, str) else url)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(worker(client, urls, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3) if latencies else None
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "duration": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 3),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+            "p50": percentile(0.50),
+            "p90": percentile(0.90),
+            "p99": percentile(0.99),
+        }
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load benchmark for the Financial API")
+    parser.add_argument("--url", required=True, help="URL to request, including query parameters")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Duration of the benchmark in seconds")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args.url, args.concurrency, args.duration)), indent=2))
@@ -0,0 +1,113 @@
+"""
+Cost of validating the parameters of the statistics endpoint.
+
+Serves the same request straight through ASGI, without a server or client in
+between, once with the parameters validated as the API did before (a class
+dependency revalidated by pydantic with a root validator) and once as it does
+now, and prints the time per request of both as JSON.
+
+Example:
+    python -m benchmark.params --requests 2000 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import Depends, FastAPI, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, root_validator
+from typing import Annotated, Literal
+
+from financial.schemas import GetStatisticsParams, query_params
+from financial.schemas.RequestSchemas import cross_validate_dates
+
+QUERY = b"symbol=IBM&start_date=2020-01-01&end_date=2020-06-01"
+
+
+class LegacyStatisticsParams(BaseModel):
+    """ Parameters validated as the API did before: a class dependency revalidated by pydantic with a root validator. """
+
+    symbol: str = Query(title="Identifier of the stock")
+    start_date: str = Query(title="Search entries from this date")
+    end_date: str = Query(title="Search eantries until this date")
+    method: Literal["raw", "rollup"] = Query("raw", title="Compute from raw entries or from precomputed running totals")
+
+    @root_validator()
+    def dates_cross_validation(cls, values):
+        values["start_date"], values["end_date"] = cross_validate_dates(values["start_date"], values["end_date"])
+        return values
+
+
+app = FastAPI()
+
+
+@app.exception_handler(ValueError)
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request, exc):
+    return JSONResponse(status_code=400, content={"errors": len(exc.errors())})
+
+
+@app.get("/legacy")
+async def legacy(params: Annotated[LegacyStatisticsParams, Depends(LegacyStatisticsParams)]):
+    return {"start_date": params.start_date}
+
+
+@app.get("/current")
+async def current(params: Annotated[GetStatisticsParams, Depends(query_params(GetStatisticsParams))]):
+    return {"start_date": params.start_date}
+
+
+async def call(path: str, query: bytes) -> tuple[int, bytes]:
+    """ Serves a request straight through ASGI, without a server or client in between. """
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+        "raw_path": path.encode(), "query_string": query, "root_path": "", "headers": [], "server": ("test", 80), "client": ("test", 1)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"], messages[1]["body"]
+
+
+async def per_request_microseconds(path: str, query: bytes, requests: int, rounds: int) -> float:
+    """ Best time of the rounds of requests, in microseconds per request. """
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(requests):
+            await call(path, query)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) / requests * 1e6
+
+
+def run(requests: int, rounds: int) -> dict:
+    '''
+    Runs the benchmark.
+
+    Arguments:
+        requests (int): Number of requests of every round.
+        rounds (int): Number of rounds of every way of validating, the best one is kept.
+
+    Returns:
+        results (dict): Microseconds per request before and after, and the speedup.
+    '''
+    before = asyncio.run(per_request_microseconds("/legacy", QUERY, requests, rounds))
+    after = asyncio.run(per_request_microseconds("/current", QUERY, requests, rounds))
+
+    return {"before_us": round(before, 1), "after_us": round(after, 1), "speedup": round(before / after, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the cost of validating the statistics parameters")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of requests of every round")
+    parser.add_argument("--rounds", type=int, default=5, help="Number of rounds, the best one is kept")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.requests, args.rounds), indent=2))
@@ -0,0 +1,95 @@
+"""
+Scaling of the API with the number of worker processes.
+
+Starts the API with gunicorn.conf.py and every number of workers given, sends
+the same load to each, and prints the throughput and how close it gets to
+growing linearly with the workers as JSON. Run it on the machine to measure,
+with the database configured for the API. The cache is disabled so requests
+reach the database.
+
+Example:
+    python -m benchmark.scaling --workers 1,2,4 --url '/api/statistics?symbol=IBM&start_date=2023-01-01&end_date=2023-06-01'
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmark import load_api
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    """ Starts the API with gunicorn and waits until it answers """
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "CACHE_ENABLED": "false"}
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "financial.main:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/metrics/pool").status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError(f"The API did not start with {workers} workers")
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    server.wait(timeout=30)
+
+
+def run(workers: list[int], path: str, concurrency: int, duration: float, port: int) -> dict:
+    '''
+    Runs the benchmark.
+
+    Arguments:
+        workers (list[int]): Numbers of worker processes to measure.
+        path (str): Path and query parameters to request.
+        concurrency (int): Number of concurrent clients.
+        duration (float): Seconds every number of workers is measured for.
+        port (int): Port the API listens on.
+
+    Returns:
+        results (dict): Throughput, latency and scaling efficiency by number of workers.
+    '''
+    results = {"cpus": os.cpu_count(), "path": path, "concurrency": concurrency, "workers": {}}
+    baseline = None
+
+    for count in workers:
+        server = start_server(count, port)
+        try:
+            result = asyncio.run(load_api.run(f"http://127.0.0.1:{port}{path}", concurrency, duration))
+        finally:
+            stop_server(server)
+
+        baseline = baseline or result["requests_per_second"] / count
+        results["workers"][count] = {
+            "requests_per_second": result["requests_per_second"],
+            "errors": result["errors"],
+            "latency_ms": result["latency_ms"],
+            # 1.0 when the throughput grows as much as the workers.
+            "efficiency": round(result["requests_per_second"] / (count * baseline), 2) if baseline else None
+        }
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the throughput of the API with different numbers of workers")
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated numbers of workers")
+    parser.add_argument("--url", default="/api/statistics?symbol=IBM&start_date=2023-01-01&end_date=2023-06-01", help="Path and query parameters to request")
+    parser.add_argument("--concurrency", type=int, default=50, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds every number of workers is measured for")
+    parser.add_argument("--port", type=int, default=5050, help="Port the API listens on")
+    args = parser.parse_args()
+
+    print(json.dumps(run([int(count) for count in args.workers.split(",")], args.url, args.concurrency, args.duration, args.port), indent=2))
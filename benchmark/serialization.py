@@ -0,0 +1,95 @@
+"""
+Cost of serializing a page of financial data.
+
+Builds the same page from an in-memory SQLite database, once loaded as ORM
+instances and encoded by FastAPI, as the API did before, and once loaded as
+plain rows and serialized with orjson, and prints the time per row of both
+as JSON.
+
+Example:
+    python -m benchmark.serialization --limit 1000 --rounds 20
+"""
+import argparse
+import json
+import time
+
+from datetime import date, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Engine, create_engine, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from financial.database import Base
+from financial.models import FinancialData
+from financial.responses import render_json
+from financial.schemas import FinancialDataResponse
+
+
+def create_page_engine(limit: int) -> Engine:
+    """ In-memory SQLite database with `limit` entries of one symbol. """
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+
+    with Session(engine) as db:
+        db.add_all(FinancialData(symbol="IBM", date=date(2000, 1, 1) + timedelta(days=day), open_price=100 + day / 7, close_price=100 + day / 3,
+            volume=1000 + day) for day in range(limit))
+        db.commit()
+
+    return engine
+
+
+def orm_page(db: Session, limit: int) -> bytes:
+    """ Page loaded as ORM instances and encoded by FastAPI, as the API did before. """
+    data = db.scalars(select(FinancialData).order_by(FinancialData.date).limit(limit)).all()
+    response = FinancialDataResponse(data=data, pagination={"limit": limit}, info={"error": ""})
+
+    return JSONResponse(jsonable_encoder(response)).body
+
+
+def row_page(db: Session, limit: int) -> bytes:
+    """ Page loaded as plain rows and serialized with orjson. """
+    data = db.execute(select(FinancialData.symbol, FinancialData.date, FinancialData.open_price, FinancialData.close_price, FinancialData.volume)
+        .order_by(FinancialData.date).limit(limit)).all()
+
+    return render_json({"data": data, "pagination": {"limit": limit}, "info": {"error": ""}})
+
+
+def per_row_microseconds(engine: Engine, build, limit: int, rounds: int) -> float:
+    """ Best time of the rounds of pages, in microseconds per row. """
+    timings = []
+    with Session(engine) as db:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            build(db, limit)
+            timings.append(time.perf_counter() - start)
+            db.expunge_all()
+
+    return min(timings) / limit * 1e6
+
+
+def run(limit: int, rounds: int) -> dict:
+    '''
+    Runs the benchmark.
+
+    Arguments:
+        limit (int): Number of rows of the page.
+        rounds (int): Number of pages built every way, the best one is kept.
+
+    Returns:
+        results (dict): Microseconds per row before and after, and the speedup.
+    '''
+    engine = create_page_engine(limit)
+    before = per_row_microseconds(engine, orm_page, limit, rounds)
+    after = per_row_microseconds(engine, row_page, limit, rounds)
+
+    return {"limit": limit, "before_us_per_row": round(before, 2), "after_us_per_row": round(after, 2), "speedup": round(before / after, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the cost of serializing a page of financial data")
+    parser.add_argument("--limit", type=int, default=1000, help="Number of rows of the page, the largest clients usually ask for")
+    parser.add_argument("--rounds", type=int, default=20, help="Number of pages built every way, the best one is kept")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.limit, args.rounds), indent=2))
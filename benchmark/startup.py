@@ -0,0 +1,79 @@
+"""
+Import time of the API and the ingester.
+
+Imports every module given in a new interpreter with `python -X importtime`,
+several times, and prints as JSON the median time of the import and the
+modules that took the longest on their own. Cold starts of the API pay this
+before serving the first request. Run it with the environment of the API.
+
+Example:
+    python -m benchmark.startup financial.main get_raw_data --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules listed by the time they took on their own.
+HEAVIEST_MODULES = 10
+
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    '''
+    Imports a module in a new interpreter.
+
+    Arguments:
+        module (str): Module to import.
+
+    Returns:
+        times (dict[str, tuple[int, int]]): Own and cumulative import time in microseconds of every module imported, by name.
+    '''
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not import {module}: {result.stderr.strip().splitlines()[-1]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+
+    return times
+
+
+def measure(module: str, runs: int) -> dict:
+    '''
+    Measures the import time of a module.
+
+    Arguments:
+        module (str): Module to import.
+        runs (int): Number of imports, each in a new interpreter.
+
+    Returns:
+        result (dict): Median, min and max import time in milliseconds, and the heaviest modules of the median run.
+    '''
+    samples = sorted((import_times(module) for _ in range(runs)), key=lambda times: times[module][1])
+    totals = [times[module][1] / 1000 for times in samples]
+    median = samples[len(samples) // 2]
+
+    return {
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(totals[0], 1),
+        "max_ms": round(totals[-1], 1),
+        "modules": len(median),
+        "heaviest_ms": {name: round(own / 1000, 1) for name, (own, _) in sorted(median.items(), key=lambda item: -item[1][0])[:HEAVIEST_MODULES]}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the import time of the API and the ingester")
+    parser.add_argument("modules", nargs="*", default=["financial.main", "get_raw_data"], help="Modules to import")
+    parser.add_argument("--runs", type=int, default=10, help="Number of imports of every module")
+    args = parser.parse_args()
+
+    print(json.dumps({module: measure(module, args.runs) for module in args.modules}, indent=2))
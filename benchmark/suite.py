@@ -0,0 +1,151 @@
+"""
+Benchmark suite of the API and the ingester.
+
+Runs a set of load profiles against a running instance of the API, and
+optionally the ingest benchmark, and writes the results with the commit they
+were measured on to a JSON file. Results of two commits can be compared with
+benchmark.compare.
+
+The profiles request the synthetic symbols stored by benchmark.data, so load
+them first with the same --symbols, --start-date and --end-date. Start the API
+with CACHE_ENABLED=false or most requests only measure the cache.
+
+Example:
+    python -m benchmark.data --symbols 1000 --start-date 2010-01-01 --end-date 2020-01-01
+    python -m benchmark.suite --symbols 1000 --start-date 2010-01-01 --end-date 2020-01-01 --ingest --output results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import subprocess
+
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from benchmark import load_api
+from benchmark.data import symbol_names, trading_days
+
+# The ingester logs at debug level, which would log every request of the profiles.
+for logger in ("httpx", "httpcore"):
+    logging.getLogger(logger).setLevel(logging.WARNING)
+
+# Entries by page of the financial data profiles.
+PAGE_LIMIT = 100
+
+
+def financial_data_shallow(start: date, end: date) -> tuple[str, dict]:
+    """ First page of the whole range """
+    return "/api/financial_data", {"start_date": start, "end_date": end, "limit": PAGE_LIMIT, "page": 1}
+
+
+def financial_data_deep(start: date, end: date) -> tuple[str, dict]:
+    """ Last page of the whole range, which the database reaches by skipping all the others """
+    pages = max(1, math.ceil(sum(1 for _ in trading_days(start, end)) / PAGE_LIMIT))
+    return "/api/financial_data", {"start_date": start, "end_date": end, "limit": PAGE_LIMIT, "page": pages, "include_count": "false"}
+
+
+def statistics_short(start: date, end: date) -> tuple[str, dict]:
+    """ Statistics of the last month """
+    return "/api/statistics", {"start_date": end - timedelta(days=30), "end_date": end}
+
+
+def statistics_multi_year(start: date, end: date) -> tuple[str, dict]:
+    """ Statistics of the whole range """
+    return "/api/statistics", {"start_date": start, "end_date": end}
+
+
+def statistics_multi_year_rollup(start: date, end: date) -> tuple[str, dict]:
+    """ Statistics of the whole range from the running totals """
+    return "/api/statistics", {"start_date": start, "end_date": end, "method": "rollup"}
+
+
+PROFILES = {
+    "financial_data_shallow": financial_data_shallow,
+    "financial_data_deep": financial_data_deep,
+    "statistics_short": statistics_short,
+    "statistics_multi_year": statistics_multi_year,
+    "statistics_multi_year_rollup": statistics_multi_year_rollup,
+}
+
+
+def profile_urls(profile: str, base_url: str, symbols: list[str], start: date, end: date) -> list[str]:
+    """ URLs of a profile, one by symbol """
+    path, params = PROFILES[profile](start, end)
+    return [f"{base_url}{path}?{urlencode({'symbol': symbol, **params})}" for symbol in symbols]
+
+
+def current_commit() -> str | None:
+    """ Commit of the working copy, if it is a git repository """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(base_url: str, symbols: int, start: date, end: date, profiles: list[str], concurrency: int, duration: float, ingest_symbols: int = 0) -> dict:
+    '''
+    Runs the suite.
+
+    Arguments:
+        base_url (str): URL of the API.
+        symbols (int): Number of synthetic symbols requested, in turns.
+        start (date): First date of the synthetic entries.
+        end (date): End of the synthetic entries.
+        profiles (list[str]): Names of the load profiles to run, from PROFILES.
+        concurrency (int): Number of concurrent clients of every profile.
+        duration (float): Seconds every profile runs for.
+        ingest_symbols (int): Number of symbols of the ingest benchmark. It is skipped if 0.
+
+    Returns:
+        results (dict): Commit, parameters and results of every profile.
+    '''
+    names = symbol_names(symbols)
+
+    results = {
+        "commit": current_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "parameters": {"symbols": symbols, "start_date": start.isoformat(), "end_date": end.isoformat(), "concurrency": concurrency, "duration": duration},
+        "profiles": {},
+    }
+
+    for profile in profiles:
+        result = asyncio.run(load_api.run(profile_urls(profile, base_url, names, start, end), concurrency, duration))
+        result.pop("url")
+        results["profiles"][profile] = result
+
+    if ingest_symbols:
+        from benchmark import ingest
+        from get_raw_data import setup_db_connection
+
+        results["ingest"] = ingest.run(setup_db_connection(), ingest_symbols, end - timedelta(days=5 * 365), end)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the load profiles of the API and the ingest benchmark")
+    parser.add_argument("--base-url", default="http://localhost:5000", help="URL of the API")
+    parser.add_argument("--symbols", type=int, default=100, help="Number of synthetic symbols loaded with benchmark.data")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2010, 1, 1), help="First date of the synthetic entries, YYYY-MM-DD")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date(2020, 1, 1), help="End of the synthetic entries, YYYY-MM-DD")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma separated load profiles to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds every profile runs for")
+    parser.add_argument("--ingest", action="store_true", help="Also measure the ingester, which needs access to the database")
+    parser.add_argument("--ingest-symbols", type=int, default=20, help="Number of symbols of the ingest benchmark")
+    parser.add_argument("--output", help="File to write the results to. They are printed otherwise.")
+    args = parser.parse_args()
+
+    results = run(args.base_url, args.symbols, args.start_date, args.end_date, args.profiles.split(","),
+        args.concurrency, args.duration, args.ingest_symbols if args.ingest else 0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Simple moving average.
+
+    Arguments:
+        values (np.ndarray): Series to average.
+        window (int): Number of values averaged.
+
+    Returns:
+        result (np.ndarray): Average of the last `window` values at each position. NaN until the window is full.
+    """
+    result = np.full(len(values), np.nan)
+
+    if len(values) >= window:
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        result[window - 1:] = (sums[window:] - sums[:-window]) / window
+
+    return result
+
+
+def ema(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Exponential moving average with smoothing factor 2 / (window + 1), seeded
+    with the simple moving average of the first `window` values.
+
+    The recurrence y[t] = a * x[t] + (1 - a) * y[t - 1] is solved in closed form
+    over blocks of values. Blocks are as long as the powers of (1 - a) they need
+    stay within the range of a float.
+
+    Arguments:
+        values (np.ndarray): Series to average.
+        window (int): Span of the average.
+
+    Returns:
+        result (np.ndarray): Average at each position. NaN until the first window is full.
+    """
+    if window == 1:
+        return values.astype(float)
+
+    result = np.full(len(values), np.nan)
+
+    if len(values) < window:
+        return result
+
+    alpha = 2 / (window + 1)
+    decay = 1 - alpha
+    result[window - 1] = values[:window].mean()
+
+    block = max(1, int(100 * math.log(10) / -math.log(decay)))
+
+    for start in range(window, len(values), block):
+        x = values[start:start + block]
+        powers = decay ** np.arange(1, len(x) + 1)
+
+        # y[start + i] = decay^(i + 1) * y[start - 1] + alpha * sum(decay^(i - j) * x[j] for j <= i)
+        result[start:start + len(x)] = powers * (result[start - 1] + alpha * np.cumsum(x / powers))
+
+    return result
+
+
+def vwap(prices: np.ndarray, volumes: np.ndarray, window: int) -> np.ndarray:
+    """
+    Volume weighted average price over a moving window.
+
+    Arguments:
+        prices (np.ndarray): Price of every day.
+        volumes (np.ndarray): Volume of every day.
+        window (int): Number of days averaged.
+
+    Returns:
+        result (np.ndarray): Average at each position. NaN until the window is full or if there is no volume.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = sma(prices * volumes, window) / sma(volumes.astype(float), window)
+
+    return np.where(np.isfinite(result), result, np.nan)
+
+
+def returns(prices: np.ndarray) -> np.ndarray:
+    """
+    Relative change of the price from the previous day.
+
+    Arguments:
+        prices (np.ndarray): Price of every day.
+
+    Returns:
+        result (np.ndarray): Return of every day. NaN for the first one and after a price of zero.
+    """
+    result = np.full(len(prices), np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result[1:] = prices[1:] / prices[:-1] - 1
+
+    return np.where(np.isfinite(result), result, np.nan)
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sample standard deviation over a moving window.
+
+    Arguments:
+        values (np.ndarray): Series to measure.
+        window (int): Number of values in the window. At least 2.
+
+    Returns:
+        result (np.ndarray): Deviation at each position. NaN until the window is full or if it has NaN values.
+    """
+    result = np.full(len(values), np.nan)
+
+    if len(values) >= window:
+        result[window - 1:] = sliding_window_view(values, window).std(axis=-1, ddof=1)
+
+    return result
@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import logging
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from fastapi import Request, Response
+from typing import Any, Awaitable, Callable
+
+from financial.responses import render_json
+
+# Channel the ingester notifies with the symbol of every batch of entries written.
+INVALIDATION_CHANNEL = "financial_data_changed"
+
+# Tag of the entries that are not filtered by symbol. They are invalidated by any symbol.
+ALL_SYMBOLS = "*"
+
+
+@dataclass
+class CacheEntry:
+    """ Serialized response stored in the cache """
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_content(cls, content: Any) -> "CacheEntry":
+        body = render_json(content)
+        return cls(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+class SharedStore:
+    '''
+    Cache store shared between API workers.
+
+    Only a small subset of Redis commands is used (get, set, sadd, expire,
+    smembers and delete), so a `redis.asyncio` client or any local stand-in
+    implementing them can be used.
+
+    Arguments:
+        client: Redis like async client.
+        ttl (int): Seconds entries are kept.
+        prefix (str): Prefix of all the keys written.
+    '''
+
+    def __init__(self, client, ttl: int, prefix: str = "financial:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> tuple[CacheEntry, str] | None:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            return None
+
+        etag, symbol, body = value.split(b"\n", 2)
+        return CacheEntry(body=body, etag=etag.decode()), symbol.decode()
+
+    async def set(self, key: str, entry: CacheEntry, symbol: str):
+        tag = f"{self.prefix}symbol:{symbol}"
+        await self.client.set(self.prefix + key, b"\n".join((entry.etag.encode(), symbol.encode(), entry.body)), ex=self.ttl)
+        await self.client.sadd(tag, self.prefix + key)
+        await self.client.expire(tag, self.ttl)
+
+    async def invalidate(self, symbol: str):
+        tags = [f"{self.prefix}symbol:{tag}" for tag in (symbol, ALL_SYMBOLS)]
+        keys = [key for tag in tags for key in await self.client.smembers(tag)]
+        await self.client.delete(*tags, *keys)
+
+
+class ResponseCache:
+    '''
+    In process LRU cache of serialized responses with a time to live,
+    optionally backed by a SharedStore.
+
+    Every entry is tagged with the symbol it was computed for, so entries
+    can be invalidated when new data of that symbol is stored. Every
+    invalidation also increases the generation of the symbol, so responses
+    built while it happened, from data that may be older, are not stored.
+
+    While invalidations can not be received, listening is False and the cache
+    is bypassed: it neither serves nor stores entries.
+
+    Arguments:
+        maxsize (int): Maximum number of entries kept in process.
+        ttl (int): Seconds entries are kept.
+        shared (SharedStore): Store shared with other workers.
+    '''
+
+    def __init__(self, maxsize: int, ttl: int, shared: SharedStore | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.entries: OrderedDict[str, tuple[float, str, CacheEntry]] = OrderedDict()
+        self.generations: dict[str, int] = {}
+        self.clears = 0
+        self.listening = True
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, key: str) -> CacheEntry | None:
+        if not self.listening:
+            self.misses += 1
+            return None
+
+        item = self.entries.get(key)
+
+        if item is not None:
+            expires_at, symbol, entry = item
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            del self.entries[key]
+
+        if self.shared is not None:
+            shared_entry = await self.shared.get(key)
+            if shared_entry is not None:
+                entry, symbol = shared_entry
+                self.shared_hits += 1
+                self._store(key, entry, symbol)
+                return entry
+
+        self.misses += 1
+        return None
+
+    def generation(self, symbol: str | None) -> int:
+        ''' Number of invalidations of the entries of a symbol, None for the ones of all symbols '''
+        return self.generations.get(symbol or ALL_SYMBOLS, 0) + self.clears
+
+    async def set(self, key: str, entry: CacheEntry, symbol: str | None, generation: int | None = None):
+        '''
+        Stores an entry.
+
+        Arguments:
+            key (str): Cache key of the request.
+            entry (CacheEntry): Response to store.
+            symbol (str | None): Symbol the response depends on. None if it depends on all of them.
+            generation (int | None): Generation of the symbol read before building the response.
+                The entry is not stored if the symbol was invalidated since.
+        '''
+        if not self.listening or (generation is not None and generation != self.generation(symbol)):
+            return
+
+        symbol = symbol or ALL_SYMBOLS
+        self._store(key, entry, symbol)
+
+        if self.shared is not None:
+            await self.shared.set(key, entry, symbol)
+
+    async def invalidate(self, symbol: str):
+        self.invalidations += 1
+        # Entries of all symbols depend on every symbol.
+        for tag in (symbol, ALL_SYMBOLS):
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+
+        for key in [key for key, (_, tag, _) in self.entries.items() if tag in (symbol, ALL_SYMBOLS)]:
+            del self.entries[key]
+
+        if self.shared is not None:
+            await self.shared.invalidate(symbol)
+
+    def clear(self):
+        self.entries.clear()
+        self.clears += 1
+
+    def status(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "shared": self.shared is not None,
+            "listening": self.listening,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+    def _store(self, key: str, entry: CacheEntry, symbol: str):
+        self.entries[key] = (time.monotonic() + self.ttl, symbol, entry)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+def create_response_cache(settings) -> ResponseCache | None:
+    '''
+    Creates the response cache described by the settings.
+
+    Arguments:
+        settings (Settings): API settings.
+
+    Returns:
+        cache (ResponseCache): The cache, or None if caching is disabled.
+    '''
+    if not settings.CACHE_ENABLED:
+        return None
+
+    shared = None
+    if settings.CACHE_URL:
+        # Optional dependency, only needed when sharing the cache between workers.
+        import redis.asyncio
+        shared = SharedStore(redis.asyncio.from_url(settings.CACHE_URL), settings.CACHE_TTL)
+
+    return ResponseCache(settings.CACHE_SIZE, settings.CACHE_TTL, shared)
+
+
+def cache_key(endpoint: str, params) -> str:
+    '''
+    Builds the cache key of a request from its endpoint and validated parameters.
+
+    Arguments:
+        endpoint (str): Name of the endpoint.
+        params (BaseModel): Validated request parameters.
+
+    Returns:
+        key (str): Cache key.
+    '''
+    values = "&".join(f"{name}={value}" for name, value in sorted(params.dict().items()))
+    return f"{endpoint}?{values}"
+
+
+async def cached_response(request: Request, cache: ResponseCache | None, key: str, symbol: str | None, build: Callable[[], Awaitable[Any]], max_age: int = 0) -> Response:
+    '''
+    Returns the cached response for the key, building and caching it on a miss.
+
+    Responses carry an ETag so clients sending it back in If-None-Match get
+    an empty 304 response.
+
+    Arguments:
+        request (Request): Incoming request.
+        cache (ResponseCache): Cache to use. None disables caching.
+        key (str): Cache key of the request.
+        symbol (str): Symbol the response depends on. None if it depends on all of them.
+        build (Callable): Coroutine function returning the response content.
+        max_age (int): Seconds clients and proxies may reuse the response without asking again.
+
+    Returns:
+        Response object.
+    '''
+    entry = await cache.get(key) if cache is not None else None
+
+    if entry is None:
+        # Read before building, so a response built while the symbol is invalidated is not stored.
+        generation = cache.generation(symbol) if cache is not None else None
+        entry = CacheEntry.from_content(await build())
+        if cache is not None:
+            await cache.set(key, entry, symbol, generation)
+
+    headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={max_age}"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and entry.etag in [etag.strip() for etag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+async def listen_for_invalidations(dsn: str, cache: ResponseCache | None, retry_seconds: float = 5, repeat_after: float | None = None,
+        refresh: Callable[[str | None], Awaitable[None]] | None = None):
+    '''
+    Listens to the notifications sent by the ingester and invalidates the
+    cached entries of every symbol notified. Reconnects if the connection is lost.
+    The cache is bypassed until the first connection and while disconnected, as
+    the notifications sent meanwhile are lost.
+
+    Arguments:
+        dsn (str): Postgres connection string.
+        cache (ResponseCache | None): Cache to invalidate. None if only refresh is used.
+        retry_seconds (float): Seconds to wait before reconnecting.
+        repeat_after (float | None): Seconds after which every invalidation is repeated.
+            Reads served by a lagging replica right after a notification can cache
+            data older than the notified one.
+        refresh (Callable | None): Coroutine function run with every symbol notified before
+            its entries are invalidated, and with None after connecting, to reload copies
+            of the data the cached responses are built from.
+    '''
+    # Imported here like the database driver, which the app only loads on first use.
+    import asyncpg
+
+    async def invalidate(symbol: str):
+        if refresh is not None:
+            await refresh(symbol)
+        if cache is not None:
+            await cache.invalidate(symbol)
+            if repeat_after:
+                await asyncio.sleep(repeat_after)
+                await cache.invalidate(symbol)
+
+    # The event loop only keeps weak references to tasks, so the running ones are kept here.
+    tasks = set()
+
+    def on_done(task: asyncio.Task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"Cache invalidation failed: {task.exception()}")
+
+    def on_notification(connection, pid, channel, symbol):
+        task = asyncio.create_task(invalidate(symbol))
+        tasks.add(task)
+        task.add_done_callback(on_done)
+
+    while True:
+        if cache is not None:
+            cache.listening = False
+
+        try:
+            connection = await asyncpg.connect(dsn)
+            try:
+                await connection.add_listener(INVALIDATION_CHANNEL, on_notification)
+
+                # Everything written while not listening may be cached already.
+                if refresh is not None:
+                    await refresh(None)
+                if cache is not None:
+                    cache.clear()
+                    cache.listening = True
+
+                while not connection.is_closed():
+                    await asyncio.sleep(retry_seconds)
+            finally:
+                await connection.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Cache invalidation listener disconnected: {e}")
+
+        await asyncio.sleep(retry_seconds)
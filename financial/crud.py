@@ -1,44 +1,52 @@
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from collections import namedtuple
+from sqlalchemy import Date, Integer, select, func, tuple_, true, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date
 
 from financial import models, schemas
+from financial.metrics import record_rows
 
 
-def base_query(db: Session, symbol: str, start_date:date, end_date: date):
+Statistics = namedtuple("Statistics", "count average_open_price average_close_price average_volume")
+
+# Result of the statistics queries when no entries match.
+EMPTY_STATISTICS = Statistics(0, None, None, None)
+
+
+def base_query(symbol: str, start_date:date, end_date: date, *entities):
     """
     Base query used used by other functions to retrieve financial data
     based on optional paramters.
 
     Arguments:
-        db (Session): SQLAlchemy database session.
         symbol (str): Stock identifier.
         start_date (date): Start date to search from.
         end_date (date): End date to search to.
+        entities: Columns or expressions to select. Defaults to the FinancialData entity.
 
     Returns:
-        SQLAlchemy Query.
+        SQLAlchemy Select statement.
     """
-    query = db.query(models.FinancialData)
+    query = select(*(entities or (models.FinancialData,))).select_from(models.FinancialData)
 
     if symbol is not None:
-        query =  query.filter(models.FinancialData.symbol == symbol)
+        query =  query.where(models.FinancialData.symbol == symbol)
 
     if start_date is not None:
-        query = query.filter(models.FinancialData.date >= start_date)
+        query = query.where(models.FinancialData.date >= start_date)
 
     if end_date is not None:
-        query = query.filter(models.FinancialData.date <= end_date)
+        query = query.where(models.FinancialData.date <= end_date)
 
     return query
 
 
-def count_financial_data(db: Session, symbol: str, start_date: date, end_date: date )-> int :
+async def count_financial_data(db: AsyncSession, symbol: str, start_date: date, end_date: date )-> int :
     """
     Query to count the number of entries that matches the specified criteria.
 
     Arguments:
-        db (Session): SQLAlchemy database session.
+        db (AsyncSession): SQLAlchemy database session.
         symbol (str): Stock identifier.
         start_date (date): Start date to search from.
         end_date (date): End date to search to.
@@ -46,20 +54,238 @@ def count_financial_data(db: Session, symbol: str, start_date: date, end_date: d
     Returns:
         count (int): The number of records in DB that matches the criteria
     """
-    return base_query(db, symbol, start_date, end_date ).count()
+    count = await db.scalar(base_query(symbol, start_date, end_date, func.count()))
+    record_rows(1)
 
+    return count
 
-def get_financial_data_by_symbol(db: Session, symbol: str, start_date: date, end_date: date, offset:int = 0, limit: int = 10):
+
+async def get_financial_data_by_symbol(db: AsyncSession, symbol: str, start_date: date, end_date: date, offset:int = 0, limit: int = 10, after: tuple[date, str] | None = None):
     """
-    Query to count the number of entries that matches the specified criteria.
+    Query to retrieve a page of entries that matches the specified criteria.
+    Entries are sorted by (date, symbol), the same columns used by the table's primary key.
+
+    Pages can be requested either by offset or by keyset. When `after` is set only
+    entries that come after that (date, symbol) pair are returned, so the database
+    can seek directly to the page instead of skipping `offset` rows.
 
     Arguments:
-        db (Session): SQLAlchemy database session.
+        db (AsyncSession): SQLAlchemy database session.
         symbol (str): Stock identifier.
         start_date (date): Start date to search from.
         end_date (date): End date to search to.
+        offset (int): Number of entries to skip.
+        limit (int): Maximum number of entries to return.
+        after (tuple[date, str]): Date and symbol of the last entry of the previous page.
 
     Returns:
-        count (int): The number of records in DB that matches the criteria
+        data (list[Row]): Rows with symbol, date, open_price, close_price and volume.
+    """
+    # Plain rows are enough to build the response, so no ORM instances are created.
+    query = base_query(symbol, start_date, end_date,
+        models.FinancialData.symbol,
+        models.FinancialData.date,
+        models.FinancialData.open_price,
+        models.FinancialData.close_price,
+        models.FinancialData.volume
+    )
+
+    if after is not None:
+        after_date, after_symbol = after
+
+        # With a fixed symbol the comparison narrows down to the date, which the
+        # (symbol, date) primary key index can seek on directly.
+        if symbol is not None and symbol == after_symbol:
+            query = query.where(models.FinancialData.date > after_date)
+        else:
+            # The date condition alone is redundant, but unlike the row comparison it lets
+            # Postgres skip the partitions of earlier years.
+            query = query.where(models.FinancialData.date >= after_date,
+                tuple_(models.FinancialData.date, models.FinancialData.symbol) > tuple_(after_date, after_symbol))
+
+    query = query.order_by(models.FinancialData.date, models.FinancialData.symbol).offset(offset).limit(limit)
+
+    rows = (await db.execute(query)).all()
+    record_rows(len(rows))
+
+    return rows
+
+
+async def get_financial_statistics(db: AsyncSession, symbol: str, start_date: date, end_date: date):
+    """
+    Query that aggregates the financial data that matches the specified criteria.
+    The whole date range is computed by the database in a single statement, so no
+    rows are loaded into memory.
+
+    Arguments:
+        db (AsyncSession): SQLAlchemy database session.
+        symbol (str): Stock identifier.
+        start_date (date): Start date to search from.
+        end_date (date): End date to search to.
+
+    Returns:
+        row (Row): Single row with count, average_open_price, average_close_price and average_volume.
+    """
+    query = base_query(symbol, start_date, end_date,
+        func.count().label("count"),
+        func.avg(models.FinancialData.open_price).label("average_open_price"),
+        func.avg(models.FinancialData.close_price).label("average_close_price"),
+        func.avg(models.FinancialData.volume).label("average_volume")
+    )
+
+    row = (await db.execute(query)).one()
+    record_rows(1)
+
+    return row
+
+
+async def get_financial_statistics_rollup(db: AsyncSession, symbol: str, start_date: date, end_date: date):
+    """
+    Same as get_financial_statistics but computed from the running totals in
+    financial_data_rollup. The sums of the range are the difference between
+    the last totals up to end_date and the last totals before start_date, so
+    the cost is two index lookups whatever the length of the range.
+
+    Arguments:
+        db (AsyncSession): SQLAlchemy database session.
+        symbol (str): Stock identifier.
+        start_date (date): Start date to search from.
+        end_date (date): End date to search to.
+
+    Returns:
+        row (Row): Single row with count, average_open_price, average_close_price and average_volume.
+    """
+    rollup = models.FinancialDataRollup
+
+    def last_totals(*conditions):
+        return select(rollup.cum_open_price, rollup.cum_close_price, rollup.cum_volume, rollup.cum_count) \
+            .where(rollup.symbol == symbol, *conditions).order_by(rollup.date.desc()).limit(1).subquery()
+
+    upper = last_totals(*([rollup.date <= end_date] if end_date is not None else []))
+    lower = last_totals(rollup.date < start_date) if start_date is not None else None
+
+    def difference(column):
+        if lower is None:
+            return upper.c[column]
+        return upper.c[column] - func.coalesce(lower.c[column], 0)
+
+    count = difference("cum_count")
+    query = select(
+        func.coalesce(count, 0).label("count"),
+        (difference("cum_open_price") / func.nullif(count, 0)).label("average_open_price"),
+        (difference("cum_close_price") / func.nullif(count, 0)).label("average_close_price"),
+        (difference("cum_volume") / func.nullif(count, 0)).label("average_volume")
+    )
+    query = query.select_from(upper.outerjoin(lower, true()) if lower is not None else upper)
+
+    # No totals up to end_date means there are no entries at all in the range.
+    row = (await db.execute(query)).one_or_none()
+    record_rows(0 if row is None else 1)
+
+    return row or EMPTY_STATISTICS
+
+
+async def get_batch_financial_statistics(db: AsyncSession, symbols: list[str], windows: list[tuple[date, date]]):
+    """
+    Query that aggregates the financial data of many symbols over many date
+    ranges in a single statement. The date ranges are joined as a derived table
+    and the entries are grouped by symbol and range.
+
+    Arguments:
+        db (AsyncSession): SQLAlchemy database session.
+        symbols (list[str]): Stock identifiers.
+        windows (list[tuple[date, date]]): (start_date, end_date) date ranges.
+
+    Returns:
+        rows (list[Row]): One row by symbol and date range with entries, with symbol, window
+            (index in windows), count, average_open_price, average_close_price and average_volume.
+    """
+    ranges = union_all(*(
+        select(literal(index, Integer).label("window"), literal(start_date, Date).label("start_date"), literal(end_date, Date).label("end_date"))
+        for index, (start_date, end_date) in enumerate(windows)
+    )).subquery("windows")
+
+    query = select(
+        models.FinancialData.symbol,
+        ranges.c.window,
+        func.count().label("count"),
+        func.avg(models.FinancialData.open_price).label("average_open_price"),
+        func.avg(models.FinancialData.close_price).label("average_close_price"),
+        func.avg(models.FinancialData.volume).label("average_volume")
+    ).select_from(models.FinancialData).join(ranges, models.FinancialData.date.between(ranges.c.start_date, ranges.c.end_date)) \
+        .where(models.FinancialData.symbol.in_(symbols)) \
+        .group_by(models.FinancialData.symbol, ranges.c.window)
+
+    rows = (await db.execute(query)).all()
+    record_rows(len(rows))
+
+    return rows
+
+
+async def get_financial_series(db: AsyncSession, symbol: str, start_date: date, end_date: date, lookback: int = 0):
+    """
+    Query to retrieve the daily series of a symbol, including the `lookback`
+    entries before start_date needed to compute moving windows from the first
+    day of the range.
+
+    Arguments:
+        db (AsyncSession): SQLAlchemy database session.
+        symbol (str): Stock identifier.
+        start_date (date): Start date to search from.
+        end_date (date): End date to search to.
+        lookback (int): Number of entries before start_date to include.
+
+    Returns:
+        rows (list[Row]): Rows with date, open_price, close_price and volume, sorted by date.
+    """
+    first_date = start_date
+
+    if lookback > 0:
+        # Date of the lookback-th entry before start_date, or the first entry if there are fewer.
+        lookback_date = select(models.FinancialData.date) \
+            .where(models.FinancialData.symbol == symbol, models.FinancialData.date < start_date) \
+            .order_by(models.FinancialData.date.desc()).offset(lookback - 1).limit(1).scalar_subquery()
+        earliest_date = select(func.min(models.FinancialData.date)).where(models.FinancialData.symbol == symbol).scalar_subquery()
+        first_date = func.coalesce(lookback_date, earliest_date)
+
+    query = base_query(symbol, None, end_date,
+        models.FinancialData.date,
+        models.FinancialData.open_price,
+        models.FinancialData.close_price,
+        models.FinancialData.volume
+    ).where(models.FinancialData.date >= first_date).order_by(models.FinancialData.date)
+
+    rows = (await db.execute(query)).all()
+    record_rows(len(rows))
+
+    return rows
+
+
+async def stream_financial_data(db: AsyncSession, symbol: str, start_date: date, end_date: date, batch_size: int = 10000):
+    """
+    Query to read all the entries that matches the specified criteria through a
+    server side cursor. Rows are returned as plain tuples, in partitions of
+    batch_size, so memory does not depend on the number of entries.
+
+    Arguments:
+        db (AsyncSession): SQLAlchemy database session.
+        symbol (str): Stock identifier.
+        start_date (date): Start date to search from.
+        end_date (date): End date to search to.
+        batch_size (int): Number of rows fetched at a time.
+
+    Returns:
+        partitions (AsyncIterator[list[Row]]): Rows with symbol, date, open_price, close_price and volume, sorted by (date, symbol).
     """
-    return base_query(db, symbol, start_date, end_date ).order_by(models.FinancialData.date).offset(offset).limit(limit).all()
+    query = base_query(symbol, start_date, end_date,
+        models.FinancialData.symbol,
+        models.FinancialData.date,
+        models.FinancialData.open_price,
+        models.FinancialData.close_price,
+        models.FinancialData.volume
+    ).order_by(models.FinancialData.date, models.FinancialData.symbol).execution_options(yield_per=batch_size)
+
+    result = await db.stream(query)
+    async for partition in result.partitions():
+        record_rows(len(partition))
+        yield partition
@@ -1,28 +1,211 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
 
-from financial.settings import Settings
+from functools import lru_cache
 
-# Get envionment settings to setup DB Connection
-settings = Settings()
+from sqlalchemy import URL, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-SQLALCHEMY_DB_URL = f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOSTNAME}/{settings.POSTGRES_DB}"
+from financial.metrics import instrument_engine
+from financial.replicas import ReplicaSet, RoutingSession
+from financial.settings import get_settings
 
-# Setup SQLAlchemy database connection
-engine = create_engine(
-    SQLALCHEMY_DB_URL
-)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@lru_cache
+def database_url() -> URL:
+    """ URL of the primary database, from the environment settings """
+    settings = get_settings()
+
+    return URL.create(
+        "postgresql+asyncpg",
+        username=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        host=settings.POSTGRES_HOSTNAME,
+        port=settings.DATABASE_PORT,
+        database=settings.POSTGRES_DB
+    )
+
+
+class PoolMetrics:
+    """ Counters about the usage of the connection pool """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_connect(self, seconds: float):
+        self.connects += 1
+        self.connect_seconds += seconds
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """ Connection pool that records how long sessions wait to get a connection, and how long connecting takes """
+
+    def _do_get(self):
+        # Checkouts only wait for a connection to be returned when the pool and its overflow are
+        # all in use. The others take an idle connection or open a new one, timed as a connect.
+        waits = self._max_overflow > -1 and self.overflow() >= self._max_overflow and self.checkedin() == 0
+        pool_metrics.checkouts += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            if waits:
+                pool_metrics.record_wait(time.perf_counter() - start)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            pool_metrics.record_connect(time.perf_counter() - start)
+
+
+def create_engine(url: URL) -> AsyncEngine:
+    """
+    Setup SQLAlchemy database connection. The asyncpg driver lets queries run
+    without blocking the event loop that serves the requests. Statements are
+    prepared once per connection and reused by later executions.
+    """
+    settings = get_settings()
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    )
+    instrument_engine(engine)
+
+    return engine
+
+
+def replica_urls(hostnames: str | None) -> list[URL]:
+    """ URLs of the read replicas listed as comma separated host or host:port values """
+    urls = []
+
+    for hostname in (hostnames or "").split(","):
+        host, _, port = hostname.strip().partition(":")
+        if host:
+            urls.append(database_url().set(host=host, port=int(port) if port else get_settings().DATABASE_PORT))
+
+    return urls
+
+
+# Engines are created on first use. Creating them loads the database driver, which
+# importing the models, crud functions or the app does not need.
+@lru_cache
+def get_engine() -> AsyncEngine:
+    """ Engine of the primary database """
+    return create_engine(database_url())
+
+
+@lru_cache
+def get_replicas() -> ReplicaSet | None:
+    """ Read replicas of the API, None when there are none """
+    settings = get_settings()
+    if not settings.DB_READ_HOSTNAMES:
+        return None
+
+    return ReplicaSet([create_engine(url) for url in replica_urls(settings.DB_READ_HOSTNAMES)], settings.DB_READ_MAX_LAG, settings.DB_READ_CHECK_INTERVAL)
+
+
+@lru_cache
+def get_sessionmaker() -> async_sessionmaker:
+    """ Sessions of the API. Reads go to the replicas when there are any, everything else to the primary engine. """
+    return async_sessionmaker(bind=get_engine(), autoflush=False, expire_on_commit=False, sync_session_class=RoutingSession, replicas=get_replicas())
+
+
+# Names of the values above as they were imported before being created on first use.
+LAZY_ATTRIBUTES = {
+    "settings": get_settings,
+    "SQLALCHEMY_DB_URL": database_url,
+    "engine": get_engine,
+    "replicas": get_replicas,
+    "SessionLocal": get_sessionmaker
+}
+
+
+def __getattr__(name: str):
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 Base = declarative_base()
 
 
+def dispose_after_fork():
+    """
+    Drops the pooled connections inherited from the parent process without
+    closing them, as the parent still uses them, so every worker process opens
+    its own connections.
+    """
+    # Engines the parent did not create yet have no connections.
+    if get_engine.cache_info().currsize == 0:
+        return
+
+    replicas = get_replicas()
+    for pool_engine in [get_engine(), *(replicas.engines if replicas is not None else [])]:
+        pool_engine.sync_engine.dispose(close=False)
+
+
 # Provide a DB sesson
-def get_db():
+async def get_db():
     """ Get Database Session """
-    db = SessionLocal()
-    try:
+    async with get_sessionmaker()() as db:
         yield db
-    finally:
-        db.close()
+
+
+def get_session_factory() -> async_sessionmaker:
+    """
+    Get the factory of Database Sessions, for responses streamed after the
+    request handler returns. Sessions of get_db are closed by then.
+    """
+    return get_sessionmaker()
+
+
+def pool_status() -> dict:
+    """
+    Current state of the connection pool of the API. Pool sizes are the ones of
+    the primary, counters include the pools of the read replicas.
+
+    Returns:
+        status (dict): Pool capacity, connections in use, checkout wait times and connect times.
+    """
+    pool = get_engine().pool
+
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": get_settings().DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(0, pool.overflow()),
+        "checkouts": pool_metrics.checkouts,
+        "timeouts": pool_metrics.timeouts,
+        "waits": pool_metrics.waits,
+        "wait_seconds_total": round(pool_metrics.wait_seconds, 6),
+        "wait_seconds_max": round(pool_metrics.max_wait_seconds, 6),
+        "connects": pool_metrics.connects,
+        "connect_seconds_total": round(pool_metrics.connect_seconds, 6)
+    }
@@ -0,0 +1,155 @@
+import csv
+import io
+
+from collections.abc import AsyncIterator, Sequence
+
+# Columns of the exported entries, in order.
+EXPORT_COLUMNS = ("symbol", "date", "open_price", "close_price", "volume")
+
+# Media type and file extension of every export format.
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportFormatError(Exception):
+    """ Raised when the dependencies of an export format are not installed """
+
+
+def check_export_format(format: str):
+    '''
+    Checks that an export format can be used. pyarrow is an optional dependency
+    only needed by the Arrow and Parquet formats.
+
+    Arguments:
+        format (str): One of EXPORT_FORMATS.
+
+    Raises:
+        ExportFormatError: If the format needs pyarrow and it is not installed.
+    '''
+    if format in ("arrow", "parquet"):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ExportFormatError(f"The {format} format is not available, pyarrow is not installed.")
+
+
+class _Sink(io.RawIOBase):
+    """ Write only file that keeps what is written until it is taken """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+async def export_csv(partitions: AsyncIterator[Sequence[tuple]]) -> AsyncIterator[bytes]:
+    '''
+    Renders partitions of entries as CSV, with a header line.
+
+    Arguments:
+        partitions (AsyncIterator[Sequence[tuple]]): Partitions of rows with EXPORT_COLUMNS.
+
+    Returns:
+        chunks (AsyncIterator[bytes]): One chunk per partition.
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    async for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header of an empty export.
+    if buffer.tell() > 0:
+        yield buffer.getvalue().encode()
+
+
+def _record_batch(rows: Sequence[tuple]):
+    import pyarrow as pa
+
+    columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+    return pa.RecordBatch.from_arrays([pa.array(values, type) for values, type in zip(columns, _arrow_types())], names=list(EXPORT_COLUMNS))
+
+
+def _arrow_types():
+    import pyarrow as pa
+
+    return (pa.string(), pa.date32(), pa.float64(), pa.float64(), pa.int64())
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema(list(zip(EXPORT_COLUMNS, _arrow_types())))
+
+
+async def export_arrow(partitions: AsyncIterator[Sequence[tuple]]) -> AsyncIterator[bytes]:
+    '''
+    Renders partitions of entries as an Arrow IPC stream, one record batch per partition.
+
+    Arguments:
+        partitions (AsyncIterator[Sequence[tuple]]): Partitions of rows with EXPORT_COLUMNS.
+
+    Returns:
+        chunks (AsyncIterator[bytes]): One chunk per partition.
+    '''
+    import pyarrow as pa
+
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, _arrow_schema()) as writer:
+        async for rows in partitions:
+            writer.write_batch(_record_batch(rows))
+            yield sink.take()
+
+    yield sink.take()
+
+
+async def export_parquet(partitions: AsyncIterator[Sequence[tuple]]) -> AsyncIterator[bytes]:
+    '''
+    Renders partitions of entries as a Parquet file, one row group per partition.
+
+    Arguments:
+        partitions (AsyncIterator[Sequence[tuple]]): Partitions of rows with EXPORT_COLUMNS.
+
+    Returns:
+        chunks (AsyncIterator[bytes]): One chunk per partition, the footer comes in the last one.
+    '''
+    import pyarrow.parquet as pq
+
+    sink = _Sink()
+    with pq.ParquetWriter(sink, _arrow_schema()) as writer:
+        async for rows in partitions:
+            writer.write_batch(_record_batch(rows))
+            yield sink.take()
+
+    yield sink.take()
+
+
+def export_stream(format: str, partitions: AsyncIterator[Sequence[tuple]]) -> AsyncIterator[bytes]:
+    '''
+    Renders partitions of entries in an export format.
+
+    Arguments:
+        format (str): One of EXPORT_FORMATS.
+        partitions (AsyncIterator[Sequence[tuple]]): Partitions of rows with EXPORT_COLUMNS.
+
+    Returns:
+        chunks (AsyncIterator[bytes]): Content of the export.
+    '''
+    writers = {"csv": export_csv, "arrow": export_arrow, "parquet": export_parquet}
+    return writers[format](partitions)
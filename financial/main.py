@@ -1,23 +1,106 @@
+import asyncio
+import bisect
+import logging
 import math
 
 from datetime import datetime, date
+from functools import lru_cache
 from fastapi.encoders import jsonable_encoder
 from fastapi import FastAPI, status, Request, Response, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from typing import Any, Dict, Union, Annotated
 
 from financial import schemas, crud, models
-from financial.database import get_db
+from financial.cache import ResponseCache, cache_key, cached_response, create_response_cache, listen_for_invalidations
+from financial.responses import FastJSONResponse
+from financial.metrics import MetricsMiddleware, render_metrics
+from financial.export import EXPORT_FORMATS, ExportFormatError, check_export_format, export_stream
+from financial.database import database_url, get_db, get_engine, get_replicas, get_session_factory, pool_status
+from financial.pagination import encode_cursor
+from financial.settings import get_settings
 
 
-# Start our FastAPI app
+# Start our FastAPI app. Settings are read when the app starts, so importing it does not require them.
 app = FastAPI(
     title="Financial API",
-    description="API done for python assignment."
+    description="API done for python assignment.",
+    default_response_class=FastJSONResponse
 )
+app.add_middleware(MetricsMiddleware, server_timing=lambda: get_settings().SERVER_TIMING)
+
+
+@lru_cache
+def get_response_cache() -> ResponseCache | None:
+    """ Cache of the responses, None when disabled. Entries are invalidated when the ingester notifies new data. """
+    return create_response_cache(get_settings())
+
+
+@lru_cache
+def get_column_store():
+    """
+    Copy of the entries in memory, loaded and refreshed along with the invalidations
+    of the cache, None when disabled. NumPy and the database driver are only
+    imported here when the store is enabled.
+    """
+    if not get_settings().COLUMN_STORE_ENABLED:
+        return None
+
+    from financial.store import ColumnStore
+    return ColumnStore(get_engine())
+
+
+# Names of the values above as they were imported before being created on first use.
+LAZY_ATTRIBUTES = {
+    "settings": get_settings,
+    "response_cache": get_response_cache,
+    "column_store": get_column_store
+}
+
+
+def __getattr__(name: str):
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@app.on_event("startup")
+async def start_cache_invalidation():
+    """ Starts listening to the data changes notified by the ingester. """
+    settings = get_settings()
+    response_cache = get_response_cache()
+    column_store = get_column_store()
+    if response_cache is not None or column_store is not None:
+        dsn = database_url().set(drivername="postgresql").render_as_string(hide_password=False)
+        # Notifications come from the primary, replicas may still serve older data for a while.
+        repeat_after = settings.DB_READ_MAX_LAG if get_replicas() is not None else None
+        refresh = column_store.refresh if column_store is not None else None
+        app.state.cache_listener = asyncio.create_task(listen_for_invalidations(dsn, response_cache, repeat_after=repeat_after, refresh=refresh))
+
+
+@app.on_event("shutdown")
+async def stop_cache_invalidation():
+    """ Stops listening to the data changes notified by the ingester. """
+    if getattr(app.state, "cache_listener", None) is not None:
+        app.state.cache_listener.cancel()
+
+
+@app.on_event("startup")
+async def start_replica_checks():
+    """ Checks the read replicas before serving requests and then periodically. """
+    replicas = get_replicas()
+    if replicas is not None:
+        await replicas.check_all()
+        app.state.replica_checks = asyncio.create_task(replicas.run_checks())
+
+
+@app.on_event("shutdown")
+async def stop_replica_checks():
+    """ Stops checking the read replicas. """
+    if getattr(app.state, "replica_checks", None) is not None:
+        app.state.replica_checks.cancel()
 
 
 
@@ -47,6 +130,8 @@ async def general_exception_handler(request, exc):
     Returns:
         JSONResponse object and HTTP status 500
     """
+    logging.error(f"Unhandled error serving {request.method} {request.url.path}", exc_info=exc)
+
     return JSONResponse(
         status_code=500,
         content=jsonable_encoder({"info": {"error" : "Internal Server Error"}})
@@ -56,8 +141,9 @@ async def general_exception_handler(request, exc):
 
 @app.get("/api/financial_data", response_model=schemas.FinancialDataResponse, response_model_exclude_unset=True)
 async def get_financial_data(
-        params: Annotated[schemas.GetFinancialDataParams,  Depends(schemas.GetFinancialDataParams)],
-        db:Session = Depends(get_db)):
+        request: Request,
+        params: Annotated[schemas.GetFinancialDataParams,  Depends(schemas.query_params(schemas.GetFinancialDataParams))],
+        db: AsyncSession = Depends(get_db)):
     """
     Returns a list of finanal data from the requested symbol.
     The data is provided based on the date range defined in the Request Parameters.
@@ -69,6 +155,8 @@ async def get_financial_data(
         end_date (str): Supported format is YYYY-MM-DD. Should be a date after start_date.
         limit (int): Number of records returned per page.
         page (int): Requested page number.
+        cursor (str): next_cursor value of a previous response. Takes precedence over page.
+        include_count (bool): Whether to count all the matching records. Defaults to true unless cursor is set.
 
     Returns:
         JSONResponse object with the following structure:
@@ -81,32 +169,68 @@ async def get_financial_data(
         info:
             - error
         pagination:
-            - count
+            - count (only when counting records)
             - limit
-            - page
-            - pages
+            - page (only when not using a cursor)
+            - pages (only when counting records)
+            - next_cursor
+    """
+    return await cached_response(request, get_response_cache(), cache_key("financial_data", params), params.symbol,
+        lambda: build_financial_data_response(params, db), max_age=get_settings().CACHE_MAX_AGE)
+
+
+async def build_financial_data_response(params: schemas.GetFinancialDataParams, db: AsyncSession) -> dict:
     """
+    Retrieves the data of a financial_data request from the database or the column store.
+    Pages can hold many rows, so the content is returned as plain rows with the
+    structure of FinancialDataResponse instead of validating it with pydantic.
+    """
+
+    cursor = params.cursor
+
+    # Pages of a single symbol are read from the column store when it is enabled.
+    column_store = get_column_store()
+    store = column_store if column_store is not None and column_store.serves(params.symbol) else None
+
+    # Counting rescans the whole range, so it is skipped by default when paginating with a cursor.
+    include_count = params.include_count if params.include_count is not None else cursor is None
 
     # Get the total amount of records that match the query criteria.
-    record_count = crud.count_financial_data(db, params.symbol, params.start_date, params.end_date)
+    record_count = None
+    if include_count:
+        if store is not None:
+            record_count = store.count_financial_data(params.symbol, params.start_date, params.end_date)
+        else:
+            record_count = await crud.count_financial_data(db, params.symbol, params.start_date, params.end_date)
 
     data = []
     pagination = { }
     # Avoid doing unnecesary things if no data was return before.
     if record_count != 0:
 
-        # Calculate the right offset based on page param and the limit of entries per page.
-        offset = max(0,(params.page -1)) * params.limit
-        current_page = params.page
+        # Actualy retrieve the page data. One extra entry is requested to know whether there is a next page.
+        if cursor is not None:
+            page = {"limit": params.limit + 1, "after": cursor}
+        else:
+            # Calculate the right offset based on page param and the limit of entries per page.
+            offset = max(0,(params.page -1)) * params.limit
+            pagination["page"] = params.page
+            page = {"offset": offset, "limit": params.limit + 1}
 
-        # Actualy retrieve the page data
-        data = crud.get_financial_data_by_symbol(db, params.symbol, params.start_date, params.end_date, offset=offset, limit=params.limit)
+        if store is not None:
+            data = store.get_financial_data_by_symbol(params.symbol, params.start_date, params.end_date, **page)
+        else:
+            data = await crud.get_financial_data_by_symbol(db, params.symbol, params.start_date, params.end_date, **page)
+
+        has_next_page = len(data) > params.limit
+        data = data[:params.limit]
 
         # Set pagination information based on query params and retrieve data.
-        pagination["count"] = record_count
-        pagination["page"] = current_page
+        if record_count is not None:
+            pagination["count"] = record_count
+            pagination["pages"] = math.ceil(record_count / params.limit)
         pagination["limit"] = params.limit
-        pagination["pages"] = math.ceil(record_count / params.limit)
+        pagination["next_cursor"] = encode_cursor(data[-1].date, data[-1].symbol) if has_next_page else None
 
         # No particular error message set
         if len(data) == 0:
@@ -118,20 +242,63 @@ async def get_financial_data(
         # Let the client know that no entries were found.
         info={"error" :"No entries found with the provided criteria."}
 
-    # Set response object
-    response = schemas.FinancialDataResponse()
-    response.data = data
-    response.pagination = pagination
-    response.info = info
+    # Set response content
+    return {"data": data, "pagination": pagination, "info": info}
+
+
+
+@app.get("/api/financial_data/export")
+async def export_financial_data(
+        params: Annotated[schemas.GetExportParams, Depends(schemas.query_params(schemas.GetExportParams))],
+        session_factory: async_sessionmaker = Depends(get_session_factory)):
+    """
+    Streams all the financial data that matches the criteria as a file, without pagination.
+    Entries are read from the database in batches and sent as they are read.
+
+    Arguments:
+        symbol (str): Company Identifier for the request.
+        start_date (str): Supported format is YYYY-MM-DD.
+        end_date (str): Supported format is YYYY-MM-DD. Should be a date after start_date.
+        format (str): "csv" (default), "arrow" (Arrow IPC stream) or "parquet".
+
+    Returns:
+        File with the columns symbol, date, open_price, close_price and volume, sorted by date and symbol.
+    """
+    try:
+        check_export_format(params.format)
+    except ExportFormatError as e:
+        return JSONResponse(
+            status_code=400,
+            content=jsonable_encoder({"info": {"error": str(e)}})
+        )
+
+    media_type, extension = EXPORT_FORMATS[params.format]
+
+    return StreamingResponse(
+        stream_export(params, session_factory),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{params.symbol or "financial_data"}.{extension}"'}
+    )
+
 
-    return response
+
+async def stream_export(params: schemas.GetExportParams, session_factory: async_sessionmaker):
+    """
+    Content of an export. The entries are read with a session of its own, as the
+    ones of the request dependencies are closed before the response is streamed.
+    """
+    async with session_factory() as db:
+        partitions = crud.stream_financial_data(db, params.symbol, params.start_date, params.end_date, batch_size=get_settings().EXPORT_BATCH_SIZE)
+        async for chunk in export_stream(params.format, partitions):
+            yield chunk
 
 
 
 @app.get("/api/statistics")
 async def get_statistics(
-        params: Annotated[schemas.GetStatisticsParams, Depends(schemas.GetStatisticsParams)],
-        db:Session = Depends(get_db)):
+        request: Request,
+        params: Annotated[schemas.GetStatisticsParams, Depends(schemas.query_params(schemas.GetStatisticsParams))],
+        db: AsyncSession = Depends(get_db)):
     """
     Get the statistical data for one particular company for the specified date range.
 
@@ -139,6 +306,7 @@ async def get_statistics(
         symbol (str): Identifier for the company.
         start_date (str): Supported format is YYYY-MM-DD.
         end_date (str): Supported format is YYYY-MM-DD. Should be a date after start_date.
+        method (str): "raw" (default) aggregates the entries, "rollup" uses the running totals kept by the ingester.
 
     Returns:
         JSONResponse object with the following structure.
@@ -152,29 +320,36 @@ async def get_statistics(
         info:
             - error
     """
+    return await cached_response(request, get_response_cache(), cache_key("statistics", params), params.symbol,
+        lambda: build_statistics_response(params, db), max_age=get_settings().CACHE_MAX_AGE)
+
 
-    # Retrieve the financial data from DB
-    data_list = crud.get_financial_data_by_symbol(db, params.symbol, params.start_date, params.end_date)
+async def build_statistics_response(params: schemas.GetStatisticsParams, db: AsyncSession) -> schemas.StatisticsResponse:
+    """ Computes the data of a statistics request in the database or the column store. """
 
-    count = len(data_list)
+    # Let the database aggregate the whole date range in a single query, either over
+    # the entries or from the precomputed running totals. The column store answers both.
+    column_store = get_column_store()
+    if column_store is not None and column_store.serves(params.symbol):
+        statistics = column_store.get_financial_statistics(params.symbol, params.start_date, params.end_date)
+    elif params.method == "rollup":
+        statistics = await crud.get_financial_statistics_rollup(db, params.symbol, params.start_date, params.end_date)
+    else:
+        statistics = await crud.get_financial_statistics(db, params.symbol, params.start_date, params.end_date)
 
     data = {}
 
     # Avoid doing calculations if no data.
-    if count != 0 :
-        # Map our values to make it easy to calculate the averages.
-        open_prices = map(lambda data: float(data.open_price), data_list)
-        close_prices = map(lambda data: float(data.close_price), data_list)
-        volumes = map(lambda data: float(data.volume), data_list)
-
-        # Set statistical data
+    if statistics.count != 0 :
+        # Set statistical data. Averages are converted to float as Postgres returns
+        # Decimal values when averaging integer columns.
         data = {
             "start_date": params.start_date,
             "end_date": params.end_date,
             "symbol": params.symbol,
-            "average_daily_open_price": round(math.fsum(open_prices) / count, 3 ),
-            "average_daily_close_price": round(math.fsum(close_prices) / count, 3),
-            "average_daily_volume": round(math.fsum(volumes) / count, 3)
+            "average_daily_open_price": round(float(statistics.average_open_price), 3),
+            "average_daily_close_price": round(float(statistics.average_close_price), 3),
+            "average_daily_volume": round(float(statistics.average_volume), 3)
         }
         info = {"error" :""}
     else:
@@ -186,3 +361,234 @@ async def get_statistics(
     response.info = info
 
     return response
+
+
+
+@app.get("/api/analytics")
+async def get_analytics(
+        request: Request,
+        params: Annotated[schemas.GetAnalyticsParams, Depends(schemas.query_params(schemas.GetAnalyticsParams))],
+        db: AsyncSession = Depends(get_db)):
+    """
+    Get daily series of moving window analytics of one particular company for the specified date range.
+    Moving windows include the days before start_date, so every day of the range has a value when there is enough history.
+
+    Arguments:
+        symbol (str): Identifier for the company.
+        start_date (str): Supported format is YYYY-MM-DD.
+        end_date (str): Supported format is YYYY-MM-DD. Should be a date after start_date.
+        window (int): Number of days of the moving windows. Default is 20.
+
+    Returns:
+        JSONResponse object with the following structure.
+        data: one item per day with
+            - date
+            - close_price
+            - sma: simple moving average of the close price.
+            - ema: exponential moving average of the close price.
+            - vwap: volume weighted average of the close price over the window.
+            - return: relative change of the close price from the previous day.
+            - volatility: standard deviation of the returns over the window.
+            Values that can not be computed yet are null. The exponential average is seeded with the
+            simple average of the window before start_date.
+        info:
+            - error
+    """
+    return await cached_response(request, get_response_cache(), cache_key("analytics", params), params.symbol,
+        lambda: build_analytics_response(params, db), max_age=get_settings().CACHE_MAX_AGE)
+
+
+async def build_analytics_response(params: schemas.GetAnalyticsParams, db: AsyncSession) -> schemas.AnalyticsResponse:
+    """ Computes the series of an analytics request from the daily entries. """
+    # NumPy is only needed by this endpoint, so it is not imported with the app.
+    import numpy as np
+    from financial import analytics
+
+    rows = await crud.get_financial_series(db, params.symbol, params.start_date, params.end_date, lookback=params.window)
+    dates = [row.date for row in rows]
+
+    # Entries before start_date are only used to fill the windows of the first days.
+    first = bisect.bisect_left(dates, params.start_date)
+
+    data = []
+    if first < len(rows):
+        close = np.array([row.close_price for row in rows], dtype=float)
+        volume = np.array([row.volume for row in rows], dtype=float)
+        daily_returns = analytics.returns(close)
+
+        series = {
+            "close_price": (close, 3),
+            "sma": (analytics.sma(close, params.window), 3),
+            "ema": (analytics.ema(close, params.window), 3),
+            "vwap": (analytics.vwap(close, volume, params.window), 3),
+            "return": (daily_returns, 6),
+            "volatility": (analytics.rolling_std(daily_returns, params.window), 6)
+        }
+        # NaN or infinite values mark the ones that can not be computed, they are returned as null.
+        columns = {name: np.where(np.isfinite(values), values.round(digits), None)[first:].tolist() for name, (values, digits) in series.items()}
+
+        data = [{"date": entry_date, **dict(zip(columns, values))} for entry_date, *values in zip(dates[first:], *columns.values())]
+        info = {"error" :""}
+    else:
+        info = {"error" : f"No records were found for symbol: {params.symbol} on the reqested date range."}
+
+    response = schemas.AnalyticsResponse()
+    response.data = data
+    response.info = info
+
+    return response
+
+
+
+@app.get("/api/statistics/batch")
+async def get_batch_statistics(
+        request: Request,
+        params: Annotated[schemas.GetBatchStatisticsParams, Depends(schemas.query_params(schemas.GetBatchStatisticsParams))],
+        db: AsyncSession = Depends(get_db)):
+    """
+    Get the statistical data of many companies for one or many date ranges.
+    Everything is computed by a single query to the database.
+
+    Arguments:
+        symbols (str): Comma separated identifiers of the companies.
+        start_date (str): Supported format is YYYY-MM-DD. Required unless windows is set.
+        end_date (str): Supported format is YYYY-MM-DD. Should be a date after start_date. Required unless windows is set.
+        windows (str): Comma separated date ranges with format YYYY-MM-DD:YYYY-MM-DD. Replaces start_date and end_date.
+
+    Returns:
+        JSONResponse object with the following structure.
+        data:
+            - windows: list of the requested date ranges, with start_date and end_date.
+            - statistics: by symbol, a list with an item by date range, in the same order as windows.
+              Items have average_daily_open_price, average_daily_close_price and average_daily_volume,
+              or are null if there are no records in that date range.
+        info:
+            - error
+    """
+    return await cached_response(request, get_response_cache(), cache_key("statistics_batch", params), None,
+        lambda: build_batch_statistics_response(params, db), max_age=get_settings().CACHE_MAX_AGE)
+
+
+async def build_batch_statistics_response(params: schemas.GetBatchStatisticsParams, db: AsyncSession) -> schemas.BatchStatisticsResponse:
+    """ Computes the data of a batch statistics request in the database. """
+
+    rows = await crud.get_batch_financial_statistics(db, params.symbols, params.windows)
+
+    statistics = {symbol: [None] * len(params.windows) for symbol in params.symbols}
+    for row in rows:
+        statistics[row.symbol][row.window] = {
+            "average_daily_open_price": round(float(row.average_open_price), 3),
+            "average_daily_close_price": round(float(row.average_close_price), 3),
+            "average_daily_volume": round(float(row.average_volume), 3)
+        }
+
+    missing = [symbol for symbol, values in statistics.items() if all(value is None for value in values)]
+    if missing:
+        info = {"error": f"No records were found for symbols: {', '.join(missing)} on the reqested date ranges."}
+    else:
+        info = {"error": ""}
+
+    response = schemas.BatchStatisticsResponse()
+    response.data = {
+        "windows": [{"start_date": start_date, "end_date": end_date} for start_date, end_date in params.windows],
+        "statistics": statistics
+    }
+    response.info = info
+
+    return response
+
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Get the metrics of this worker in the Prometheus text format. Includes
+    histograms of the latency, database queries, rows and JSON serialization
+    time of every route, and the state of the connection pool and cache.
+    """
+    gauges = {"db_pool": pool_status()}
+    response_cache, column_store = get_response_cache(), get_column_store()
+    if response_cache is not None:
+        gauges["response_cache"] = response_cache.status()
+    if column_store is not None:
+        gauges["column_store"] = column_store.status()
+
+    return PlainTextResponse(render_metrics(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/pool")
+async def get_pool_metrics():
+    """
+    Get the state of the database connection pool of this worker.
+    Useful to size the number of workers against Postgres `max_connections`.
+
+    Returns:
+        JSONResponse object with the following structure.
+            - pool_size
+            - max_overflow
+            - checked_in
+            - checked_out
+            - overflow
+            - checkouts
+            - timeouts
+            - waits
+            - wait_seconds_total
+            - wait_seconds_max
+            - connects
+            - connect_seconds_total
+    """
+    return pool_status()
+
+
+@app.get("/metrics/replicas")
+async def get_replica_metrics():
+    """
+    Get the state of the read replicas of this worker.
+
+    Returns:
+        JSONResponse object with the following structure, empty when there are no replicas.
+            - max_lag
+            - reads: reads sent to a replica
+            - fallbacks: reads sent to the primary because no replica could be used
+            - replicas: url, healthy, lag, error and checked_at of every replica
+    """
+    replicas = get_replicas()
+    return replicas.status() if replicas is not None else {}
+
+
+@app.get("/metrics/store")
+async def get_store_metrics():
+    """
+    Get the state of the column store of this worker.
+
+    Returns:
+        JSONResponse object with the following structure, empty when the store is disabled.
+            - loaded
+            - loaded_at
+            - symbols
+            - rows
+            - bytes
+            - refreshes
+    """
+    column_store = get_column_store()
+    return column_store.status() if column_store is not None else {}
+
+
+@app.get("/metrics/cache")
+async def get_cache_metrics():
+    """
+    Get the state of the response cache of this worker.
+
+    Returns:
+        JSONResponse object with the following structure.
+            - size
+            - maxsize
+            - ttl
+            - shared
+            - hits
+            - shared_hits
+            - misses
+            - invalidations
+    """
+    response_cache = get_response_cache()
+    return response_cache.status() if response_cache is not None else {}
@@ -0,0 +1,188 @@
+import bisect
+import time
+
+from collections.abc import Callable
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import Match
+
+# Upper bounds of the histogram buckets. Anything larger only counts in +Inf.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class Histogram:
+    """ Prometheus style histogram, one series per set of label values """
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+
+        series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        for label_values, series in sorted(self.series.items()):
+            labels = [f'{label}="{value}"' for label, value in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series["counts"]):
+                cumulative += count
+                bucket_labels = ",".join([*labels, f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f'{{{",".join(labels)}}}' if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+
+        return lines
+
+
+class RequestMetrics:
+    """ What a single request spent its time on """
+
+    __slots__ = ("queries", "db_seconds", "rows", "render_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.render_seconds = 0.0
+
+    def server_timing(self, app_seconds: float) -> str:
+        """ Value of the Server-Timing header, durations in milliseconds """
+        return (f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries, {self.rows} rows", '
+            f"render;dur={self.render_seconds * 1000:.2f}, app;dur={app_seconds * 1000:.2f}")
+
+
+# Metrics of the request being served, None outside of requests.
+current_request: ContextVar[RequestMetrics | None] = ContextVar("current_request", default=None)
+
+request_seconds = Histogram("http_request_duration_seconds", "Time to serve a request, including streaming the body.", ("method", "route", "status"), SECONDS_BUCKETS)
+request_queries = Histogram("http_request_db_queries", "Database queries run by a request.", ("route",), QUERIES_BUCKETS)
+request_db_seconds = Histogram("http_request_db_seconds", "Time a request spent running database queries.", ("route",), SECONDS_BUCKETS)
+request_rows = Histogram("http_request_db_rows", "Rows returned by the database queries of a request.", ("route",), ROWS_BUCKETS)
+request_render_seconds = Histogram("http_request_render_seconds", "Time a request spent serializing JSON.", ("route",), SECONDS_BUCKETS)
+query_seconds = Histogram("db_query_duration_seconds", "Time to run a database query, in requests or not.", (), SECONDS_BUCKETS)
+
+HISTOGRAMS = (request_seconds, request_queries, request_db_seconds, request_rows, request_render_seconds, query_seconds)
+
+
+def record_render(seconds: float):
+    """ Adds JSON serialization time to the current request """
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.render_seconds += seconds
+
+
+def record_rows(count: int):
+    """ Adds rows fetched from the database to the current request. Called where the results of queries are fetched """
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.rows += count
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - connection.info["query_started"].pop()
+    query_seconds.observe(seconds)
+
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.db_seconds += seconds
+
+
+def instrument_engine(engine: AsyncEngine):
+    """ Records the number and duration of the queries run through an engine """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware that records the latency of every request along with its
+    database queries, rows and JSON serialization time. Requests are labelled
+    with the path of their route, so metrics do not grow with path parameters.
+
+    Arguments:
+        app: Application to instrument.
+        server_timing (bool | Callable[[], bool]): Whether to send a Server-Timing header with every response,
+            or a function that tells it on every request, for settings read after the app is created.
+    '''
+
+    def __init__(self, app, server_timing: bool | Callable[[], bool] = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    def route(self, scope) -> str:
+        for route in scope["app"].router.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        server_timing = self.server_timing() if callable(self.server_timing) else self.server_timing
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if server_timing:
+                    header = metrics.server_timing(time.perf_counter() - start)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            route = self.route(scope)
+            request_seconds.observe(time.perf_counter() - start, scope["method"], route, str(status))
+            request_queries.observe(metrics.queries, route)
+            request_db_seconds.observe(metrics.db_seconds, route)
+            request_rows.observe(metrics.rows, route)
+            request_render_seconds.observe(metrics.render_seconds, route)
+
+
+def render_metrics(gauges: dict[str, dict]) -> str:
+    '''
+    Renders all the metrics in the Prometheus text format.
+
+    Arguments:
+        gauges (dict[str, dict]): Extra values to include, by prefix. Only numeric values are rendered.
+
+    Returns:
+        metrics (str): Prometheus text exposition.
+    '''
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+
+    for prefix, values in gauges.items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {float(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Float, String, Date, Integer
+from sqlalchemy import Column, Float, Text, Date, BigInteger, Numeric, Index
 
 from financial.database import Base
 
@@ -6,9 +6,28 @@ class FinancialData(Base):
     """ Model class that maps financial_data DB table """
 
     __tablename__ = "financial_data"
+    __table_args__ = (
+        # Queries of a symbol use the primary key, this index serves the ones over all symbols.
+        Index("financial_data_date_symbol_idx", "date", "symbol"),
+        # Yearly partitions on Postgres, see schema.sql.
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
-    symbol = Column(String, primary_key=True, index=True)
-    date = Column(Date, primary_key=True, index=True)
+    symbol = Column(Text, primary_key=True)
+    date = Column(Date, primary_key=True)
     open_price = Column(Float)
     close_price = Column(Float)
-    volume = Column(Integer)
+    volume = Column(BigInteger)
+
+
+class FinancialDataRollup(Base):
+    """ Model class that maps financial_data_rollup DB table. Running totals of financial_data by symbol. """
+
+    __tablename__ = "financial_data_rollup"
+
+    symbol = Column(Text, primary_key=True)
+    date = Column(Date, primary_key=True)
+    cum_open_price = Column(Numeric(asdecimal=False))
+    cum_close_price = Column(Numeric(asdecimal=False))
+    cum_volume = Column(Numeric(asdecimal=False))
+    cum_count = Column(BigInteger)
@@ -0,0 +1,40 @@
+import base64
+
+from datetime import date
+
+
+def encode_cursor(entry_date: date, symbol: str) -> str:
+    """
+    Builds the opaque cursor that points to the last entry of a page.
+
+    Arguments:
+        entry_date (date): Date of the last entry returned.
+        symbol (str): Symbol of the last entry returned.
+
+    Returns:
+        cursor (str): URL safe string to be sent back by the client to get the next page.
+    """
+    raw = f"{entry_date.isoformat()}|{symbol}".encode()
+
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[date, str]:
+    """
+    Reads a cursor created by encode_cursor.
+
+    Arguments:
+        cursor (str): Cursor received from the client.
+
+    Returns:
+        (date, symbol) tuple matching the primary key of the last entry seen.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        entry_date, symbol = raw.split("|", 1)
+        return date.fromisoformat(entry_date), symbol
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
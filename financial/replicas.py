@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+
+from sqlalchemy import Select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+# Seconds a Postgres replica is behind its primary. Zero when it is streaming from the primary and has
+# replayed everything it received, so an idle replica does not look stale. A replica whose WAL receiver
+# is not running may have received nothing for a long time, so its lag is the age of the last transaction
+# it replayed, or NULL, unknown, if it replayed none. pg_stat_wal_receiver only has a row while it runs.
+REPLICATION_LAG_QUERY = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN EXISTS (SELECT FROM pg_stat_wal_receiver) AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8
+END
+""")
+
+
+class ReplicaSet:
+    '''
+    Read replicas of the database, used in turns.
+
+    Replicas are checked periodically. The ones that can not be reached or lag
+    behind the primary more than max_lag seconds are skipped until a later check
+    succeeds. When no replica can be used reads go to the primary.
+
+    Arguments:
+        engines (list[AsyncEngine]): Engines of the replicas.
+        max_lag (float): Seconds a replica can be behind the primary and still be used.
+        check_interval (float): Seconds between checks. Also the timeout of a check.
+    '''
+
+    def __init__(self, engines: list[AsyncEngine], max_lag: float, check_interval: float):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        # Replicas are not used before their first check.
+        self.state = {engine: {"healthy": False, "lag": None, "error": None, "checked_at": None} for engine in engines}
+        self.turns = itertools.count()
+
+        self.reads = 0
+        self.fallbacks = 0
+
+    def choose(self) -> AsyncEngine | None:
+        """ Next usable replica, or None if there is none """
+        usable = [engine for engine in self.engines if self.state[engine]["healthy"]]
+
+        if not usable:
+            self.fallbacks += 1
+            return None
+
+        self.reads += 1
+        return usable[next(self.turns) % len(usable)]
+
+    async def check(self, engine: AsyncEngine):
+        """ Checks that a replica answers and measures its lag """
+        state = self.state[engine]
+
+        async def measure_lag() -> float:
+            async with engine.connect() as connection:
+                if engine.dialect.name == "postgresql":
+                    # A replica that can not tell its lag is not used.
+                    lag = await connection.scalar(REPLICATION_LAG_QUERY)
+                    return float(lag) if lag is not None else math.inf
+
+                await connection.scalar(text("SELECT 1"))
+                return 0.0
+
+        try:
+            lag = await asyncio.wait_for(measure_lag(), timeout=self.check_interval)
+        except Exception as e:
+            if state["healthy"]:
+                logging.warning(f"Read replica {engine.url.render_as_string()} is not available: {e!r}")
+            state.update(healthy=False, lag=None, error=repr(e))
+        else:
+            if state["healthy"] and lag > self.max_lag:
+                logging.warning(f"Read replica {engine.url.render_as_string()} is {lag:.1f}s behind the primary")
+            # The status is served as JSON, which has no infinity.
+            state.update(healthy=lag <= self.max_lag, lag=lag if math.isfinite(lag) else None, error=None)
+
+        state["checked_at"] = time.time()
+
+    async def check_all(self):
+        """ Checks all the replicas at once """
+        await asyncio.gather(*(self.check(engine) for engine in self.engines))
+
+    async def run_checks(self):
+        """ Checks all the replicas every check_interval seconds, until cancelled """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_all()
+
+    def status(self) -> dict:
+        return {
+            "max_lag": self.max_lag,
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+            "replicas": [{"url": engine.url.render_as_string(), **state} for engine, state in self.state.items()]
+        }
+
+
+class RoutingSession(Session):
+    '''
+    Session that sends the SELECT statements to a read replica and everything
+    else, including flushes and SELECT ... FOR UPDATE, to the primary it is bound to.
+
+    The replica is chosen on the first read and kept by the session, so all
+    the reads of a request see the same replica.
+
+    Arguments:
+        replicas (ReplicaSet): Replicas to read from. Everything goes to the primary if None.
+    '''
+
+    def __init__(self, *args, replicas: ReplicaSet | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.read_bind = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+
+        if self.replicas is None or self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return primary
+
+        if self.read_bind is None:
+            replica = self.replicas.choose()
+            self.read_bind = replica.sync_engine if replica is not None else primary
+
+        return self.read_bind
@@ -0,0 +1,49 @@
+import orjson
+import time
+
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.engine import Row
+from typing import Any
+
+from financial.metrics import record_render
+
+
+def _default(obj: Any) -> Any:
+    """ Converts the values orjson does not serialize natively """
+    if isinstance(obj, Row) or (isinstance(obj, tuple) and hasattr(obj, "_asdict")):
+        return obj._asdict()
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, Decimal):
+        return float(obj)
+
+    return jsonable_encoder(obj)
+
+
+def render_json(content: Any) -> bytes:
+    '''
+    Serializes content to JSON with orjson. Dicts, lists, dates, numbers and
+    strings are serialized natively. Query rows, named tuples, pydantic models and anything
+    else FastAPI can encode go through a fallback.
+
+    Arguments:
+        content (Any): Content to serialize.
+
+    Returns:
+        body (bytes): UTF-8 encoded JSON.
+    '''
+    start = time.perf_counter()
+    body = orjson.dumps(content, default=_default)
+    record_render(time.perf_counter() - start)
+
+    return body
+
+
+class FastJSONResponse(JSONResponse):
+    """ JSON response serialized with orjson """
+
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
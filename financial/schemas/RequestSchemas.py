@@ -1,42 +1,187 @@
-from pydantic import BaseModel, root_validator
-from datetime import date, timedelta
+import inspect
+import re
+
+from pydantic import BaseModel
+from datetime import date
 from fastapi import Query
+from typing import Literal
 
 from pydantic.errors import PydanticValueError
 from pydantic.error_wrappers import ErrorWrapper
 from fastapi.exceptions import RequestValidationError
 
+from financial.pagination import decode_cursor
+
+# Limits of a single batch statistics request.
+MAX_BATCH_SYMBOLS = 500
+MAX_BATCH_WINDOWS = 20
+
+# Longest moving window of the analytics endpoint, about a year of trading days.
+MAX_ANALYTICS_WINDOW = 250
+
+# Only dates in this exact format are accepted, other formats of date.fromisoformat are not.
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class QueryParams(BaseModel):
+    '''
+    Base of the Query parameters of the endpoints.
 
-class GetStatisticsParams(BaseModel):
+    FastAPI validates every parameter against its field before building the
+    model, so fields are not validated again. Models are built with from_query,
+    where `parse` is the only validation: it converts the values that need it
+    and collects the errors of all the parameters.
+    '''
+
+    @classmethod
+    def from_query(cls, **values) -> "QueryParams":
+        '''
+        Builds the parameters of a request with construct, which skips the
+        pydantic validation, once `parse` accepted them.
+
+        Raises:
+            RequestValidationError: With the errors of all the parameters.
+        '''
+        values = {**{name: field.get_default() for name, field in cls.__fields__.items()}, **values}
+
+        errors = []
+        cls.parse(values, errors)
+        if errors:
+            raise RequestValidationError(errors=errors)
+
+        return cls.construct(**values)
+
+    @classmethod
+    def parse(cls, values: dict, errors: list):
+        pass
+
+
+def query_params(model: type[QueryParams]):
+    '''
+    Dependency that builds the Query parameters of a request. FastAPI runs
+    class dependencies in a worker thread, this one runs in the event loop.
+
+    Arguments:
+        model (type[QueryParams]): Parameters of the endpoint.
+
+    Returns:
+        dependency: Coroutine function with the parameters of the model.
+    '''
+    async def dependency(**values) -> QueryParams:
+        return model.from_query(**values)
+
+    dependency.__signature__ = inspect.signature(model)
+    return dependency
+
+
+class GetStatisticsParams(QueryParams):
     '''
     Model used to define the Query parameters for Get Statistics Data endpoint.
 
-    Extends BaseModel from pydantic and provides Query validation for each of the fields.
+    Extends QueryParams, FastAPI validates each of the fields and parse converts them.
 
     Arguments:
        symbol (str): The identifier of the stocks
        start_date (str): String with the start date value.
        end_date (str): String with the end date value.
-       page (int): The page requested. Default is 1
-       limit (int): Number of records to retrieve by page. Default is 5
+       method (str): "raw" to aggregate the entries or "rollup" to use the running totals. Default is "raw"
+    '''
+
+    symbol: str = Query(title="Identifier of the stock")
+    start_date: str = Query(title="Search entries from this date")
+    end_date: str = Query(title="Search eantries until this date")
+    method: Literal["raw", "rollup"] = Query("raw", title="Compute from raw entries or from precomputed running totals")
+
+    @classmethod
+    def parse(cls, values, errors):
+        # Keep the parsed dates so they can be bound as DATE parameters by the database driver.
+        values["start_date"], values["end_date"] = parse_dates(values["start_date"], values["end_date"], errors)
+
+
+class GetExportParams(QueryParams):
+    '''
+    Model used to define the Query parameters for Export Financial Data endpoint.
+
+    Extends QueryParams, FastAPI validates each of the fields and parse converts them.
+
+    Arguments:
+       symbol (str): The identifier of the stocks
+       start_date (str): String with the start date value.
+       end_date (str): String with the end date value.
+       format (str): "csv", "arrow" or "parquet". Default is "csv"
+    '''
+
+    symbol: str | None = Query(None, title="Identifier of the stock")
+    start_date: str | None = Query(None, title="Search entries from this date")
+    end_date: str | None = Query(None, title="Search eantries until this date")
+    format: Literal["csv", "arrow", "parquet"] = Query("csv", title="Format of the exported entries")
+
+    @classmethod
+    def parse(cls, values, errors):
+        values["start_date"], values["end_date"] = parse_dates(values["start_date"], values["end_date"], errors)
+
+
+class GetAnalyticsParams(QueryParams):
+    '''
+    Model used to define the Query parameters for Get Analytics endpoint.
+
+    Extends QueryParams, FastAPI validates each of the fields and parse converts them.
+
+    Arguments:
+       symbol (str): The identifier of the stocks
+       start_date (str): String with the start date value.
+       end_date (str): String with the end date value.
+       window (int): Number of days of the moving windows. Default is 20
     '''
 
     symbol: str = Query(title="Identifier of the stock")
     start_date: str = Query(title="Search entries from this date")
     end_date: str = Query(title="Search eantries until this date")
+    window: int = Query(20, ge=2, le=MAX_ANALYTICS_WINDOW, title="Number of days of the moving windows")
 
-    @root_validator()
-    def dates_cross_validation(cls, values):
-        cross_validate_dates(values["start_date"], values["end_date"])
+    @classmethod
+    def parse(cls, values, errors):
+        values["start_date"], values["end_date"] = parse_dates(values["start_date"], values["end_date"], errors)
 
-        return values
 
+class GetBatchStatisticsParams(QueryParams):
+    '''
+    Model used to define the Query parameters for Get Batch Statistics endpoint.
 
-class GetFinancialDataParams(BaseModel):
+    Extends QueryParams, FastAPI validates each of the fields and parse converts them.
+
+    Arguments:
+       symbols (str): Comma separated identifiers of the stocks.
+       start_date (str): String with the start date value. Required unless windows is set.
+       end_date (str): String with the end date value. Required unless windows is set.
+       windows (str): Comma separated start_date:end_date date ranges. Replaces start_date and end_date.
+    '''
+
+    symbols: str = Query(title="Comma separated identifiers of the stocks")
+    start_date: str | None = Query(None, title="Search entries from this date")
+    end_date: str | None = Query(None, title="Search eantries until this date")
+    windows: str | None = Query(None, title="Comma separated start_date:end_date date ranges")
+
+    @classmethod
+    def parse(cls, values, errors):
+        values["symbols"] = parse_symbols(values["symbols"], "symbols", errors)
+
+        # A single window can be given with start_date and end_date like in the statistics endpoint.
+        if values["windows"] is not None:
+            values["windows"] = parse_windows(values["windows"], "windows", errors)
+        else:
+            if values["start_date"] is None or values["end_date"] is None:
+                errors.append(ErrorWrapper(WindowsMissingError(), loc=("windows")))
+            values["windows"] = [parse_dates(values["start_date"], values["end_date"], errors)]
+
+        values["start_date"], values["end_date"] = None, None
+
+
+class GetFinancialDataParams(QueryParams):
     '''
     Model used to define the Query parameters for Get Financial Data endpoint.
 
-    Extends BaseModel from pydantic and provides Query validation for each of the fields.
+    Extends QueryParams, FastAPI validates each of the fields and parse converts them.
 
     Arguments:
        symbol (str): The identifier of the stocks
@@ -44,19 +189,22 @@ class GetFinancialDataParams(BaseModel):
        end_date (str): String with the end date value.
        page (int): The page requested. Default is 1
        limit (int): Number of records to retrieve by page. Default is 5
+       cursor (str): Opaque cursor returned as `next_cursor`. When set, page is ignored. Decoded to a (date, symbol) tuple.
+       include_count (bool): Whether to count all matching records. Defaults to true unless a cursor is used.
     '''
     symbol: str | None = Query(None, title="Identifier of the stock")
     start_date: str | None = Query(None, title="Search entries from this date")
     end_date: str | None = Query(None, title="Search eantries until this date")
     page: int | None = Query(1, gt=0, title="Page number. Used for Pagination.")
     limit: int | None = Query(5, gt=1,title="Number of records to retrieve by page")
+    cursor: str | None = Query(None, title="Cursor of the next page. Used for keyset Pagination.")
+    include_count: bool | None = Query(None, title="Count all the records matching the criteria")
 
 
-    @root_validator()
-    def dates_cross_validation(cls, values):
-        cross_validate_dates(values["start_date"], values["end_date"])
-
-        return values
+    @classmethod
+    def parse(cls, values, errors):
+        values["start_date"], values["end_date"] = parse_dates(values["start_date"], values["end_date"], errors)
+        values["cursor"] = parse_cursor(values["cursor"], "cursor", errors)
 
 
 
@@ -67,41 +215,94 @@ class DateFormatError(PydanticValueError):
 class DateRangeError(PydanticValueError):
     msg_template = "start_date should be before end_date."
 
+class CursorError(PydanticValueError):
+    msg_template = "Invalid cursor. Use the next_cursor value of a previous response."
 
-def cross_validate_dates(start_date, end_date):
+class SymbolsError(PydanticValueError):
+    msg_template = f"Between 1 and {MAX_BATCH_SYMBOLS} comma separated symbols are supported."
 
-    field1 = "start_date"
-    field2 = "end_date"
+class WindowsError(PydanticValueError):
+    msg_template = f"Between 1 and {MAX_BATCH_WINDOWS} comma separated start_date:end_date windows are supported."
 
-    s_date = date_format_validation(start_date, field1)
-    e_date = date_format_validation(end_date, field2)
+class WindowsMissingError(PydanticValueError):
+    msg_template = "Either windows or start_date and end_date are required."
 
 
-    if s_date is None or e_date is None:
-        return
+def parse_date(v, field, errors):
+    # Most dates are valid, the exception is only raised by days that do not exist, as 2023-02-30.
+    if v is not None and ISO_DATE.fullmatch(v):
+        try:
+            return date.fromisoformat(v)
+        except ValueError:
+            pass
 
-    if (e_date - s_date) < timedelta(0) :
-        raise RequestValidationError( errors=[
-            ErrorWrapper(
-                DateRangeError(),
-                loc=(f"{field1},{field2}")
-            )
-        ])
+    if v is not None:
+        errors.append(ErrorWrapper(DateFormatError(), loc=(field)))
 
+    return None
 
-def date_format_validation(v, field):
-    result = None
 
-    if v is not None:
-        try:
-            result = date.fromisoformat(v)
-        except ValueError:
-            raise RequestValidationError(errors=[
-                ErrorWrapper(
-                    DateFormatError(),
-                    loc=(field)
-                )
-            ])
+def parse_dates(start_date, end_date, errors):
+    s_date = parse_date(start_date, "start_date", errors)
+    e_date = parse_date(end_date, "end_date", errors)
+
+    if s_date is not None and e_date is not None and e_date < s_date:
+        errors.append(ErrorWrapper(DateRangeError(), loc=("start_date,end_date")))
+
+    return s_date, e_date
+
+
+def parse_cursor(v, field, errors):
+    if v is None:
+        return None
+
+    try:
+        return decode_cursor(v)
+    except ValueError:
+        errors.append(ErrorWrapper(CursorError(), loc=(field)))
+        return None
+
+
+def parse_symbols(v, field, errors):
+    # Repeated symbols are computed once, the order of the request is kept.
+    symbols = list(dict.fromkeys(symbol.strip() for symbol in v.split(",") if symbol.strip()))
+
+    if not 0 < len(symbols) <= MAX_BATCH_SYMBOLS:
+        errors.append(ErrorWrapper(SymbolsError(), loc=(field)))
+
+    return symbols
+
 
+def parse_windows(v, field, errors):
+    windows = []
+
+    for window in v.split(","):
+        start_date, separator, end_date = window.partition(":")
+        if not separator:
+            errors.append(ErrorWrapper(WindowsError(), loc=(field)))
+            return windows
+
+        windows.append(parse_dates(start_date.strip(), end_date.strip(), errors))
+
+    if len(windows) > MAX_BATCH_WINDOWS:
+        errors.append(ErrorWrapper(WindowsError(), loc=(field)))
+
+    return windows
+
+
+def validated(parse, *args):
+    """ Runs a parse function and raises the errors it found """
+    errors = []
+    result = parse(*args, errors)
+    if errors:
+        raise RequestValidationError(errors=errors)
 
     return result
+
+
+def cross_validate_dates(start_date, end_date):
+    return validated(parse_dates, start_date, end_date)
+
+
+def date_format_validation(v, field):
+    return validated(parse_date, v, field)
@@ -11,3 +11,13 @@ class StatisticsResponse(BaseModel):
     """ Statistics Response Model """
     data: dict | None = None
     info: dict | None = None
+
+class BatchStatisticsResponse(BaseModel):
+    """ Batch Statistics Response Model """
+    data: dict | None = None
+    info: dict | None = None
+
+class AnalyticsResponse(BaseModel):
+    """ Analytics Response Model """
+    data: list = []
+    info: dict | None = None
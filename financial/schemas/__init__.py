@@ -1,2 +1,2 @@
-from .RequestSchemas import GetStatisticsParams, GetFinancialDataParams
+from .RequestSchemas import query_params, GetStatisticsParams, GetBatchStatisticsParams, GetAnalyticsParams, GetExportParams, GetFinancialDataParams
 from .ResponseSchemas import *
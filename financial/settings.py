@@ -1,6 +1,25 @@
+from functools import lru_cache
+
 from pydantic import BaseSettings
 
-class Settings(BaseSettings):
+class ServerSettings(BaseSettings):
+    """ Settings of gunicorn.conf.py, which does not need the database or API key settings """
+
+    # Worker processes of the API when served with gunicorn.conf.py. WEB_CONCURRENCY
+    # defaults to one worker by CPU. Workers that do not answer in WORKER_TIMEOUT
+    # seconds are restarted, and WORKER_MAX_REQUESTS restarts them after serving
+    # that many requests, 0 never does.
+    WEB_CONCURRENCY: int = 0
+    WORKER_TIMEOUT: int = 60
+    WORKER_KEEPALIVE: int = 5
+    WORKER_MAX_REQUESTS: int = 0
+
+    class Config:
+        """ Try to find an env file at eithr of defined locations here."""
+        env_file = '.env', '../.env'
+
+
+class Settings(ServerSettings):
     """ Settings class that maps the contents of '.env' file"""
 
     DATABASE_PORT: int
@@ -11,6 +30,55 @@ class Settings(BaseSettings):
     POSTGRES_HOSTNAME: str
     API_KEY: str
 
+    # Connection pool of the API. Every worker process keeps up to
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW connections open against Postgres.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = True
+
+    # Read replicas of the database, as comma separated host or host:port values. They
+    # must serve the same database with the same credentials as POSTGRES_HOSTNAME.
+    # Replicas are checked every DB_READ_CHECK_INTERVAL seconds, the ones that can
+    # not be reached or are more than DB_READ_MAX_LAG seconds behind are skipped.
+    # Reads go to POSTGRES_HOSTNAME when no replica can be used.
+    DB_READ_HOSTNAMES: str | None = None
+    DB_READ_MAX_LAG: float = 30
+    DB_READ_CHECK_INTERVAL: float = 5
+
+    # Number of server side prepared statements cached per connection. Set it to 0
+    # when connecting through a transaction pooler such as PgBouncer.
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    # Cache of API responses. Entries of a symbol are invalidated as soon as the
+    # ingester writes new data for it. CACHE_URL (redis://...) optionally shares
+    # the cache between workers. CACHE_MAX_AGE is sent to clients in Cache-Control.
+    CACHE_ENABLED: bool = True
+    CACHE_SIZE: int = 1024
+    CACHE_TTL: int = 3600
+    CACHE_MAX_AGE: int = 60
+    CACHE_URL: str | None = None
+
+    # Send a Server-Timing header with the database, serialization and total
+    # time of every response, so browsers and load testers can break down latency.
+    SERVER_TIMING: bool = False
+
+    # Keep a copy of financial_data in the memory of every worker to answer the
+    # requests of a single symbol. It takes about 28 bytes by entry and is
+    # refreshed as the ingester writes.
+    COLUMN_STORE_ENABLED: bool = False
+
+    # Number of rows read from the database at a time by the export endpoint.
+    # Every batch becomes a chunk of the response.
+    EXPORT_BATCH_SIZE: int = 10000
+
     class Config:
         """ Try to find an env file at eithr of defined locations here."""
         env_file = '.env', '../.env'
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """ Settings read from the environment on first use, so importing modules does not require them """
+    return Settings()
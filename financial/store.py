@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from financial import models
+from financial.crud import EMPTY_STATISTICS, Statistics
+
+# Entry of a page, with the columns of the rows returned by crud.get_financial_data_by_symbol.
+Entry = namedtuple("Entry", "symbol date open_price close_price volume")
+
+# Rows read from the database at a time when loading all the entries.
+LOAD_BATCH_SIZE = 10000
+
+
+class Series:
+    '''
+    Entries of a symbol as contiguous columns sorted by date. Dates are kept
+    as ordinals so ranges are found with a binary search over a plain array.
+
+    Arguments:
+        rows (list[tuple]): (date, open_price, close_price, volume) tuples sorted by date.
+    '''
+
+    __slots__ = ("dates", "open_prices", "close_prices", "volumes")
+
+    def __init__(self, rows: list[tuple]):
+        dates, open_prices, close_prices, volumes = zip(*rows) if rows else ((), (), (), ())
+
+        self.dates = np.fromiter((day.toordinal() for day in dates), dtype=np.int32, count=len(dates))
+        self.open_prices = np.array(open_prices, dtype=np.float64)
+        self.close_prices = np.array(close_prices, dtype=np.float64)
+        self.volumes = np.array(volumes, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self) -> int:
+        return self.dates.nbytes + self.open_prices.nbytes + self.close_prices.nbytes + self.volumes.nbytes
+
+    def range(self, start_date: date | None, end_date: date | None) -> tuple[int, int]:
+        """ Positions of the first entry from start_date and of the one after the last until end_date """
+        first = np.searchsorted(self.dates, start_date.toordinal(), "left") if start_date is not None else 0
+        last = np.searchsorted(self.dates, end_date.toordinal(), "right") if end_date is not None else len(self.dates)
+
+        return int(first), int(max(first, last))
+
+    def entries(self, symbol: str, first: int, last: int) -> list[Entry]:
+        return [
+            Entry(symbol, date.fromordinal(day), open_price, close_price, volume)
+            for day, open_price, close_price, volume in zip(self.dates[first:last].tolist(), self.open_prices[first:last].tolist(),
+                self.close_prices[first:last].tolist(), self.volumes[first:last].tolist())
+        ]
+
+
+class ColumnStore:
+    '''
+    Copy of financial_data in memory, one Series by symbol, that answers the
+    requests of a single symbol without going to the database.
+
+    The store is empty until `reload` reads all the entries. Afterwards `refresh`
+    reads again the entries of the symbols the ingester notifies. Functions
+    take the same arguments and return the same values as the ones of crud.
+
+    Arguments:
+        engine (AsyncEngine): Engine of the primary database, which replicas may lag behind.
+    '''
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.series = {}
+        self.loaded = False
+        self.loaded_at = None
+        self.refreshes = 0
+
+        # Reloads and refreshes run one at a time, so an older read never replaces a newer one.
+        self.lock = asyncio.Lock()
+
+    async def reload(self):
+        """ Reads all the entries """
+        columns = (models.FinancialData.symbol, models.FinancialData.date, models.FinancialData.open_price, models.FinancialData.close_price, models.FinancialData.volume)
+        query = select(*columns).order_by(models.FinancialData.symbol, models.FinancialData.date).execution_options(yield_per=LOAD_BATCH_SIZE)
+
+        start = time.perf_counter()
+        async with self.lock:
+            rows = {}
+            async with self.engine.connect() as connection:
+                async for partition in (await connection.stream(query)).partitions():
+                    for symbol, *values in partition:
+                        rows.setdefault(symbol, []).append(values)
+
+            self.series = {symbol: Series(symbol_rows) for symbol, symbol_rows in rows.items()}
+            self.loaded = True
+            self.loaded_at = time.time()
+
+        logging.info(f"Column store loaded {self.status()['rows']} entries of {len(self.series)} symbols in {time.perf_counter() - start:.1f}s")
+
+    async def refresh(self, symbol: str | None):
+        """ Reads again the entries of a symbol, or all of them if symbol is None """
+        if symbol is None:
+            return await self.reload()
+
+        query = select(models.FinancialData.date, models.FinancialData.open_price, models.FinancialData.close_price, models.FinancialData.volume) \
+            .where(models.FinancialData.symbol == symbol).order_by(models.FinancialData.date)
+
+        async with self.lock:
+            async with self.engine.connect() as connection:
+                rows = (await connection.execute(query)).all()
+
+            if rows:
+                self.series[symbol] = Series(rows)
+            else:
+                self.series.pop(symbol, None)
+            self.refreshes += 1
+
+    def serves(self, symbol: str | None) -> bool:
+        """ Whether the requests of symbol can be answered by the store """
+        return self.loaded and symbol is not None
+
+    def count_financial_data(self, symbol: str, start_date: date, end_date: date) -> int:
+        """ Same as crud.count_financial_data """
+        series = self.series.get(symbol)
+        if series is None:
+            return 0
+
+        first, last = series.range(start_date, end_date)
+        return last - first
+
+    def get_financial_data_by_symbol(self, symbol: str, start_date: date, end_date: date, offset: int = 0, limit: int = 10, after: tuple[date, str] | None = None) -> list[Entry]:
+        """ Same as crud.get_financial_data_by_symbol """
+        series = self.series.get(symbol)
+        if series is None:
+            return []
+
+        first, last = series.range(start_date, end_date)
+
+        if after is not None:
+            # Entries after (date, symbol): from the day after, or from the same day if the symbol sorts after.
+            after_date, after_symbol = after
+            side = "left" if symbol > after_symbol else "right"
+            first = max(first, int(np.searchsorted(series.dates, after_date.toordinal(), side)))
+        else:
+            first += offset
+
+        return series.entries(symbol, first, min(last, first + limit))
+
+    def get_financial_statistics(self, symbol: str, start_date: date, end_date: date) -> Statistics:
+        """ Same as crud.get_financial_statistics, also used instead of crud.get_financial_statistics_rollup """
+        series = self.series.get(symbol)
+        if series is None:
+            return EMPTY_STATISTICS
+
+        first, last = series.range(start_date, end_date)
+        if first == last:
+            return EMPTY_STATISTICS
+
+        return Statistics(last - first, float(series.open_prices[first:last].mean()), float(series.close_prices[first:last].mean()),
+            float(series.volumes[first:last].mean()))
+
+    def status(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "loaded_at": self.loaded_at,
+            "symbols": len(self.series),
+            "rows": sum(len(series) for series in self.series.values()),
+            "bytes": sum(series.nbytes for series in self.series.values()),
+            "refreshes": self.refreshes
+        }
@@ -1,15 +1,33 @@
+from __future__ import annotations
+
 import os, sys
+import argparse
+import csv
 import datetime
+import hashlib
+import io
 import logging
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+import ijson
 import psycopg2
-import requests
 import json
 
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
 from datetime import datetime, date, timedelta
 from pydantic import BaseSettings
 
-# Somewhat prettier logs
-logging.basicConfig(format="%(asctime)s[%(levelname)s] - %(message)s ", datefmt="%d-%b-%y %H:%M:%S", level=logging.DEBUG)
+# requests is imported when the first HTTP session is created. Writing entries, as the
+# benchmarks and the rollup commands do, does not need it.
+if TYPE_CHECKING:
+    import requests
 
 
 class Settings(BaseSettings):
@@ -23,28 +41,244 @@ class Settings(BaseSettings):
     POSTGRES_HOSTNAME: str
     API_KEY: str
 
+    # AlphaVantage API access. API_REQUESTS_PER_MINUTE should match the quota of API_KEY.
+    API_URL: str = "https://www.alphavantage.co/query"
+    API_REQUESTS_PER_MINUTE: int = 5
+    API_TIMEOUT: float = 30
+    API_RETRIES: int = 3
+    FETCH_WORKERS: int = 4
+
+    # Raw API responses are kept in RESPONSE_CACHE_DIR, up to RESPONSE_CACHE_SIZE bytes,
+    # when it is set. See ResponseCache.
+    RESPONSE_CACHE_DIR: str | None = None
+    RESPONSE_CACHE_SIZE: int = 1024 * 1024 * 1024
+
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """ Settings read from the environment on first use, so importing this module does not require them """
+    return Settings()
+
+# Calendar days covered by the 100 entries of the compact output size of the API.
+COMPACT_OUTPUT_DAYS = 140
+
+# API responses bigger than this are kept in a temporary file instead of memory.
+RESPONSE_SPOOL_SIZE = 1024 * 1024
+
+# Share of max_bytes the response cache is evicted down to, so it is not scanned again
+# on every put once full, and age after which a temporary file of a put is left over
+# by an interrupted run and removed.
+RESPONSE_CACHE_EVICT_TO = 0.9
+RESPONSE_CACHE_STALE_SECONDS = 3600
+
+# Function of the API that returns the daily series.
+DAILY_SERIES_FUNCTION = "TIME_SERIES_DAILY_ADJUSTED"
+
+# HTTP statuses of API calls that are retried, and the wait before the first retry.
+# Every retry waits twice as long as the previous one.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_BACKOFF = 1.0
+
+# Channel notified with the symbol of every batch of entries written. The API listens
+# to it to invalidate its cached responses.
+INVALIDATION_CHANNEL = "financial_data_changed"
+
+
+class CSVStream:
+    '''
+    Read only file like object that renders entries as CSV lines as they are read,
+    so COPY can consume them without building the whole file in memory.
+
+    Arguments:
+        entries (Iterable[tuple]): Rows to render.
+    '''
+
+    def __init__(self, entries: Iterable[tuple]):
+        self.entries = iter(entries)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ""
+
+    def read(self, size: int = -1) -> str:
+        while self.entries is not None and (size < 0 or len(self.pending) < size):
+            entry = next(self.entries, None)
+            if entry is None:
+                self.entries = None
+                break
 
+            self.writer.writerow(entry)
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
 
+        if size < 0:
+            size = len(self.pending)
 
-def persist_data(db: psycopg2.extensions.connection, symbol: str, daily_series: dict[str, dict]):
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+def notify_changes(cursor: psycopg2.extensions.cursor, symbol: str, count: int):
+    '''
+    Notifies listeners that entries of a symbol were written. The notification
+    is only delivered if the current transaction commits.
+
+    Arguments:
+        cursor (psycopg2.extensions.cursor): Cursor of the transaction that wrote the entries.
+        symbol (str): The symbol written.
+        count (int): Number of entries written. Nothing is notified if zero.
+    '''
+    if count > 0:
+        cursor.execute("SELECT pg_notify(%s, %s);", (INVALIDATION_CHANNEL, symbol.strip()))
+
+
+def create_partitions(db: psycopg2.extensions.connection, from_date, to_date):
+    '''
+    Creates the missing yearly partitions of financial_data between two dates.
+
+    Runs in a transaction of its own, committed before the entries are written.
+    Creating a partition locks financial_data, so ingesters writing other
+    symbols would otherwise wait for, or deadlock with, the whole write.
+
+    Arguments:
+        db (psycopg2.connection): Database connection the entries are written with.
+        from_date (date | str): First date to store. Nothing is created if None.
+        to_date (date | str): Last date to store.
+    '''
+    if from_date is None:
+        return
+
+    cursor = db.cursor()
+
+    try:
+        cursor.execute("SELECT create_financial_data_partitions(%s, %s);", (from_date, to_date))
+    except Exception:
+        db.rollback()
+        raise
+    else:
+        db.commit()
+
+
+def refresh_rollup(cursor: psycopg2.extensions.cursor, symbol: str, from_date):
+    '''
+    Recomputes the running totals of a symbol from a date on. Totals before that
+    date are kept and used as the starting point, so only the rows that may
+    have changed are written.
+
+    Arguments:
+        cursor (psycopg2.extensions.cursor): Cursor of the transaction that wrote the entries.
+        symbol (str): The symbol written.
+        from_date (date | str): Earliest date written.
+    '''
+    cursor.execute("""
+    WITH base AS (
+        SELECT cum_open_price, cum_close_price, cum_volume, cum_count
+        FROM financial_data_rollup
+        WHERE symbol = %(symbol)s AND date < %(from_date)s
+        ORDER BY date DESC
+        LIMIT 1
+    )
+    INSERT INTO financial_data_rollup (symbol, date, cum_open_price, cum_close_price, cum_volume, cum_count)
+    SELECT f.symbol, f.date,
+        COALESCE(base.cum_open_price, 0) + SUM(f.open_price::numeric) OVER w,
+        COALESCE(base.cum_close_price, 0) + SUM(f.close_price::numeric) OVER w,
+        COALESCE(base.cum_volume, 0) + SUM(f.volume::numeric) OVER w,
+        COALESCE(base.cum_count, 0) + COUNT(*) OVER w
+    FROM financial_data f LEFT JOIN base ON true
+    WHERE f.symbol = %(symbol)s AND f.date >= %(from_date)s
+    WINDOW w AS (ORDER BY f.date)
+    ON CONFLICT (symbol, date)
+    DO UPDATE
+    SET cum_open_price = EXCLUDED.cum_open_price, cum_close_price = EXCLUDED.cum_close_price,
+        cum_volume = EXCLUDED.cum_volume, cum_count = EXCLUDED.cum_count;
+    """, {"symbol": symbol.strip(), "from_date": from_date})
+
+
+# Running totals of every entry computed from scratch, used to check and rebuild financial_data_rollup.
+ROLLUP_TOTALS_QUERY = """
+SELECT symbol, date,
+    SUM(open_price::numeric) OVER w AS cum_open_price,
+    SUM(close_price::numeric) OVER w AS cum_close_price,
+    SUM(volume::numeric) OVER w AS cum_volume,
+    COUNT(*) OVER w AS cum_count
+FROM financial_data
+WINDOW w AS (PARTITION BY symbol ORDER BY date)
+"""
+
+
+def check_rollups(db: psycopg2.extensions.connection) -> list[str]:
+    '''
+    Compares the running totals with the ones computed from the entries.
+
+    Arguments:
+        db (psycopg2.connection): Database connection handler.
+
+    Returns:
+        symbols (list[str]): Symbols whose running totals do not match their entries.
+    '''
+    cursor = db.cursor()
+    cursor.execute(f"""
+    SELECT DISTINCT COALESCE(t.symbol, r.symbol)
+    FROM ({ROLLUP_TOTALS_QUERY}) t
+    FULL JOIN financial_data_rollup r ON r.symbol = t.symbol AND r.date = t.date
+    WHERE (t.cum_open_price, t.cum_close_price, t.cum_volume, t.cum_count)
+        IS DISTINCT FROM (r.cum_open_price, r.cum_close_price, r.cum_volume, r.cum_count)
+    ORDER BY 1;
+    """)
+    symbols = [symbol for (symbol,) in cursor.fetchall()]
+    db.rollback()
+
+    return symbols
+
+
+def rebuild_rollups(db: psycopg2.extensions.connection):
+    '''
+    Recomputes all the running totals from the entries.
+
+    Arguments:
+        db (psycopg2.connection): Database connection handler.
+    '''
+    cursor = db.cursor()
+
+    try:
+        cursor.execute("DELETE FROM financial_data_rollup;")
+        cursor.execute(f"""
+        INSERT INTO financial_data_rollup (symbol, date, cum_open_price, cum_close_price, cum_volume, cum_count)
+        {ROLLUP_TOTALS_QUERY};
+        """)
+        # Statistics computed from the old totals may be cached.
+        cursor.execute("SELECT pg_notify(%s, symbol) FROM (SELECT DISTINCT symbol FROM financial_data) s;", (INVALIDATION_CHANNEL,))
+    except Exception:
+        db.rollback()
+        logging.error("Rebuilding the running totals failed")
+        raise
+    else:
+        db.commit()
+
+
+def persist_data(db: psycopg2.extensions.connection, symbol: str, entries: Iterable[tuple]) -> int:
     '''
     Stores in DB the daily stock information provided for every symbol.
 
     Arguments:
         db (psycopg2.connection): Database connection handler.
         symbol (str): The symbol that identifies company behind the stocks.
-        daily_series (dict[str, dict]): Dictionary of daily movement of stock information.
+        entries (Iterable[tuple]): (symbol, date, open, close, volume) tuples, as yielded by iter_daily_entries.
+
+    Returns:
+        count (int): Number of entries inserted or changed.
     '''
 
     logging.debug(f"Persisting data for {symbol}")
 
-    # We use list comprehension to create a list of values from the source dictionar.
-    data = [(symbol.strip(), date, values["1. open"], values["4. close"], values["6. volume"]) for (date, values) in daily_series.items()]
+    # Dates are ISO strings, so they sort like dates.
+    entries = list(entries)
+    dates = [entry[1] for entry in entries]
+    from_date = min(dates, default=None)
+    create_partitions(db, from_date, max(dates, default=None))
 
     cursor = db.cursor()
 
@@ -55,8 +289,16 @@ def persist_data(db: psycopg2.extensions.connection, symbol: str, daily_series:
         VALUES (%s, %s, %s, %s, %s)
         ON CONFLICT (symbol, date)
         DO UPDATE
-        SET open_price = EXCLUDED.open_price, close_price = EXCLUDED.close_price, volume = EXCLUDED.volume;
-        """, data)
+        SET open_price = EXCLUDED.open_price, close_price = EXCLUDED.close_price, volume = EXCLUDED.volume
+        WHERE (financial_data.open_price, financial_data.close_price, financial_data.volume)
+            IS DISTINCT FROM (EXCLUDED.open_price, EXCLUDED.close_price, EXCLUDED.volume);
+        """, entries)
+
+        # Entries that already exist with the same values are not written again.
+        count = cursor.rowcount
+        if count > 0:
+            refresh_rollup(cursor, symbol, from_date)
+        notify_changes(cursor, symbol, count)
     except Exception:
         db.rollback()
         logging.error("Writing records for '{symbol}' failed")
@@ -64,18 +306,607 @@ def persist_data(db: psycopg2.extensions.connection, symbol: str, daily_series:
     else:
         db.commit()
 
+    return count
+
+
+def persist_data_bulk(db: psycopg2.extensions.connection, symbol: str, entries: Iterable[tuple]) -> int:
+    '''
+    Stores in DB the daily stock information provided for every symbol using COPY.
+
+    Entries are streamed into a temporary staging table and then merged into
+    financial_data with a single INSERT ... SELECT, so the number of round trips
+    does not depend on the number of entries.
+
+    Arguments:
+        db (psycopg2.connection): Database connection handler.
+        symbol (str): The symbol that identifies company behind the stocks.
+        entries (Iterable[tuple]): (symbol, date, open, close, volume) tuples, as yielded by iter_daily_entries.
+
+    Returns:
+        count (int): Number of entries inserted or changed.
+    '''
+
+    logging.debug(f"Bulk persisting data for {symbol}")
+
+    # COPY reads the entries as CSV from a file like object.
+    buffer = CSVStream(entries)
+
+    cursor = db.cursor()
+
+    try:
+        # The staging table lives as long as the connection. Its rows are kept through the commits
+        # between the COPY and the merge, so it is emptied before every COPY.
+        cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS financial_data_staging
+        (LIKE financial_data INCLUDING DEFAULTS)
+        ON COMMIT PRESERVE ROWS;
+        TRUNCATE financial_data_staging;
+        """)
+        cursor.copy_expert("""
+        COPY financial_data_staging (symbol, date, open_price, close_price, volume)
+        FROM STDIN WITH (FORMAT csv)
+        """, buffer)
+        cursor.execute("SELECT MIN(date), MAX(date) FROM financial_data_staging;")
+        from_date, to_date = cursor.fetchone()
+
+        # Creating the staging table locked financial_data, which would block the partitions.
+        db.commit()
+        create_partitions(db, from_date, to_date)
+
+        cursor.execute("""
+        INSERT INTO financial_data (symbol, date, open_price, close_price, volume)
+        SELECT symbol, date, open_price, close_price, volume FROM financial_data_staging
+        ON CONFLICT (symbol, date)
+        DO UPDATE
+        SET open_price = EXCLUDED.open_price, close_price = EXCLUDED.close_price, volume = EXCLUDED.volume
+        WHERE (financial_data.open_price, financial_data.close_price, financial_data.volume)
+            IS DISTINCT FROM (EXCLUDED.open_price, EXCLUDED.close_price, EXCLUDED.volume);
+        """)
+
+        count = cursor.rowcount
+        if count > 0:
+            refresh_rollup(cursor, symbol, from_date)
+        notify_changes(cursor, symbol, count)
+    except Exception:
+        db.rollback()
+        logging.error(f"Bulk writing records for '{symbol}' failed")
+        raise
+    else:
+        db.commit()
+
+    return count
+
+
+
+
+class TokenBucket:
+    '''
+    Thread safe token bucket used to keep API calls within the per minute quota.
+
+    Arguments:
+        rate_per_minute (int): Number of tokens added to the bucket every minute.
+        capacity (int): Maximum number of tokens that can be used in a burst.
+    '''
+
+    def __init__(self, rate_per_minute: int, capacity: int = 1):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        ''' Blocks until a token is available and takes it. '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class FetchError(Exception):
+    '''
+    Raised when the API does not return the daily series of a symbol.
+
+    Arguments:
+        message (str): Description of the error.
+        retryable (bool): Whether calling the API again may succeed.
+    '''
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def last_trading_day(day: date) -> date:
+    ''' The day itself on weekdays, the Friday before on weekends. Holidays are not known. '''
+    return day - timedelta(days=max(0, day.weekday() - 4))
+
+
+class ResponseCache:
+    '''
+    Raw daily series responses of the API kept on disk, so runs that need the
+    same data again do not spend the API quota on it.
+
+    A response is stored under a hash of the API function, the symbol and the
+    output size, in a file named after the trading day it was retrieved on, as
+    the API only adds entries once a day. A full response also serves compact
+    calls, as it has all their entries. Files are read and written as they are,
+    and the least recently used ones are removed when the cache grows over
+    max_bytes. Files are written to a temporary name first, so threads and
+    processes can share the directory.
+
+    The size of the cache is counted with a scan of the directory on the first
+    put, and then kept up to date with the files written. The directory is
+    only scanned again to evict files once over max_bytes, and files are
+    evicted until it is well below it, so puts do not walk it every time.
+    Writes of other processes are found by those scans.
+
+    In replay mode the API is never called: calls without a cached response
+    fail, and the latest response cached before the trading day is used when
+    there is none of the day, so runs can be repeated offline.
+
+    Arguments:
+        directory (str): Folder of the cached responses. Created if missing.
+        max_bytes (int): Size of the responses kept.
+        replay (bool): Only serve cached responses.
+    '''
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024, replay: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        # Bytes in the directory as counted by the last scan plus the files written since. None until scanned.
+        self.size = None
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def folder(self, symbol: str, output_size: str) -> str:
+        key = hashlib.sha256(f"{DAILY_SERIES_FUNCTION}:{symbol.strip()}:{output_size}".encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def find(self, symbol: str, output_size: str, day: date) -> str | None:
+        ''' Path of the cached response of a call, None if there is none '''
+        sizes = (output_size, "full") if output_size == "compact" else (output_size,)
+        name = f"{day.isoformat()}.json"
+
+        for size in sizes:
+            path = os.path.join(self.folder(symbol, size), name)
+            if os.path.exists(path):
+                return path
+
+        if self.replay:
+            # The latest response before the day. Files are named after ISO dates, so they sort like dates.
+            earlier = []
+            for size in sizes:
+                folder = self.folder(symbol, size)
+                if os.path.isdir(folder):
+                    earlier += [(cached, os.path.join(folder, cached)) for cached in os.listdir(folder) if cached.endswith(".json") and cached < name]
+            if earlier:
+                return max(earlier)[1]
+
+        return None
+
+    def get(self, symbol: str, output_size: str, day: date):
+        '''
+        Opens the cached response of a call.
+
+        Arguments:
+            symbol (str): The symbol of the call.
+            output_size (str): Either "compact" or "full".
+            day (date): Trading day of the call.
+
+        Returns:
+            body (BufferedReader | None): The response, positioned at the start. None if it is not cached.
+        '''
+        path = self.find(symbol, output_size, day)
+        body = None
+
+        try:
+            if path is not None:
+                body = open(path, "rb")
+                # Recently used files are the last ones evicted.
+                os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process since it was found. The open file can still be read.
+            pass
+
+        with self.lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return body
+
+    def put(self, symbol: str, output_size: str, day: date, body):
+        '''
+        Stores the response of a call.
+
+        Arguments:
+            symbol (str): The symbol of the call.
+            output_size (str): Either "compact" or "full".
+            day (date): Trading day of the call.
+            body: Binary file like object with the response, positioned at the start. It is positioned at the start again afterwards.
+        '''
+        folder = self.folder(symbol, output_size)
+        os.makedirs(folder, exist_ok=True)
+
+        path = os.path.join(folder, f"{day.isoformat()}.json")
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(temporary, "wb") as f:
+            shutil.copyfileobj(body, f)
+            written = f.tell()
+        try:
+            # A response of the same call is replaced, only the difference is added.
+            written -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(temporary, path)
+        body.seek(0)
+
+        with self.lock:
+            if self.size is not None:
+                self.size += written
+            full = self.size is None or self.size > self.max_bytes
+
+        if full:
+            self.evict()
+
+    def evict(self):
+        '''
+        Scans the directory to count the size of the cache, and removes the least
+        recently used responses while it is over the share RESPONSE_CACHE_EVICT_TO
+        of max_bytes. Temporary files left over by interrupted puts are removed too.
+        '''
+        files = []
+        stale = time.time() - RESPONSE_CACHE_STALE_SECONDS
+
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".json"):
+                        files.append((stat.st_mtime, stat.st_size, path))
+                    elif name.endswith(".tmp") and stat.st_mtime < stale:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+
+        size = sum(file_size for _, file_size, _ in files)
+        if size > self.max_bytes:
+            for _, file_size, path in sorted(files):
+                if size <= self.max_bytes * RESPONSE_CACHE_EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+
+        with self.lock:
+            self.size = size
+
+
+def create_http_session(workers: int | None = None) -> requests.Session:
+    '''
+    Creates an HTTP session that keeps connections alive between calls. Failed
+    calls are not retried by the session but by fetch_daily_series, so every
+    retry goes through the rate limiter.
+
+    Arguments:
+        workers (int | None): Number of threads sharing the session. Defaults to FETCH_WORKERS.
+
+    Returns:
+        session (requests.Session): Session to be used for API calls.
+    '''
+    import requests
+
+    from requests.adapters import HTTPAdapter
+
+    workers = workers if workers is not None else get_settings().FETCH_WORKERS
+    adapter = HTTPAdapter(max_retries=0, pool_connections=1, pool_maxsize=workers)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def download_daily_series(session: requests.Session, url: str, params: dict, timeout: float, symbol: str):
+    '''
+    Makes one API call for the daily series of a symbol. See fetch_daily_series.
+
+    Returns:
+        body (SpooledTemporaryFile): Raw JSON response, positioned at the start. The caller closes it.
+
+    Raises:
+        FetchError: If the response has no daily series. Retryable for connection errors,
+            429/5xx responses and the message the API answers with over the quota.
+    '''
+    import requests
+
+    body = tempfile.SpooledTemporaryFile(max_size=RESPONSE_SPOOL_SIZE)
+
+    try:
+        with session.get(url, params=params, timeout=timeout, stream=True) as response:
+
+            if response.status_code != 200:
+                raise FetchError(f"API call for '{symbol}' failed with HTTP status {response.status_code}", retryable=response.status_code in RETRY_STATUSES)
+
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                body.write(chunk)
+    except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        body.close()
+        raise FetchError(f"API call for '{symbol}' failed: {e}", retryable=True) from e
+    except FetchError:
+        body.close()
+        raise
+
+    #NOTE: This API doesn't handle HTTPS codes correctly. Errors like a wrong symbol or a
+    # exceeded quota are returned with status 200 and a short message instead of the daily
+    # series, which otherwise comes right after the small "Meta Data" object.
+    body.seek(0)
+    head = body.read(4096)
+    body.seek(0)
+
+    if b'"Time Series (Daily)"' not in head:
+        body.close()
+        # Over the quota the message comes as "Note" or "Information", a wrong symbol as "Error Message".
+        retryable = b'"Note"' in head or b'"Information"' in head
+        raise FetchError(f"API call for '{symbol}' returned no data: {head.decode(errors='replace')}", retryable=retryable)
+
+    return body
+
+
+def fetch_daily_series(session: requests.Session, rate_limiter: TokenBucket, symbol: str, output_size: str = "compact", api_url: str | None = None,
+        cache: ResponseCache | None = None, retries: int | None = None):
+    '''
+    Calls the Alpha Vantage REST API to retrieve the daily series of one symbol.
+
+    The response is downloaded in chunks into a spooled temporary file, so
+    big responses go to disk instead of memory. Use iter_daily_entries to
+    parse it. Responses in the cache are returned without calling the API or
+    waiting for the rate limiter, and the ones retrieved are added to it.
+
+    Calls that fail with a connection error, a 429/5xx status or the quota
+    message of the API are retried with exponential backoff. Every attempt
+    waits for the rate limiter, as every one counts against the quota.
 
+    Arguments:
+        session (requests.Session): HTTP session used for the call.
+        rate_limiter (TokenBucket): Rate limiter shared by all the calls made with the API key.
+        symbol (str): The symbol to retrieve.
+        output_size (str): Either "compact" (last 100 entries) or "full".
+        api_url (str | None): URL of the API. Defaults to API_URL.
+        cache (ResponseCache | None): Cache of the responses.
+        retries (int | None): Number of retries of a failed call. Defaults to API_RETRIES.
+
+    Returns:
+        body (SpooledTemporaryFile): Raw JSON response, positioned at the start. The caller closes it.
+
+    Raises:
+        FetchError: If the response has no daily series after the retries, or it is not cached in replay mode.
+    '''
+    day = last_trading_day(date.today())
+    if cache is not None:
+        body = cache.get(symbol, output_size, day)
+        if body is not None:
+            return body
+        if cache.replay:
+            raise FetchError(f"No cached response for '{symbol}' to replay")
+
+    settings = get_settings()
+    params = {
+        "function": DAILY_SERIES_FUNCTION,
+        "symbol": symbol,
+        "outputsize": output_size,
+        "apikey": settings.API_KEY
+    }
 
+    retries = retries if retries is not None else settings.API_RETRIES
 
-def populate_database(db: psycopg2.extensions.connection, symbols: list[str]):
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+        rate_limiter.acquire()
+        try:
+            body = download_daily_series(session, api_url or settings.API_URL, params, settings.API_TIMEOUT, symbol)
+            break
+        except FetchError as e:
+            if not e.retryable or attempt == retries:
+                raise
+            logging.warning(f"Retrying '{symbol}' after: {e}")
+
+    if cache is not None:
+        cache.put(symbol, output_size, day, body)
+
+    return body
+
+
+def iter_daily_entries(body, symbol: str, date_start: date, date_end: date) -> Iterator[tuple]:
+    '''
+    Parses the daily series of an API response incrementally.
+
+    The API lists entries from the newest to the oldest, so parsing stops at
+    the first entry older than date_start and the rest of the response is
+    never read.
+
+    Arguments:
+        body: Binary file like object with the JSON response.
+        symbol (str): The symbol of the response.
+        date_start (date): First date to include.
+        date_end (date): Entries from this date onwards are excluded.
+
+    Yields:
+        (symbol, date, open, close, volume) tuples.
+    '''
+    symbol = symbol.strip()
+
+    # Dates are in ISO format, so they can be compared as strings.
+    first_date, end_date = date_start.isoformat(), date_end.isoformat()
+
+    for (entry_date, values) in ijson.kvitems(body, "Time Series (Daily)"):
+        if entry_date >= end_date:
+            continue
+        if entry_date < first_date:
+            break
+
+        yield (symbol, entry_date, values["1. open"], values["4. close"], values["6. volume"])
+
+
+def fetch_all_daily_series(symbols: list[str], output_size: str | dict[str, str] = "compact", workers: int | None = None, rate_limiter: TokenBucket = None, api_url: str | None = None,
+        cache: ResponseCache | None = None):
+    '''
+    Retrieves the daily series of many symbols concurrently.
+
+    Calls are spread over a pool of threads sharing a keep-alive HTTP session,
+    while the rate limiter keeps them within the API quota.
+
+    Arguments:
+        symbols (list[str]): The symbols to retrieve.
+        output_size (str | dict[str, str]): Either "compact" (last 100 entries) or "full". Can be set per symbol with a dictionary.
+        workers (int | None): Number of concurrent calls. Defaults to FETCH_WORKERS.
+        rate_limiter (TokenBucket): Rate limiter. Defaults to API_REQUESTS_PER_MINUTE.
+        api_url (str | None): URL of the API. Defaults to API_URL.
+        cache (ResponseCache | None): Cache of the responses.
+
+    Yields:
+        (symbol, body, error) tuples in the order calls finish. Either body or
+        error is None. See fetch_daily_series for the body.
+    '''
+    if workers is None:
+        workers = get_settings().FETCH_WORKERS
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(get_settings().API_REQUESTS_PER_MINUTE)
+
+    session = create_http_session(workers)
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        output_sizes = output_size if isinstance(output_size, dict) else dict.fromkeys(symbols, output_size)
+        futures = {executor.submit(fetch_daily_series, session, rate_limiter, symbol, output_sizes[symbol], api_url, cache): symbol for symbol in symbols}
+
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        # Calls that did not start yet are dropped if the caller stops early.
+        executor.shutdown(cancel_futures=True)
+        session.close()
+
+
+def get_high_water_marks(db: psycopg2.extensions.connection, symbols: list[str]) -> dict[str, date]:
+    '''
+    Retrieves the date of the latest entry stored for every symbol with a single query.
+
+    Arguments:
+        db (psycopg2.extensions.connection): Database connection handler.
+        symbols (list[str]): The symbols to look up.
+
+    Returns:
+        high_water_marks (dict[str, date]): Latest date by symbol. Symbols without entries are not included.
+    '''
+    cursor = db.cursor()
+    cursor.execute("""
+    SELECT symbol, MAX(date) FROM financial_data
+    WHERE symbol = ANY(%s)
+    GROUP BY symbol;
+    """, ([symbol.strip() for symbol in symbols],))
+    high_water_marks = dict(cursor.fetchall())
+
+    # Don't keep the transaction open while calling the API.
+    db.rollback()
+
+    return high_water_marks
+
+
+def choose_output_size(date_start: date, date_end: date) -> str:
+    '''
+    Chooses the smallest API output size that covers the requested dates.
+    The compact output has the last 100 trading days, about 140 calendar days.
+
+    Arguments:
+        date_start (date): First date needed.
+        date_end (date): Date the data is needed until.
+
+    Returns:
+        output_size (str): Either "compact" or "full".
+    '''
+    return "compact" if (date_end - date_start) < timedelta(days=COMPACT_OUTPUT_DAYS) else "full"
+
+
+def get_start_dates(db: psycopg2.extensions.connection, symbols: list[str], date_end: date, full: bool = False) -> dict[str, date]:
+    '''
+    Chooses the first date to retrieve of every symbol: the day after its latest
+    stored entry, or for symbols without entries the start of their history if
+    full, or two weeks ago otherwise.
+
+    Arguments:
+        db (psycopg2.extensions.connection): Database connection handler.
+        symbols (list[str]): The symbols to retrieve.
+        date_end (date): Date the data is needed until.
+        full (bool): Retrieve the whole history of symbols that have no entries yet instead of the last two weeks.
+
+    Returns:
+        start_dates (dict[str, date]): First date by symbol. Symbols already up to date are not included.
+    '''
+    if full:
+        date_start = date.min
+    else:
+        last_week = date_end - timedelta(weeks=2)
+        date_start = last_week - timedelta(days=last_week.weekday())
+
+    # Continue every symbol from the day after its latest stored entry.
+    high_water_marks = get_high_water_marks(db, symbols)
+    start_dates = {}
+    for symbol in symbols:
+        last_date = high_water_marks.get(symbol.strip())
+        symbol_start = last_date + timedelta(days=1) if last_date is not None else date_start
+
+        if symbol_start < date_end:
+            start_dates[symbol] = symbol_start
+        else:
+            logging.debug(f"'{symbol}' is up to date")
+
+    return start_dates
+
+
+def populate_database(db: psycopg2.extensions.connection, symbols: list[str], bulk: bool = False, full: bool = False, workers: int | None = None, api_url: str | None = None,
+        cache: ResponseCache | None = None):
     '''
     Calls the Alpha Vantage REST API to retrieve the daily series of entries
     for every symbol specified as parameter. After parsing the response data
     And stores the parsed data in the database
 
+    Only entries newer than the latest one already stored for a symbol are
+    retrieved, so repeated runs only write what changed since the last one.
+
     Arguments:
         db (psycopg2.extensions.connection): Database connection handler.
         symbols (list[str]): a list of strings containing the symbols to process.
+        bulk (bool): Store entries with COPY instead of one INSERT per entry.
+        full (bool): Retrieve the whole history of symbols that have no entries yet instead of the last two weeks.
+        workers (int | None): Number of concurrent API calls. Defaults to FETCH_WORKERS.
+        api_url (str | None): URL of the API. Defaults to API_URL.
+        cache (ResponseCache | None): Cache of the API responses.
     '''
 
     # Return if symbols is empty
@@ -83,32 +914,280 @@ def populate_database(db: psycopg2.extensions.connection, symbols: list[str]):
         logging.debug("Nothing to process")
         return
 
-    # Define the date range used to process data
     date_end = date.today()
-    last_week = date_end - timedelta(weeks=2)
-    date_start = last_week - timedelta(days=last_week.weekday())
+    start_dates = get_start_dates(db, symbols, date_end, full)
 
+    output_sizes = {symbol: choose_output_size(symbol_start, date_end) for (symbol, symbol_start) in start_dates.items()}
+    persist = persist_data_bulk if bulk else persist_data
 
-    logging.debug(f"Processing data from {date_start} until {date_end}")
+    logging.debug(f"Processing data of {len(start_dates)} symbols until {date_end}")
 
-    # Retrieve stock information for every simbol. Processe it and store it in DB
-    for symbol in symbols:
+    # Time spent writing to the database, used to report the throughput of the persist mode.
+    persisted_rows = 0
+    persist_seconds = 0.0
 
-        url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={symbol}&outputsize=compact&apikey={settings.API_KEY}"
+    # Retrieve stock information for every simbol concurrently. The connection is not
+    # shared between threads, so each series is processed and stored here as it arrives.
+    for symbol, body, error in fetch_all_daily_series(list(start_dates), output_sizes, workers, api_url=api_url, cache=cache):
 
-        response = requests.get(url)
+        if error is not None:
+            logging.warning(f"Skipping '{symbol}': {error}")
+            continue
 
-        if response.status_code == 200:
-            daily_series = response.json()["Time Series (Daily)"]
-            # Filter entries according to date range
-            filtered_daily_series = dict(filter(lambda elem: ( date_start <= datetime.strptime(elem[0], '%Y-%m-%d').date() < date_end), daily_series.items()))
+        # Entries go straight from the parser into the database.
+        with body:
+            start = time.perf_counter()
+            persisted_rows += persist(db, symbol, iter_daily_entries(body, symbol, start_dates[symbol], date_end))
+            persist_seconds += time.perf_counter() - start
 
-            persist_data(db, symbol, filtered_daily_series)
+    if cache is not None:
+        logging.info(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+
+    if persist_seconds > 0:
+        logging.info(f"Persisted {persisted_rows} rows in {persist_seconds:.3f}s ({persisted_rows / persist_seconds:.1f} rows/sec, {'bulk' if bulk else 'insert'} mode)")
 
-        else:
-            #TODO: handle this error better
-            #NOTE: This API doesn't handle HTTPS codes correctly. Even when errors ocur like passing no API KEY the response status code is 200
-            logging.warning("API call failed with HTTP status {0}", response.status_code)
+
+def get_backfill_progress(db: psycopg2.extensions.connection, backfill: str) -> set[str]:
+    '''
+    Retrieves the symbols a backfill already stored.
+
+    Arguments:
+        db (psycopg2.extensions.connection): Database connection handler.
+        backfill (str): Name of the backfill.
+
+    Returns:
+        symbols (set[str]): Symbols stored by the backfill. Symbols that failed are not included.
+    '''
+    cursor = db.cursor()
+    cursor.execute("SELECT symbol FROM backfill_progress WHERE backfill = %s AND status = 'done';", (backfill,))
+    symbols = {symbol for (symbol,) in cursor.fetchall()}
+    db.rollback()
+
+    return symbols
+
+
+def save_backfill_progress(db: psycopg2.extensions.connection, backfill: str, result: dict):
+    '''
+    Records the outcome of a symbol of a backfill.
+
+    Arguments:
+        db (psycopg2.extensions.connection): Database connection handler.
+        backfill (str): Name of the backfill.
+        result (dict): Outcome of the symbol, as returned by backfill_symbol.
+    '''
+    cursor = db.cursor()
+
+    try:
+        cursor.execute("""
+        INSERT INTO backfill_progress (backfill, symbol, status, rows, fetch_seconds, persist_seconds, error)
+        VALUES (%(backfill)s, %(symbol)s, %(status)s, %(rows)s, %(fetch_seconds)s, %(persist_seconds)s, %(error)s)
+        ON CONFLICT (backfill, symbol)
+        DO UPDATE
+        SET status = EXCLUDED.status, rows = EXCLUDED.rows, fetch_seconds = EXCLUDED.fetch_seconds,
+            persist_seconds = EXCLUDED.persist_seconds, error = EXCLUDED.error, updated_at = now();
+        """, {**result, "backfill": backfill, "symbol": result["symbol"].strip()})
+    except Exception:
+        db.rollback()
+        raise
+    else:
+        db.commit()
+
+
+# Connection, HTTP session and rate limiter of a backfill worker process, see init_backfill_worker.
+backfill_worker = {}
+
+
+def init_backfill_worker(dsn: str | None, requests_per_minute: float, log_level: int, cache: tuple | None = None):
+    '''
+    Sets up a backfill worker process with its own database connection.
+
+    Arguments:
+        dsn (str | None): Connection string of the database. Defaults to the environment settings.
+        requests_per_minute (float): Share of the API quota of the process.
+        log_level (int): Level of the logs of the process.
+        cache (tuple | None): directory, max_bytes and replay of the ResponseCache of the process.
+    '''
+    configure_logging(log_level)
+
+    backfill_worker.update(dsn=dsn, db=None, session=create_http_session(1), rate_limiter=TokenBucket(requests_per_minute),
+        cache=ResponseCache(*cache) if cache is not None else None)
+    backfill_connection()
+
+
+def backfill_connection() -> psycopg2.extensions.connection:
+    '''
+    Returns the database connection of a backfill worker process, connecting
+    again if it was closed, so a dropped connection only fails the symbol it
+    was writing.
+
+    Returns:
+        db (psycopg2.connection): Database connection handler.
+    '''
+    db = backfill_worker["db"]
+
+    if db is None or db.closed:
+        dsn = backfill_worker["dsn"]
+        db = psycopg2.connect(dsn) if dsn is not None else setup_db_connection()
+        if db is None:
+            raise RuntimeError("Backfill worker could not connect to the database")
+        backfill_worker["db"] = db
+
+    return db
+
+
+def backfill_symbol(backfill: str, symbol: str, date_start: date, date_end: date, bulk: bool = True, api_url: str | None = None) -> dict:
+    '''
+    Retrieves and stores the entries of one symbol in a backfill worker process,
+    and records the outcome. Errors of the symbol are recorded instead of raised,
+    so they do not stop the backfill.
+
+    Arguments:
+        backfill (str): Name of the backfill.
+        symbol (str): The symbol to retrieve.
+        date_start (date): First date to store.
+        date_end (date): Entries from this date onwards are excluded.
+        bulk (bool): Store entries with COPY instead of one INSERT per entry.
+        api_url (str | None): URL of the API. Defaults to API_URL.
+
+    Returns:
+        result (dict): symbol, status ("done" or "failed"), rows, fetch_seconds, persist_seconds and error.
+    '''
+    db = backfill_connection()
+    result = {"symbol": symbol, "status": "done", "rows": 0, "fetch_seconds": 0.0, "persist_seconds": 0.0, "error": None}
+
+    try:
+        start = time.perf_counter()
+        body = fetch_daily_series(backfill_worker["session"], backfill_worker["rate_limiter"], symbol, choose_output_size(date_start, date_end), api_url,
+            backfill_worker["cache"])
+        result["fetch_seconds"] = round(time.perf_counter() - start, 3)
+
+        persist = persist_data_bulk if bulk else persist_data
+        with body:
+            start = time.perf_counter()
+            result["rows"] = persist(db, symbol, iter_daily_entries(body, symbol, date_start, date_end))
+            result["persist_seconds"] = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        logging.warning(f"Skipping '{symbol}': {e}")
+        result.update(status="failed", error=str(e))
+
+    # Entries are committed before their progress, a symbol stored right before an
+    # interruption is retrieved again on resume and its unchanged entries are not rewritten.
+    save_backfill_progress(backfill_connection(), backfill, result)
+
+    return result
+
+
+def backfill(db: psycopg2.extensions.connection, symbols: list[str], name: str, processes: int | None = None, bulk: bool = True, full: bool = True,
+        api_url: str | None = None, requests_per_minute: float | None = None, dsn: str | None = None, restart: bool = False,
+        cache: ResponseCache | None = None) -> dict:
+    '''
+    Retrieves and stores many symbols with a pool of processes, each with its
+    own database connection. Symbols are handed to the processes one at a time,
+    so a slow symbol does not hold back the others.
+
+    The outcome of every symbol is recorded in backfill_progress under the name
+    of the backfill. Running it again with the same name skips the symbols it
+    already stored and retries the ones that failed.
+
+    Arguments:
+        db (psycopg2.extensions.connection): Database connection handler, used to plan the backfill.
+        symbols (list[str]): The symbols to retrieve.
+        name (str): Name the progress of the backfill is recorded under.
+        processes (int | None): Number of worker processes. Defaults to one by CPU.
+        bulk (bool): Store entries with COPY instead of one INSERT per entry.
+        full (bool): Retrieve the whole history of every symbol. Otherwise symbols continue from their latest entry,
+            and the ones without entries get the last two weeks.
+        api_url (str | None): URL of the API. Defaults to API_URL.
+        requests_per_minute (float | None): Quota of the API key, shared by the processes. Defaults to API_REQUESTS_PER_MINUTE.
+        dsn (str | None): Connection string of the database for the processes. Defaults to the environment settings.
+        restart (bool): Forget the progress recorded under name and retrieve every symbol again.
+        cache (ResponseCache | None): Cache of the API responses, shared by the processes through its directory.
+
+    Returns:
+        report (dict): Symbols stored, skipped and failed, rows written, rows per second and the timings of every symbol.
+    '''
+    processes = processes or os.cpu_count()
+    requests_per_minute = requests_per_minute or get_settings().API_REQUESTS_PER_MINUTE
+
+    if restart:
+        cursor = db.cursor()
+        cursor.execute("DELETE FROM backfill_progress WHERE backfill = %s;", (name,))
+        db.commit()
+
+    stored = get_backfill_progress(db, name)
+    date_end = date.today()
+    pending = [symbol for symbol in symbols if symbol.strip() not in stored]
+
+    if full:
+        # The whole history of every symbol, also of the ones with recent entries only, as the
+        # daily loads store. Symbols already backfilled are skipped through backfill_progress,
+        # and the entries already stored with the same values are not written again.
+        start_dates = {symbol: date.min for symbol in pending}
+    else:
+        start_dates = get_start_dates(db, pending, date_end)
+
+    logging.info(f"Backfill '{name}': {len(stored)} symbols already stored, retrieving {len(start_dates)} with {processes} processes")
+
+    results = []
+    start = time.perf_counter()
+
+    # Spawned instead of forked, so the processes do not share the connection of this one.
+    context = multiprocessing.get_context("spawn")
+    initargs = (dsn, requests_per_minute / processes, logging.getLogger().getEffectiveLevel(),
+        (cache.directory, cache.max_bytes, cache.replay) if cache is not None else None)
+
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=init_backfill_worker, initargs=initargs) as executor:
+        futures = {executor.submit(backfill_symbol, name, symbol, symbol_start, date_end, bulk, api_url): symbol for (symbol, symbol_start) in start_dates.items()}
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker could not record the outcome, the symbol is retried on resume.
+                result = {"symbol": futures[future], "status": "failed", "rows": 0, "fetch_seconds": 0.0, "persist_seconds": 0.0, "error": str(e)}
+            results.append(result)
+
+            logging.info(f"[{len(results)}/{len(futures)}] '{result['symbol']}' {result['status']}: {result['rows']} rows, "
+                f"fetched in {result['fetch_seconds']:.2f}s, stored in {result['persist_seconds']:.2f}s")
+
+    seconds = time.perf_counter() - start
+    rows = sum(result["rows"] for result in results)
+    failed = [result["symbol"] for result in results if result["status"] == "failed"]
+
+    logging.info(f"Backfill '{name}' stored {rows} rows of {len(results) - len(failed)} symbols in {seconds:.1f}s "
+        f"({rows / seconds if seconds else 0:.1f} rows/sec), {len(failed)} failed")
+
+    return {
+        "backfill": name,
+        "processes": processes,
+        "stored": len(results) - len(failed),
+        "skipped": len(stored),
+        "failed": failed,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0,
+        "timings": sorted(results, key=lambda result: -(result["fetch_seconds"] + result["persist_seconds"]))
+    }
+
+
+def read_symbols(path: str) -> list[str]:
+    '''
+    Reads a list of symbols from a file with one symbol per line.
+    Empty lines and lines starting with '#' are ignored.
+
+    Arguments:
+        path (str): Path to the file.
+
+    Returns:
+        symbols (list[str]): The symbols in the file.
+    '''
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def configure_logging(level: int = logging.DEBUG):
+    # Somewhat prettier logs
+    logging.basicConfig(format="%(asctime)s[%(levelname)s] - %(message)s ", datefmt="%d-%b-%y %H:%M:%S", level=level)
 
 
 def setup_db_connection() -> psycopg2.extensions.connection:
@@ -126,6 +1205,7 @@ def setup_db_connection() -> psycopg2.extensions.connection:
        connection (psycopg2.extensions.connection) Handler to the connection to the posgres DB.
     '''
 
+    settings = get_settings()
     connection = None
     logging.error(f'Connecting to {settings.POSTGRES_HOSTNAME}, {settings.DATABASE_PORT}, {settings.POSTGRES_USER}')
     try:
@@ -144,6 +1224,41 @@ def setup_db_connection() -> psycopg2.extensions.connection:
 
 if __name__ == "__main__":
 
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Retrieve daily stock data from AlphaVantage and store it in the database")
+    parser.add_argument("symbols", nargs="*", help="Symbols to retrieve. Defaults to IBM and AAPL.")
+    parser.add_argument("--symbols-file", help="File with one symbol per line to retrieve.")
+    parser.add_argument("--workers", type=int, help="Number of concurrent API calls. Defaults to FETCH_WORKERS.")
+    parser.add_argument("--bulk", action=argparse.BooleanOptionalAction, help="Store entries with COPY. Recommended for large backfills. Default with --backfill.")
+    parser.add_argument("--full", action=argparse.BooleanOptionalAction, help="Retrieve the whole history of symbols without data instead of the last two weeks. Default with --backfill.")
+    parser.add_argument("--check-rollups", action="store_true", help="Only check that the running totals match the entries. Exits with 1 if they do not.")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="Only recompute the running totals from the entries.")
+    parser.add_argument("--backfill", metavar="NAME", help="Retrieve the symbols with a pool of processes, recording the progress under NAME so an interrupted backfill resumes where it stopped. Exits with 1 if any symbol failed.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of processes of --backfill. Defaults to one by CPU.")
+    parser.add_argument("--restart", action="store_true", help="Start --backfill NAME again instead of resuming it.")
+    parser.add_argument("--cache-dir", help="Folder to keep the API responses in, so they are not retrieved again. Defaults to RESPONSE_CACHE_DIR.")
+    parser.add_argument("--replay", action="store_true", help="Only use the responses of --cache-dir, without calling the API.")
+    parser.add_argument("--report", help="File to write the report of --backfill to, as JSON, with the timings of every symbol.")
+    args = parser.parse_args()
+
+    # Defaults of the settings are only read once the arguments are parsed, so --help does not need them.
+    settings = get_settings()
+    if args.workers is None:
+        args.workers = settings.FETCH_WORKERS
+    if args.cache_dir is None:
+        args.cache_dir = settings.RESPONSE_CACHE_DIR
+
+    symbols = args.symbols
+    if args.symbols_file:
+        symbols += read_symbols(args.symbols_file)
+    if not symbols:
+        symbols = ["IBM", "AAPL"]
+
+    if args.replay and not args.cache_dir:
+        parser.error("--replay needs --cache-dir or RESPONSE_CACHE_DIR")
+    cache = ResponseCache(args.cache_dir, settings.RESPONSE_CACHE_SIZE, replay=args.replay) if args.cache_dir else None
+
     # Setup DB
     connection = setup_db_connection()
 
@@ -152,4 +1267,26 @@ if __name__ == "__main__":
         logging.error("Could not connect to the database. Shutting down.")
         sys.exit(1)
 
-    populate_database(connection, ["IBM", "AAPL"])
+    if args.rebuild_rollups:
+        rebuild_rollups(connection)
+        sys.exit(0)
+
+    if args.check_rollups:
+        mismatches = check_rollups(connection)
+        if mismatches:
+            logging.error(f"Running totals do not match the entries of: {', '.join(mismatches)}")
+            sys.exit(1)
+        logging.info("Running totals match the entries")
+        sys.exit(0)
+
+    # Only the options given, so --backfill and a regular run each keep their own defaults.
+    options = {name: value for name, value in (("bulk", args.bulk), ("full", args.full)) if value is not None}
+
+    if args.backfill:
+        report = backfill(connection, symbols, args.backfill, args.processes, restart=args.restart, cache=cache, **options)
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+        sys.exit(1 if report["failed"] else 0)
+
+    populate_database(connection, symbols, workers=args.workers, cache=cache, **options)
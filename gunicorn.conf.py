@@ -0,0 +1,48 @@
+"""
+Gunicorn configuration of the API, used by the Docker image.
+
+Runs the app in several uvicorn worker processes. The app is imported once by
+the master process before the workers are forked, so they start without
+importing it again and share the memory of the imported modules. Every worker
+then opens its own database connections, runs its own cache invalidation
+listener and keeps its own cache and column store.
+
+Example:
+    gunicorn -c gunicorn.conf.py financial.main:app
+"""
+import multiprocessing
+
+from financial.settings import ServerSettings
+
+# Only the settings of the server, so the configuration loads without the database settings.
+settings = ServerSettings()
+
+bind = "0.0.0.0:5000"
+workers = settings.WEB_CONCURRENCY or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app before forking the workers.
+preload_app = True
+
+timeout = settings.WORKER_TIMEOUT
+graceful_timeout = settings.WORKER_TIMEOUT
+keepalive = settings.WORKER_KEEPALIVE
+
+# Restart workers after some requests, with some jitter so they do not restart at once. 0 never restarts them.
+max_requests = settings.WORKER_MAX_REQUESTS
+max_requests_jitter = settings.WORKER_MAX_REQUESTS // 10
+
+
+def when_ready(server):
+    # The app creates the engine on first use. Creating it before forking loads the
+    # database driver once for all the workers. No connection is opened yet.
+    from financial.database import get_engine
+
+    get_engine()
+
+
+def post_fork(server, worker):
+    # Connections opened by the master while loading the app can not be shared with the workers.
+    from financial.database import dispose_after_fork
+
+    dispose_after_fork()
@@ -1,8 +1,100 @@
+-- Databases created before financial_data was partitioned keep their entries in
+-- financial_data_unpartitioned until the end of this script, which copies them over.
+-- Running this script again is enough to upgrade them.
+DO $$
+BEGIN
+       IF EXISTS (SELECT FROM pg_class WHERE oid = to_regclass('financial_data') AND relkind = 'r') THEN
+              ALTER TABLE financial_data RENAME TO financial_data_unpartitioned;
+              ALTER INDEX IF EXISTS financial_data_pkey RENAME TO financial_data_unpartitioned_pkey;
+              ALTER INDEX IF EXISTS financial_data_date_symbol_idx RENAME TO financial_data_unpartitioned_date_symbol_idx;
+       END IF;
+END;
+$$;
+
+-- Partitioned by year, so date range queries only read the partitions of the range.
+-- Partitions are created by get_raw_data.py as entries of new years arrive.
 CREATE TABLE IF NOT EXISTS financial_data (
-       symbol char(10),
+       symbol TEXT,
        date DATE,
        open_price FLOAT8,
        close_price FLOAT8,
-       volume INT,
+       volume BIGINT,
        PRIMARY KEY(symbol, date)
+) PARTITION BY RANGE (date);
+
+-- The primary key serves the queries of a symbol. This index serves the ones over
+-- all symbols, which are sorted by date and paginated by (date, symbol).
+CREATE INDEX IF NOT EXISTS financial_data_date_symbol_idx ON financial_data (date, symbol);
+
+-- Creates the missing yearly partitions of financial_data between two dates.
+CREATE OR REPLACE FUNCTION create_financial_data_partitions(from_date DATE, to_date DATE) RETURNS void AS $$
+DECLARE
+       year INT;
+BEGIN
+       IF from_date IS NULL OR to_date IS NULL THEN
+              RETURN;
+       END IF;
+
+       FOR year IN extract(year FROM from_date)::int .. extract(year FROM to_date)::int LOOP
+              -- The lock is only taken when a partition is missing, so calls for existing
+              -- partitions do not wait for each other. Concurrent ingesters would otherwise
+              -- race to create the same partition, so it is checked again under the lock by
+              -- IF NOT EXISTS, which unlike to_regclass sees the partitions just committed.
+              IF to_regclass(format('financial_data_%s', year)) IS NULL THEN
+                     PERFORM pg_advisory_xact_lock(hashtext('create_financial_data_partitions'));
+                     EXECUTE format('CREATE TABLE IF NOT EXISTS financial_data_%s PARTITION OF financial_data FOR VALUES FROM (%L) TO (%L)',
+                            year, make_date(year, 1, 1), make_date(year + 1, 1, 1));
+              END IF;
+       END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Running totals of financial_data by symbol, maintained by get_raw_data.py.
+-- The sums of any date range are the difference between two of its rows.
+CREATE TABLE IF NOT EXISTS financial_data_rollup (
+       symbol TEXT,
+       date DATE,
+       cum_open_price NUMERIC,
+       cum_close_price NUMERIC,
+       cum_volume NUMERIC,
+       cum_count BIGINT,
+       PRIMARY KEY(symbol, date)
+);
+
+-- Outcome of every symbol of the backfills of get_raw_data.py, by backfill name,
+-- so an interrupted backfill resumes with the symbols it did not store yet.
+CREATE TABLE IF NOT EXISTS backfill_progress (
+       backfill TEXT,
+       symbol TEXT,
+       status TEXT NOT NULL,
+       rows BIGINT,
+       fetch_seconds FLOAT8,
+       persist_seconds FLOAT8,
+       error TEXT,
+       updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+       PRIMARY KEY(backfill, symbol)
 );
+
+-- Rollups created before symbol became TEXT.
+DO $$
+BEGIN
+       IF EXISTS (SELECT FROM pg_attribute WHERE attrelid = to_regclass('financial_data_rollup')
+                     AND attname = 'symbol' AND atttypid = 'bpchar'::regtype) THEN
+              ALTER TABLE financial_data_rollup ALTER COLUMN symbol TYPE TEXT USING rtrim(symbol);
+       END IF;
+END;
+$$;
+
+-- Entries of a financial_data created before it was partitioned, see the top of the script.
+-- Entries already copied by an interrupted run are skipped.
+DO $$
+BEGIN
+       IF to_regclass('financial_data_unpartitioned') IS NOT NULL THEN
+              PERFORM create_financial_data_partitions(MIN(date), MAX(date)) FROM financial_data_unpartitioned;
+              INSERT INTO financial_data (symbol, date, open_price, close_price, volume)
+                     SELECT rtrim(symbol), date, open_price, close_price, volume FROM financial_data_unpartitioned
+                     ON CONFLICT DO NOTHING;
+              DROP TABLE financial_data_unpartitioned;
+       END IF;
+END;
+$$;
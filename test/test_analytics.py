@@ -0,0 +1,50 @@
+import numpy as np
+import unittest
+
+from financial.analytics import sma, ema, vwap, returns, rolling_std
+
+
+class AnalyticsTestcase(unittest.TestCase):
+
+    values = np.array([3.0, 5.0, 4.0, 8.0, 6.0, 7.0])
+
+    def test_sma(self):
+        np.testing.assert_allclose(sma(self.values, 3), [np.nan, np.nan, 4.0, 17 / 3, 6.0, 7.0])
+
+    def test_sma_short_series(self):
+        assert np.isnan(sma(self.values, 10)).all()
+
+    def test_ema(self):
+        expected = [np.nan, np.nan, 4.0]
+        for value in self.values[3:]:
+            expected.append(0.5 * value + 0.5 * expected[-1])
+
+        np.testing.assert_allclose(ema(self.values, 3), expected)
+
+    def test_ema_many_blocks(self):
+        # Long enough to be solved in many blocks, compared with the recurrence.
+        values = np.random.default_rng(1).uniform(10, 100, 5000)
+        alpha = 2 / 3
+        expected = [np.nan, values[:2].mean()]
+        for value in values[2:]:
+            expected.append(alpha * value + (1 - alpha) * expected[-1])
+
+        np.testing.assert_allclose(ema(values, 2), expected, rtol=1e-12)
+
+    def test_vwap(self):
+        volumes = np.array([1, 1, 2, 0, 0, 0])
+
+        np.testing.assert_allclose(vwap(self.values, volumes, 2), [np.nan, 4.0, 13 / 3, 4.0, np.nan, np.nan])
+
+    def test_returns(self):
+        np.testing.assert_allclose(returns(np.array([2.0, 3.0, 1.5])), [np.nan, 0.5, -0.5])
+
+    def test_returns_zero_price(self):
+        np.testing.assert_allclose(returns(np.array([2.0, 0.0, 1.5, 0.0, 0.0])), [np.nan, -1.0, np.nan, -1.0, np.nan])
+
+    def test_vwap_not_finite(self):
+        # Volumes cancelling out leave no volume under a nonzero weighted price.
+        np.testing.assert_allclose(vwap(np.array([1.0, 2.0]), np.array([1, -1]), 2), [np.nan, np.nan])
+
+    def test_rolling_std(self):
+        np.testing.assert_allclose(rolling_std(self.values, 3), [np.nan, np.nan, 1.0, np.std([5, 4, 8], ddof=1), np.std([4, 8, 6], ddof=1), 1.0])
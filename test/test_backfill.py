@@ -0,0 +1,70 @@
+import logging
+import threading
+import unittest
+
+import pytest
+
+from datetime import date
+from http.server import ThreadingHTTPServer
+
+from get_raw_data import backfill, backfill_symbol, persist_data, backfill_worker, init_backfill_worker
+from test.test_get_raw_data import StubAlphaVantageHandler
+
+
+@pytest.mark.usefixtures("postgres_schema")
+class BackfillTestcase(unittest.TestCase):
+    """ Backfills symbols from a stub of the API with two worker processes, in the schema of postgres_schema """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubAlphaVantageHandler)
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_address[1]}/query"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def run_backfill(self, symbols: list[str], **options) -> dict:
+        StubAlphaVantageHandler.calls.clear()
+        return backfill(self.schema.db, symbols, "test", processes=2, api_url=self.api_url, requests_per_minute=6000, dsn=self.schema.dsn, **options)
+
+    def test_backfill_resumes(self):
+        report = self.run_backfill(["IBM", "AAPL", "BAD"], restart=True)
+
+        assert (report["stored"], report["skipped"], report["failed"], report["rows"]) == (2, 0, ["BAD"], 4)
+        assert {timing["symbol"] for timing in report["timings"]} == {"IBM", "AAPL", "BAD"}
+        assert self.schema.query("SELECT symbol, COUNT(*) FROM financial_data GROUP BY symbol ORDER BY symbol") == [("AAPL", 2), ("IBM", 2)]
+        assert self.schema.query("SELECT symbol, status, rows FROM backfill_progress ORDER BY symbol") == [("AAPL", "done", 2), ("BAD", "failed", 0), ("IBM", "done", 2)]
+
+        # Only the symbol that failed is retrieved again.
+        report = self.run_backfill(["IBM", "AAPL", "BAD"])
+
+        assert (report["stored"], report["skipped"], report["failed"]) == (0, 2, ["BAD"])
+        assert StubAlphaVantageHandler.calls == ["BAD"]
+
+    def test_backfill_fills_history(self):
+        # Only the latest entry is stored, as by a daily load.
+        persist_data(self.schema.db, "IBM", [("IBM", "2020-01-02", "3.15", "3.19", "2233")])
+
+        report = self.run_backfill(["IBM"])
+
+        assert (report["stored"], report["rows"]) == (1, 1)
+        assert self.schema.query("SELECT date::text FROM financial_data ORDER BY date") == [("2020-01-01",), ("2020-01-02",)]
+
+        # Without full, symbols continue from their latest entry.
+        report = self.run_backfill(["IBM"], restart=True, full=False)
+        assert (report["stored"], report["rows"]) == (1, 0)
+
+    def test_worker_reconnects(self):
+        init_backfill_worker(self.schema.dsn, 6000, logging.WARNING)
+        self.addCleanup(backfill_worker.clear)
+        self.addCleanup(lambda: backfill_worker["db"].close())
+
+        # A dropped connection is replaced for the next symbol.
+        backfill_worker["db"].close()
+        result = backfill_symbol("reconnect", "IBM", date(2020, 1, 1), date(2021, 1, 1), api_url=self.api_url)
+
+        assert (result["status"], result["error"]) == ("done", None)
+        assert self.schema.query("SELECT status FROM backfill_progress WHERE backfill = 'reconnect'") == [("done",)]
@@ -0,0 +1,68 @@
+import tempfile
+
+from datetime import date
+
+from benchmark.compare import changes
+from benchmark.data import generate_entries, symbol_names, trading_days, write_responses
+from benchmark.suite import profile_urls
+from get_raw_data import ResponseCache, iter_daily_entries, last_trading_day
+
+
+def test_trading_days():
+    # From Friday to the next Tuesday, excluded.
+    assert list(trading_days(date(2023, 1, 6), date(2023, 1, 10))) == [date(2023, 1, 6), date(2023, 1, 9)]
+
+
+def test_generate_entries_reproducible():
+    entries = list(generate_entries("SYN0000", date(2023, 1, 1), date(2023, 2, 1)))
+
+    assert entries == list(generate_entries("SYN0000", date(2023, 1, 1), date(2023, 2, 1)))
+    assert entries != list(generate_entries("SYN0000", date(2023, 1, 1), date(2023, 2, 1), seed=1))
+    assert entries != list(generate_entries("SYN0001", date(2023, 1, 1), date(2023, 2, 1)))
+
+    assert len(entries) == 22
+    assert entries[0][:2] == ("SYN0000", "2023-01-02")
+    assert all(float(open_price) > 0 and float(close_price) > 0 and int(volume) >= 0 for _, _, open_price, close_price, volume in entries)
+
+
+def test_write_responses():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(directory, replay=True)
+        result = write_responses(cache, ["SYN0000"], date(2023, 1, 1), date(2023, 2, 1))
+
+        with cache.get("SYN0000", "compact", last_trading_day(date.today())) as body:
+            entries = list(iter_daily_entries(body, "SYN0000", date(2023, 1, 1), date(2023, 2, 1)))
+
+    # The API lists the newest entries first.
+    assert entries == list(reversed(list(generate_entries("SYN0000", date(2023, 1, 1), date(2023, 2, 1)))))
+    assert result["rows"] == 22
+
+
+def test_profile_urls():
+    # 260 trading days in 2023, the last page of 100 is the third.
+    urls = profile_urls("financial_data_deep", "http://api", symbol_names(2), date(2023, 1, 1), date(2024, 1, 1))
+
+    assert urls == [
+        "http://api/api/financial_data?symbol=SYN0000&start_date=2023-01-01&end_date=2024-01-01&limit=100&page=3&include_count=false",
+        "http://api/api/financial_data?symbol=SYN0001&start_date=2023-01-01&end_date=2024-01-01&limit=100&page=3&include_count=false",
+    ]
+
+
+def test_compare_changes():
+    baseline = {
+        "profiles": {"statistics_short": {"requests_per_second": 100, "latency_ms": {"p99": 10}}},
+        "ingest": {"copy": {"new": {"rows_per_second": 1000}}},
+    }
+    current = {
+        "profiles": {
+            "statistics_short": {"requests_per_second": 50, "latency_ms": {"p99": 5}},
+            "statistics_multi_year": {"requests_per_second": 10, "latency_ms": {"p99": 50}},
+        },
+        "ingest": {"copy": {"new": {"rows_per_second": 1100}}},
+    }
+
+    assert changes(baseline, current) == [
+        {"metric": "statistics_short.requests_per_second", "baseline": 100, "current": 50, "change": -0.5},
+        {"metric": "statistics_short.latency_ms.p99", "baseline": 10, "current": 5, "change": 1.0},
+        {"metric": "ingest.copy.new.rows_per_second", "baseline": 1000, "current": 1100, "change": 0.1},
+    ]
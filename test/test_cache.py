@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+
+from types import SimpleNamespace
+
+from financial.cache import CacheEntry, ResponseCache, SharedStore, cached_response
+
+
+class LocalStore:
+    """ In memory stand-in for the subset of Redis commands used by SharedStore """
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def sadd(self, key, *members):
+        self.values.setdefault(key, set()).update(members)
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def smembers(self, key):
+        return self.values.get(key, set())
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class ResponseCacheTestcase(unittest.IsolatedAsyncioTestCase):
+
+    async def test_get_hit_and_miss(self):
+        cache = ResponseCache(maxsize=10, ttl=60)
+        entry = CacheEntry.from_content({"data": [1, 2]})
+
+        assert await cache.get("a") is None
+        await cache.set("a", entry, "IBM")
+
+        assert await cache.get("a") == entry
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    async def test_expired_entry(self):
+        cache = ResponseCache(maxsize=10, ttl=0)
+        await cache.set("a", CacheEntry.from_content({}), "IBM")
+
+        assert await cache.get("a") is None
+
+    async def test_least_recently_used_evicted(self):
+        cache = ResponseCache(maxsize=2, ttl=60)
+        await cache.set("a", CacheEntry.from_content("a"), "IBM")
+        await cache.set("b", CacheEntry.from_content("b"), "IBM")
+        await cache.get("a")
+        await cache.set("c", CacheEntry.from_content("c"), "IBM")
+
+        assert list(cache.entries) == ["a", "c"]
+
+    async def test_invalidate_symbol(self):
+        cache = ResponseCache(maxsize=10, ttl=60)
+        await cache.set("ibm", CacheEntry.from_content("ibm"), "IBM")
+        await cache.set("aapl", CacheEntry.from_content("aapl"), "AAPL")
+        await cache.set("all", CacheEntry.from_content("all"), None)
+
+        await cache.invalidate("IBM")
+
+        assert list(cache.entries) == ["aapl"]
+
+    async def test_invalidated_during_build(self):
+        cache = ResponseCache(maxsize=10, ttl=60)
+        request = SimpleNamespace(headers={})
+        building = asyncio.Event()
+
+        async def slow_build():
+            building.set()
+            await asyncio.sleep(0.05)
+            return {"data": "before ingest"}
+
+        async def invalidate():
+            await building.wait()
+            await cache.invalidate("IBM")
+
+        # The response was built from data older than the notification, so it is served but not stored.
+        response, _ = await asyncio.gather(cached_response(request, cache, "ibm", "IBM", slow_build), invalidate())
+        assert response.body == b'{"data":"before ingest"}'
+        assert await cache.get("ibm") is None
+
+        await cached_response(request, cache, "ibm", "IBM", slow_build)
+        assert await cache.get("ibm") is not None
+
+    async def test_bypassed_while_not_listening(self):
+        cache = ResponseCache(maxsize=10, ttl=60)
+        await cache.set("a", CacheEntry.from_content("a"), "IBM")
+
+        cache.listening = False
+        assert await cache.get("a") is None
+        await cache.set("b", CacheEntry.from_content("b"), "IBM")
+        assert list(cache.entries) == ["a"]
+
+    async def test_shared_store(self):
+        store = SharedStore(LocalStore(), ttl=60)
+        worker1 = ResponseCache(maxsize=10, ttl=60, shared=store)
+        worker2 = ResponseCache(maxsize=10, ttl=60, shared=store)
+        entry = CacheEntry.from_content({"data": [1, 2]})
+
+        await worker1.set("a", entry, "IBM")
+        assert await worker2.get("a") == entry
+        assert worker2.shared_hits == 1
+
+        await worker1.invalidate("IBM")
+        worker2.clear()
+        assert await worker2.get("a") is None
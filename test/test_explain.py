@@ -0,0 +1,189 @@
+import json
+import re
+import unittest
+
+import pytest
+
+from datetime import date
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from financial import crud
+
+# Enough entries for the planner to prefer the indexes: 200 symbols with 1000 days each, from 2020 to 2022.
+SYMBOLS = 200
+DAYS = 1000
+
+
+def plan_nodes(plan: dict):
+    """ Walks all the nodes of a plan """
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@pytest.fixture(scope="class")
+def explain_data(postgres_class_schema):
+    """ Entries and running totals of the test schema """
+    cursor = postgres_class_schema.db.cursor()
+    cursor.execute("SELECT create_financial_data_partitions(DATE '2020-01-01', DATE '2020-01-01' + %s)", (DAYS - 1,))
+    cursor.execute("""
+    INSERT INTO financial_data (symbol, date, open_price, close_price, volume)
+    SELECT 'S' || s, DATE '2020-01-01' + d, 100 + random(), 100 + random(), (random() * 1000000)::bigint
+    FROM generate_series(1, %s) s, generate_series(0, %s) d
+    """, (SYMBOLS, DAYS - 1))
+    cursor.execute("""
+    INSERT INTO financial_data_rollup (symbol, date, cum_open_price, cum_close_price, cum_volume, cum_count)
+    SELECT symbol, date, SUM(open_price::numeric) OVER w, SUM(close_price::numeric) OVER w, SUM(volume::numeric) OVER w, COUNT(*) OVER w
+    FROM financial_data
+    WINDOW w AS (PARTITION BY symbol ORDER BY date)
+    """)
+    cursor.execute("ANALYZE")
+    postgres_class_schema.db.commit()
+
+
+@pytest.mark.usefixtures("explain_data")
+class ExplainTestcase(unittest.IsolatedAsyncioTestCase):
+    """ Checks the plans Postgres chooses for the queries of every crud function, in the schema of postgres_class_schema """
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(self.schema.url, connect_args={"server_settings": {"search_path": self.schema.name}})
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def explain(self, call) -> list[dict]:
+        """ Runs a crud call and returns the plan of every statement it executed """
+        statements = []
+
+        def capture(connection, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(self.engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            async with AsyncSession(self.engine) as db:
+                await call(db)
+        finally:
+            event.remove(self.engine.sync_engine, "before_cursor_execute", capture)
+
+        plans = []
+        async with self.engine.connect() as connection:
+            for statement, parameters in statements:
+                result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plan = result.scalar()
+                # Depending on the driver the plan comes decoded or as text.
+                plans.append((json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"])
+
+        assert plans, "No statement was executed"
+        return plans
+
+    def nodes(self, plans: list[dict]) -> list[dict]:
+        return [node for plan in plans for node in plan_nodes(plan)]
+
+    def assertNoSeqScan(self, plans: list[dict]):
+        scans = [node["Relation Name"] for node in self.nodes(plans) if node["Node Type"] == "Seq Scan"]
+        assert not scans, f"Sequential scan of {scans}"
+
+    def assertNoSort(self, plans: list[dict]):
+        sorts = [node["Node Type"] for node in self.nodes(plans) if node["Node Type"] in ("Sort", "Incremental Sort")]
+        assert not sorts, f"Rows are sorted: {sorts}"
+
+    def assertUsesIndex(self, plans: list[dict], index: str):
+        # Indexes of the partitions are named after the partition, financial_data_2020_pkey for financial_data_pkey.
+        indexes = {re.sub(r"^financial_data_\d{4}_", "financial_data_", node["Index Name"]) for node in self.nodes(plans) if "Index Name" in node}
+        assert index in indexes, f"{index} is not used, used: {indexes}"
+
+    def assertScansPartitions(self, plans: list[dict], partitions: set[str]):
+        scanned = {node["Relation Name"] for node in self.nodes(plans) if node.get("Relation Name", "").startswith("financial_data_2")}
+        assert scanned == partitions, f"Scanned partitions {scanned}, expected {partitions}"
+
+    async def test_count_financial_data(self):
+        plans = await self.explain(lambda db: crud.count_financial_data(db, "S1", date(2020, 3, 1), date(2020, 6, 1)))
+
+        self.assertNoSeqScan(plans)
+        self.assertUsesIndex(plans, "financial_data_pkey")
+
+    async def test_get_financial_data_by_symbol(self):
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, "S1", date(2020, 3, 1), date(2020, 6, 1), offset=20, limit=10))
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_pkey")
+
+    async def test_get_financial_data_by_symbol_cursor(self):
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, "S1", None, None, limit=10, after=(date(2021, 1, 1), "S1")))
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_pkey")
+
+    async def test_get_financial_data_all_symbols(self):
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, None, None, None, offset=0, limit=10))
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_date_symbol_idx")
+
+    async def test_get_financial_data_all_symbols_cursor(self):
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, None, date(2020, 3, 1), None, limit=10, after=(date(2021, 1, 1), "S1")))
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_date_symbol_idx")
+
+    async def test_get_financial_statistics(self):
+        plans = await self.explain(lambda db: crud.get_financial_statistics(db, "S1", date(2020, 3, 1), date(2020, 6, 1)))
+
+        self.assertNoSeqScan(plans)
+        self.assertUsesIndex(plans, "financial_data_pkey")
+
+    async def test_get_financial_statistics_rollup(self):
+        plans = await self.explain(lambda db: crud.get_financial_statistics_rollup(db, "S1", date(2020, 3, 1), date(2022, 6, 1)))
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_rollup_pkey")
+
+    async def test_get_batch_financial_statistics(self):
+        windows = [(date(2020, 3, 1), date(2020, 6, 1)), (date(2021, 1, 1), date(2021, 2, 1))]
+        plans = await self.explain(lambda db: crud.get_batch_financial_statistics(db, ["S1", "S2", "S3"], windows))
+
+        self.assertNoSeqScan(plans)
+        self.assertUsesIndex(plans, "financial_data_pkey")
+
+    async def test_get_financial_series(self):
+        plans = await self.explain(lambda db: crud.get_financial_series(db, "S1", date(2020, 3, 1), date(2020, 6, 1), lookback=20))
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_pkey")
+
+    async def test_stream_financial_data_all_symbols(self):
+        async def export(db):
+            # Long exports are read in index order instead of sorting the whole range.
+            async for partition in crud.stream_financial_data(db, None, date(2020, 3, 1), date(2021, 3, 1)):
+                pass
+
+        plans = await self.explain(export)
+
+        self.assertNoSeqScan(plans)
+        self.assertNoSort(plans)
+        self.assertUsesIndex(plans, "financial_data_date_symbol_idx")
+
+    async def test_partition_pruning(self):
+        plans = await self.explain(lambda db: crud.get_financial_statistics(db, "S1", date(2020, 3, 1), date(2020, 6, 1)))
+        self.assertScansPartitions(plans, {"financial_data_2020"})
+
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, None, date(2021, 6, 1), date(2022, 6, 1), limit=10))
+        self.assertScansPartitions(plans, {"financial_data_2021", "financial_data_2022"})
+
+        plans = await self.explain(lambda db: crud.count_financial_data(db, "S1", date(2022, 1, 1), None))
+        self.assertScansPartitions(plans, {"financial_data_2022"})
+
+    async def test_partition_pruning_cursor(self):
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, "S1", None, None, limit=10, after=(date(2021, 1, 1), "S1")))
+        self.assertScansPartitions(plans, {"financial_data_2021", "financial_data_2022"})
+
+        plans = await self.explain(lambda db: crud.get_financial_data_by_symbol(db, None, None, None, limit=10, after=(date(2022, 1, 1), "S1")))
+        self.assertScansPartitions(plans, {"financial_data_2022"})
+
@@ -0,0 +1,297 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from datetime import date
+from unittest import mock
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import get_raw_data
+
+from get_raw_data import TokenBucket, FetchError, CSVStream, ResponseCache, create_http_session, fetch_daily_series, fetch_all_daily_series, iter_daily_entries, \
+    choose_output_size, last_trading_day
+
+
+DAILY_SERIES = {
+    "2020-01-02": {"1. open": "3.15", "4. close": "3.19", "6. volume": "2233"},
+    "2020-01-01": {"1. open": "3.14", "4. close": "3.18", "6. volume": "2232"},
+}
+
+
+class StubAlphaVantageHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the AlphaVantage API. Symbol 'BAD' is unknown, 'FLAKY' fails once with HTTP 503
+    and 'QUOTA' is answered once with the message of an exceeded quota.
+    """
+
+    calls = []
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        symbol = params["symbol"][0]
+        self.calls.append(symbol)
+
+        if symbol == "FLAKY" and self.calls.count(symbol) == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if symbol == "BAD":
+            content = {"Error Message": "Invalid API call."}
+        elif symbol == "QUOTA" and self.calls.count(symbol) == 1:
+            content = {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute."}
+        else:
+            content = {"Meta Data": {"2. Symbol": symbol}, "Time Series (Daily)": DAILY_SERIES}
+
+        body = json.dumps(content).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GetRawDataFetchTestcase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubAlphaVantageHandler)
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_address[1]}/query"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubAlphaVantageHandler.calls.clear()
+
+        backoff = get_raw_data.RETRY_BACKOFF
+        get_raw_data.RETRY_BACKOFF = 0.01
+        self.addCleanup(setattr, get_raw_data, "RETRY_BACKOFF", backoff)
+
+    def test_fetch_daily_series_success(self):
+        with create_http_session() as session:
+            result = fetch_daily_series(session, TokenBucket(6000), "IBM", api_url=self.api_url)
+
+        with result:
+            assert json.load(result)["Time Series (Daily)"] == DAILY_SERIES
+
+    def test_fetch_daily_series_fail_no_data(self):
+        with create_http_session() as session:
+            self.assertRaises(FetchError, fetch_daily_series, session, TokenBucket(6000), "BAD", api_url=self.api_url)
+
+    def test_fetch_daily_series_retry(self):
+        with create_http_session() as session:
+            result = fetch_daily_series(session, TokenBucket(6000), "FLAKY", api_url=self.api_url)
+
+        with result:
+            assert json.load(result)["Time Series (Daily)"] == DAILY_SERIES
+        assert StubAlphaVantageHandler.calls == ["FLAKY", "FLAKY"]
+
+    def test_fetch_daily_series_retry_quota(self):
+        acquired = []
+        rate_limiter = TokenBucket(6000)
+        acquire = rate_limiter.acquire
+        rate_limiter.acquire = lambda: acquired.append(1) or acquire()
+
+        with create_http_session() as session:
+            result = fetch_daily_series(session, rate_limiter, "QUOTA", api_url=self.api_url)
+
+        with result:
+            assert json.load(result)["Time Series (Daily)"] == DAILY_SERIES
+        assert StubAlphaVantageHandler.calls == ["QUOTA", "QUOTA"]
+        # Every retry waits for the rate limiter.
+        assert len(acquired) == 2
+
+    def test_fetch_daily_series_retries_exhausted(self):
+        with create_http_session() as session:
+            self.assertRaises(FetchError, fetch_daily_series, session, TokenBucket(6000), "FLAKY", api_url=self.api_url, retries=0)
+        assert StubAlphaVantageHandler.calls == ["FLAKY"]
+
+    def test_fetch_all_daily_series(self):
+        symbols = ["IBM", "AAPL", "BAD", "MSFT"]
+        results = {symbol: (body and json.load(body), error) for symbol, body, error in fetch_all_daily_series(symbols, rate_limiter=TokenBucket(6000), api_url=self.api_url)}
+
+        assert set(results) == set(symbols)
+        assert results["IBM"] == ({"Meta Data": {"2. Symbol": "IBM"}, "Time Series (Daily)": DAILY_SERIES}, None)
+        assert results["MSFT"] == ({"Meta Data": {"2. Symbol": "MSFT"}, "Time Series (Daily)": DAILY_SERIES}, None)
+        assert results["BAD"][0] is None
+        assert isinstance(results["BAD"][1], FetchError)
+
+    def test_fetch_daily_series_cached(self):
+        with tempfile.TemporaryDirectory() as directory, create_http_session() as session:
+            cache = ResponseCache(directory)
+            for _ in range(2):
+                with fetch_daily_series(session, TokenBucket(6000), "IBM", api_url=self.api_url, cache=cache) as result:
+                    assert json.load(result)["Time Series (Daily)"] == DAILY_SERIES
+
+            # Errors are not cached.
+            for _ in range(2):
+                self.assertRaises(FetchError, fetch_daily_series, session, TokenBucket(6000), "BAD", api_url=self.api_url, cache=cache)
+
+        assert StubAlphaVantageHandler.calls == ["IBM", "BAD", "BAD"]
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    def test_fetch_daily_series_replay(self):
+        with tempfile.TemporaryDirectory() as directory, create_http_session() as session:
+            fetch_daily_series(session, TokenBucket(6000), "IBM", api_url=self.api_url, cache=ResponseCache(directory)).close()
+
+            replay = ResponseCache(directory, replay=True)
+            with fetch_daily_series(session, TokenBucket(6000), "IBM", api_url=self.api_url, cache=replay) as result:
+                assert json.load(result)["Time Series (Daily)"] == DAILY_SERIES
+            self.assertRaises(FetchError, fetch_daily_series, session, TokenBucket(6000), "AAPL", api_url=self.api_url, cache=replay)
+
+        assert StubAlphaVantageHandler.calls == ["IBM"]
+
+
+class ResponseCacheTestcase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def read(self, cache: ResponseCache, symbol: str, output_size: str, day: date) -> bytes | None:
+        body = cache.get(symbol, output_size, day)
+        if body is None:
+            return None
+        with body:
+            return body.read()
+
+    def test_get(self):
+        cache = ResponseCache(self.directory.name)
+        cache.put("IBM", "compact", date(2023, 6, 1), io.BytesIO(b"compact"))
+
+        assert self.read(cache, "IBM", "compact", date(2023, 6, 1)) == b"compact"
+        assert self.read(cache, "IBM", "compact", date(2023, 6, 2)) is None
+        assert self.read(cache, "IBM", "full", date(2023, 6, 1)) is None
+        assert self.read(cache, "AAPL", "compact", date(2023, 6, 1)) is None
+
+        # Full responses have all the entries of the compact ones.
+        cache.put("IBM", "full", date(2023, 6, 2), io.BytesIO(b"full"))
+        assert self.read(cache, "IBM", "compact", date(2023, 6, 2)) == b"full"
+
+    def test_replay_latest(self):
+        cache = ResponseCache(self.directory.name, replay=True)
+        cache.put("IBM", "compact", date(2023, 5, 1), io.BytesIO(b"may"))
+        cache.put("IBM", "compact", date(2023, 6, 1), io.BytesIO(b"june"))
+
+        assert self.read(cache, "IBM", "compact", date(2023, 5, 15)) == b"may"
+        assert self.read(cache, "IBM", "compact", date(2023, 7, 1)) == b"june"
+        assert self.read(cache, "IBM", "compact", date(2023, 4, 1)) is None
+
+    def test_evict_least_recently_used(self):
+        cache = ResponseCache(self.directory.name, max_bytes=25)
+        for number, symbol in enumerate(["IBM", "AAPL"]):
+            cache.put(symbol, "full", date(2023, 6, 1), io.BytesIO(b"x" * 10))
+            os.utime(cache.find(symbol, "full", date(2023, 6, 1)), (number, number))
+
+        # IBM is used after AAPL, so AAPL is evicted to make room.
+        assert self.read(cache, "IBM", "full", date(2023, 6, 1)) is not None
+        cache.put("MSFT", "full", date(2023, 6, 1), io.BytesIO(b"x" * 10))
+
+        assert [self.read(cache, symbol, "full", date(2023, 6, 1)) is not None for symbol in ["IBM", "AAPL", "MSFT"]] == [True, False, True]
+
+    def test_evict_scans_only_when_full(self):
+        cache = ResponseCache(self.directory.name, max_bytes=100)
+        cache.put("IBM", "full", date(2023, 6, 1), io.BytesIO(b"x" * 10))
+
+        # A temporary file left by an interrupted put is removed by the next scan, a recent one is kept.
+        folder = cache.folder("IBM", "full")
+        stale, recent = os.path.join(folder, "stale.tmp"), os.path.join(folder, "recent.tmp")
+        for path in (stale, recent):
+            with open(path, "wb") as f:
+                f.write(b"x" * 1000)
+        os.utime(stale, (0, 0))
+
+        with mock.patch.object(cache, "evict", wraps=cache.evict) as evict:
+            for symbol in ["AAPL", "MSFT", "AMZN"]:
+                cache.put(symbol, "full", date(2023, 6, 1), io.BytesIO(b"x" * 10))
+            assert evict.call_count == 0 and cache.size == 40
+
+            cache.put("GOOG", "full", date(2023, 6, 1), io.BytesIO(b"x" * 70))
+            assert evict.call_count == 1
+
+        # Evicted to 90 bytes, so the oldest responses go: IBM and AAPL.
+        assert cache.size == 90
+        assert [cache.find(symbol, "full", date(2023, 6, 1)) is not None for symbol in ["IBM", "AAPL", "MSFT", "AMZN", "GOOG"]] == \
+            [False, False, True, True, True]
+        assert (os.path.exists(stale), os.path.exists(recent)) == (False, True)
+
+    def test_last_trading_day(self):
+        # Friday, Saturday, Sunday and Monday.
+        assert [last_trading_day(date(2023, 6, day)) for day in (2, 3, 4, 5)] == [date(2023, 6, 2), date(2023, 6, 2), date(2023, 6, 2), date(2023, 6, 5)]
+
+
+class IterDailyEntriesTestcase(unittest.TestCase):
+
+    def body(self, content):
+        return io.BytesIO(content.encode())
+
+    def test_iter_daily_entries(self):
+        body = self.body(json.dumps({"Meta Data": {}, "Time Series (Daily)": DAILY_SERIES}))
+
+        assert list(iter_daily_entries(body, "IBM ", date(2020, 1, 1), date(2020, 1, 3))) == [
+            ("IBM", "2020-01-02", "3.15", "3.19", "2233"),
+            ("IBM", "2020-01-01", "3.14", "3.18", "2232"),
+        ]
+
+    def test_iter_daily_entries_date_range(self):
+        body = self.body(json.dumps({"Meta Data": {}, "Time Series (Daily)": DAILY_SERIES}))
+
+        assert list(iter_daily_entries(body, "IBM", date(2020, 1, 1), date(2020, 1, 2))) == [
+            ("IBM", "2020-01-01", "3.14", "3.18", "2232"),
+        ]
+
+    def test_iter_daily_entries_stops_at_date_start(self):
+        # Twenty years of older entries after the requested ones are never read.
+        old_entries = {f"{year}-{month:02}-{day:02}": DAILY_SERIES["2020-01-01"] for year in range(2019, 1999, -1) for month in range(12, 0, -1) for day in range(28, 0, -1)}
+        content = json.dumps({"Meta Data": {}, "Time Series (Daily)": {**DAILY_SERIES, **old_entries}})
+        body = self.body(content)
+
+        assert len(list(iter_daily_entries(body, "IBM", date(2020, 1, 1), date(2020, 1, 3)))) == 2
+        assert body.tell() < len(content) / 2
+
+
+class CSVStreamTestcase(unittest.TestCase):
+
+    def test_read(self):
+        stream = CSVStream([("IBM", "2020-01-02", "3.15", "3.19", "2233"), ("IBM", "2020-01-01", "3.14", "3.18", "2232")])
+
+        assert stream.read(10) == "IBM,2020-0"
+        assert stream.read() == "1-02,3.15,3.19,2233\r\nIBM,2020-01-01,3.14,3.18,2232\r\n"
+        assert stream.read(10) == ""
+
+
+class TokenBucketTestcase(unittest.TestCase):
+
+    def test_acquire_within_rate(self):
+        # 1200 tokens per minute is one every 50ms, the first one is available right away.
+        bucket = TokenBucket(1200)
+
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        assert 0.19 <= elapsed < 0.5
+
+
+class ChooseOutputSizeTestcase(unittest.TestCase):
+
+    def test_choose_output_size_compact(self):
+        assert choose_output_size(date(2023, 5, 1), date(2023, 6, 1)) == "compact"
+
+    def test_choose_output_size_full(self):
+        assert choose_output_size(date(2022, 5, 1), date(2023, 6, 1)) == "full"
+        assert choose_output_size(date.min, date(2023, 6, 1)) == "full"
@@ -1,31 +1,46 @@
+import asyncio
+import pytest
+
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, insert
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 
-from financial.main import app
-from financial.database import Base, get_db
-from financial.models import FinancialData
-from financial.crud import count_financial_data
+from financial.main import app, response_cache
+from financial.database import Base, get_db, get_session_factory
+from financial.models import FinancialData, FinancialDataRollup
+from financial.pagination import encode_cursor
 from datetime import date
 
 SQLALCHEMY_DB_URL = "sqlite:///./test.db"
+SQLALCHEMY_ASYNC_DB_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DB_URL, connect_args={"check_same_thread": False}
 )
 
+# The API uses async sessions. Each TestClient request runs on its own event loop,
+# so connections are not pooled between requests.
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DB_URL, poolclass=NullPool
+)
+
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 Base.metadata.create_all(bind=engine)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_session_factory] = lambda: TestingAsyncSessionLocal
+
+def count_test_db(symbol):
+    with TestingSessionLocal() as db:
+        return db.query(FinancialData).filter(FinancialData.symbol == symbol).count()
 
 def pre_populate_test_db():
 
@@ -38,21 +53,39 @@ def pre_populate_test_db():
     entries.append(FinancialData(symbol="AAPL", date=date(2020, 1, 2), open_price=3.14, close_price=3.19, volume=2.233))
     entries.append(FinancialData(symbol="AAPL", date=date(2020, 1, 3), open_price=3.14, close_price=3.20, volume=2.234))
 
-    with next(override_get_db()) as db:
+    with TestingSessionLocal() as db:
         db.add_all(entries)
+        db.add_all(rollup_entries(entries))
         db.commit()
 
 
-    count = count_financial_data(next(get_db()), "IBM", date(2020, 1, 1), date(2020, 1, 4))
+    count = count_test_db("IBM")
     print(f"Inserted {count} records")
 
 
+def rollup_entries(entries):
+    """ Running totals of the entries, as the ingester stores them. """
+    totals = {}
+    rollups = []
+    for entry in sorted(entries, key=lambda entry: (entry.symbol, entry.date)):
+        open_price, close_price, volume, count = totals.get(entry.symbol, (0, 0, 0, 0))
+        totals[entry.symbol] = (open_price + entry.open_price, close_price + entry.close_price, volume + entry.volume, count + 1)
+        rollups.append(FinancialDataRollup(symbol=entry.symbol, date=entry.date, cum_open_price=totals[entry.symbol][0],
+            cum_close_price=totals[entry.symbol][1], cum_volume=totals[entry.symbol][2], cum_count=totals[entry.symbol][3]))
+
+    return rollups
+
 def clear_test_db():
-    with next(override_get_db()) as db:
+    with TestingSessionLocal() as db:
         db.query(FinancialData).delete()
+        db.query(FinancialDataRollup).delete()
         db.commit()
 
-    count = count_financial_data(next(get_db()), "IBM", date(2020, 1, 1), date(2020, 1, 4))
+    # Fixtures are written without notifying the API, so cached responses are dropped here.
+    if response_cache is not None:
+        response_cache.clear()
+
+    count = count_test_db("IBM")
     print(f"Existing: {count} records")
 
 client = TestClient(app)
@@ -88,7 +121,8 @@ def test_get_financial_data():
             "count": 4,
             "page": 1,
             "limit": 2,
-            "pages": 2
+            "pages": 2,
+            "next_cursor": encode_cursor(date(2020, 1, 2), "IBM")
         },
         "info": {
             "error": ""
@@ -110,6 +144,70 @@ def test_get_financial_data_no_data():
     }
 
 
+def test_get_financial_data_cursor():
+    pre_populate_test_db()
+    first_page = client.get("/api/financial_data?&start_date=2020-01-01&end_date=2020-01-04&symbol=IBM&limit=3&include_count=false")
+    next_cursor = first_page.json()["pagination"]["next_cursor"]
+    second_page = client.get(f"/api/financial_data?&start_date=2020-01-01&end_date=2020-01-04&symbol=IBM&limit=3&cursor={next_cursor}")
+
+    clear_test_db()
+
+    assert first_page.json()["pagination"] == {
+        "page": 1,
+        "limit": 3,
+        "next_cursor": encode_cursor(date(2020, 1, 3), "IBM")
+    }
+    assert second_page.json() == {
+        "data": [
+            {
+                "date": "2020-01-04",
+                "open_price": 3.17,
+                "volume": 2.235,
+                "close_price": 3.21,
+                "symbol": "IBM"
+            }
+        ],
+        "pagination": {
+            "limit": 3,
+            "next_cursor": None
+        },
+        "info": {
+            "error": ""
+        }
+    }
+
+
+def test_get_financial_data_cursor_all_symbols():
+    pre_populate_test_db()
+    first_page = client.get("/api/financial_data?&start_date=2020-01-01&end_date=2020-01-04&limit=3")
+    next_cursor = first_page.json()["pagination"]["next_cursor"]
+    second_page = client.get(f"/api/financial_data?&start_date=2020-01-01&end_date=2020-01-04&limit=3&cursor={next_cursor}")
+
+    clear_test_db()
+
+    assert [(entry["date"], entry["symbol"]) for entry in first_page.json()["data"]] == [
+        ("2020-01-01", "AAPL"), ("2020-01-01", "IBM"), ("2020-01-02", "AAPL")
+    ]
+    assert [(entry["date"], entry["symbol"]) for entry in second_page.json()["data"]] == [
+        ("2020-01-02", "IBM"), ("2020-01-03", "AAPL"), ("2020-01-03", "IBM")
+    ]
+
+
+def test_get_financial_data_fail_invalid_cursor():
+    response = client.get("/api/financial_data?symbol=IBM&cursor=not-a-cursor")
+
+    assert response.status_code == 400
+    assert response.json() == {
+        "info": {
+            "error": [
+                {
+                    "cursor": "Invalid cursor. Use the next_cursor value of a previous response."
+                }
+            ]
+        }
+    }
+
+
 def test_get_statiscs_fail_request_validation_error_start_date():
     pre_populate_test_db()
 
@@ -229,3 +327,295 @@ def test_get_statiscs_fail_date_missing():
             ]
         }
     }
+
+
+def test_get_statiscs_success_full_range():
+    entries = [FinancialData(symbol="MSFT", date=date(2020, 1, day), open_price=float(day), close_price=float(day) + 1, volume=day * 100) for day in range(1, 16)]
+
+    with TestingSessionLocal() as db:
+        db.add_all(entries)
+        db.commit()
+
+    response = client.get("/api/statistics?symbol=MSFT&start_date=2020-01-01&end_date=2020-01-31")
+
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": {
+            "start_date": "2020-01-01",
+            "end_date": "2020-01-31",
+            "symbol": "MSFT",
+            "average_daily_open_price": 8.0,
+            "average_daily_close_price": 9.0,
+            "average_daily_volume": 800.0
+        },
+        "info": {
+            "error": ""
+        }
+    }
+
+
+def test_get_statiscs_rollup():
+    pre_populate_test_db()
+
+    ranges = [("2020-01-01", "2020-01-04"), ("2020-01-02", "2020-01-03"), ("2019-12-01", "2020-01-02"), ("2020-01-04", "2020-02-01")]
+    responses = [(client.get(f"/api/statistics?symbol=IBM&start_date={start}&end_date={end}").json(),
+        client.get(f"/api/statistics?symbol=IBM&start_date={start}&end_date={end}&method=rollup").json()) for start, end in ranges]
+
+    clear_test_db()
+
+    # Sums are added in a different order, so the last rounded digit may differ.
+    for raw, rollup in responses:
+        assert raw["info"]["error"] == ""
+        assert rollup["info"] == raw["info"]
+        assert rollup["data"] == pytest.approx(raw["data"], abs=1e-3)
+
+
+def test_get_statiscs_rollup_no_data():
+    pre_populate_test_db()
+
+    before = client.get("/api/statistics?symbol=IBM&start_date=2019-01-01&end_date=2019-12-31&method=rollup")
+    after = client.get("/api/statistics?symbol=IBM&start_date=2020-02-01&end_date=2020-02-28&method=rollup")
+
+    clear_test_db()
+
+    for response in (before, after):
+        assert response.status_code == 200
+        assert response.json() == {
+            "data": {},
+            "info": {
+                "error": "No records were found for symbol: IBM on the reqested date range."
+            }
+        }
+
+
+def test_get_statiscs_fail_invalid_method():
+    response = client.get("/api/statistics?symbol=IBM&start_date=2020-01-01&end_date=2020-01-04&method=median")
+
+    assert response.status_code == 400
+
+
+def test_export_financial_data_csv():
+    pre_populate_test_db()
+
+    response = client.get("/api/financial_data/export?symbol=AAPL&start_date=2020-01-01&end_date=2020-01-02")
+
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert response.headers["content-disposition"] == 'attachment; filename="AAPL.csv"'
+    assert response.text == (
+        "symbol,date,open_price,close_price,volume\r\n"
+        "AAPL,2020-01-01,3.14,3.18,2.232\r\n"
+        "AAPL,2020-01-02,3.14,3.19,2.233\r\n"
+    )
+
+
+def test_export_financial_data_csv_no_data():
+    response = client.get("/api/financial_data/export?symbol=AAPL")
+
+    assert response.status_code == 200
+    assert response.text == "symbol,date,open_price,close_price,volume\r\n"
+
+
+def test_export_financial_data_arrow():
+    pyarrow = pytest.importorskip("pyarrow")
+    entries = [FinancialData(symbol="MSFT", date=date(2020, 1, day), open_price=float(day), close_price=float(day) + 1, volume=day * 100) for day in range(1, 16)]
+
+    with TestingSessionLocal() as db:
+        db.add_all(entries)
+        db.commit()
+
+    arrow = client.get("/api/financial_data/export?symbol=MSFT&format=arrow")
+    parquet = client.get("/api/financial_data/export?symbol=MSFT&format=parquet")
+
+    clear_test_db()
+
+    assert arrow.status_code == 200
+    table = pyarrow.ipc.open_stream(arrow.content).read_all()
+    assert table.column_names == ["symbol", "date", "open_price", "close_price", "volume"]
+    assert table.column("date").to_pylist() == [date(2020, 1, day) for day in range(1, 16)]
+    assert table.column("volume").to_pylist() == [day * 100 for day in range(1, 16)]
+
+    assert parquet.status_code == 200
+    import pyarrow.parquet
+    assert pyarrow.parquet.read_table(pyarrow.BufferReader(parquet.content)).equals(table)
+
+
+def test_export_financial_data_fail_invalid_format():
+    response = client.get("/api/financial_data/export?symbol=MSFT&format=xlsx")
+
+    assert response.status_code == 400
+
+
+def test_get_analytics():
+    pre_populate_test_db()
+
+    response = client.get("/api/analytics?symbol=IBM&start_date=2020-01-02&end_date=2020-01-03&window=2")
+
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [
+            {
+                "date": "2020-01-02",
+                "close_price": 3.19,
+                "sma": 3.185,
+                "ema": 3.185,
+                "vwap": 3.185,
+                "return": 0.003145,
+                "volatility": None
+            },
+            {
+                "date": "2020-01-03",
+                "close_price": 3.2,
+                "sma": 3.195,
+                "ema": 3.195,
+                "vwap": 3.195,
+                "return": 0.003135,
+                "volatility": 7e-06
+            }
+        ],
+        "info": {
+            "error": ""
+        }
+    }
+
+
+def test_get_analytics_no_data():
+    pre_populate_test_db()
+
+    response = client.get("/api/analytics?symbol=IBM&start_date=2020-02-01&end_date=2020-02-28")
+
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [],
+        "info": {
+            "error": "No records were found for symbol: IBM on the reqested date range."
+        }
+    }
+
+
+def test_get_batch_statistics():
+    pre_populate_test_db()
+
+    response = client.get("/api/statistics/batch?symbols=IBM,AAPL&windows=2020-01-01:2020-01-04,2020-01-04:2020-01-31")
+
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": {
+            "windows": [
+                {"start_date": "2020-01-01", "end_date": "2020-01-04"},
+                {"start_date": "2020-01-04", "end_date": "2020-01-31"}
+            ],
+            "statistics": {
+                "IBM": [
+                    {"average_daily_open_price": 3.155, "average_daily_close_price": 3.195, "average_daily_volume": 2.234},
+                    {"average_daily_open_price": 3.17, "average_daily_close_price": 3.21, "average_daily_volume": 2.235}
+                ],
+                "AAPL": [
+                    {"average_daily_open_price": 3.14, "average_daily_close_price": 3.19, "average_daily_volume": 2.233},
+                    None
+                ]
+            }
+        },
+        "info": {
+            "error": ""
+        }
+    }
+
+
+def test_get_batch_statistics_single_window_missing_symbol():
+    pre_populate_test_db()
+
+    response = client.get("/api/statistics/batch?symbols=IBM,MSFT&start_date=2020-01-01&end_date=2020-01-04")
+
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": {
+            "windows": [
+                {"start_date": "2020-01-01", "end_date": "2020-01-04"}
+            ],
+            "statistics": {
+                "IBM": [
+                    {"average_daily_open_price": 3.155, "average_daily_close_price": 3.195, "average_daily_volume": 2.234}
+                ],
+                "MSFT": [None]
+            }
+        },
+        "info": {
+            "error": "No records were found for symbols: MSFT on the reqested date ranges."
+        }
+    }
+
+
+def test_get_batch_statistics_fail_windows_missing():
+    response = client.get("/api/statistics/batch?symbols=IBM,AAPL")
+
+    assert response.status_code == 400
+    assert response.json() == {
+        "info": {
+            "error": [
+                {
+                    "windows": "Either windows or start_date and end_date are required."
+                }
+            ]
+        }
+    }
+
+
+def test_get_pool_metrics():
+    response = client.get("/metrics/pool")
+
+    assert response.status_code == 200
+    assert response.json()["pool_size"] == 5
+    assert set(response.json()) == {
+        "pool_size", "max_overflow", "checked_in", "checked_out", "overflow",
+        "checkouts", "timeouts", "waits", "wait_seconds_total", "wait_seconds_max", "connects", "connect_seconds_total"
+    }
+
+
+def test_get_metrics():
+    pre_populate_test_db()
+    client.get("/api/analytics?symbol=IBM&start_date=2020-01-01&end_date=2020-01-04&window=2")
+    response = client.get("/metrics")
+    clear_test_db()
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/analytics",status="200"}' in response.text
+    assert 'http_request_render_seconds_count{route="/api/analytics"}' in response.text
+    assert "db_pool_checkouts" in response.text
+
+
+@pytest.mark.skipif(response_cache is None, reason="CACHE_ENABLED is false")
+def test_get_statiscs_cached():
+    pre_populate_test_db()
+    response = client.get("/api/statistics?symbol=IBM&start_date=2020-01-01&end_date=2020-01-04")
+
+    # Data written without notifying the API is not seen until the symbol is invalidated.
+    with TestingSessionLocal() as db:
+        db.query(FinancialData).filter(FinancialData.symbol == "IBM").delete()
+        db.commit()
+    cached_response = client.get("/api/statistics?symbol=IBM&start_date=2020-01-01&end_date=2020-01-04")
+    not_modified_response = client.get("/api/statistics?symbol=IBM&start_date=2020-01-01&end_date=2020-01-04", headers={"If-None-Match": response.headers["ETag"]})
+
+    asyncio.run(response_cache.invalidate("IBM"))
+    invalidated_response = client.get("/api/statistics?symbol=IBM&start_date=2020-01-01&end_date=2020-01-04")
+
+    clear_test_db()
+
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+    assert cached_response.json() == response.json()
+    assert cached_response.headers["ETag"] == response.headers["ETag"]
+    assert not_modified_response.status_code == 304
+    assert invalidated_response.json()["data"] == {}
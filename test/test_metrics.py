@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+
+from datetime import date
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from financial.database import Base, InstrumentedPool, pool_metrics
+from financial.metrics import Histogram, MetricsMiddleware, instrument_engine, record_rows, render_metrics, request_queries, request_rows
+from financial.models import FinancialData
+from financial.responses import FastJSONResponse
+
+
+class HistogramTestcase(unittest.TestCase):
+
+    def test_render(self):
+        histogram = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+
+        assert histogram.render() == [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="/a",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a",le="1"} 2',
+            'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+            'latency_seconds_sum{route="/a"} 5.550000',
+            'latency_seconds_count{route="/a"} 3',
+        ]
+
+    def test_render_gauges(self):
+        metrics = render_metrics({"db_pool": {"checkouts": 3, "shared": False, "name": "primary"}})
+
+        assert "db_pool_checkouts 3.0\n" in metrics
+        assert "db_pool_shared" not in metrics
+        assert "db_pool_name" not in metrics
+
+
+class PoolMetricsTestcase(unittest.IsolatedAsyncioTestCase):
+    """ Checks out the single connection of a pool over a SQLite database """
+
+    async def test_wait_and_connect(self):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'pool.db')}",
+                poolclass=InstrumentedPool, pool_size=1, max_overflow=0, pool_timeout=0.1)
+            checkouts, waits, timeouts, connects = pool_metrics.checkouts, pool_metrics.waits, pool_metrics.timeouts, pool_metrics.connects
+
+            # Opening the connection is a connect, not a wait, and so is taking it again once returned.
+            async with engine.connect():
+                pass
+            async with engine.connect():
+                # Only the checkout that finds it in use waits.
+                with self.assertRaises(exc.TimeoutError):
+                    await engine.connect().start()
+            await engine.dispose()
+
+            assert pool_metrics.checkouts - checkouts == 3
+            assert pool_metrics.connects - connects == 1
+            assert pool_metrics.waits - waits == 1
+            assert pool_metrics.timeouts - timeouts == 1
+            assert pool_metrics.max_wait_seconds >= 0.1
+
+
+class MetricsMiddlewareTestcase(unittest.TestCase):
+    """ Records the queries of requests served by a small app over a SQLite database """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, "metrics.db")
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        instrument_engine(engine)
+
+        app = FastAPI(default_response_class=FastJSONResponse)
+        app.add_middleware(MetricsMiddleware, server_timing=True)
+
+        @app.get("/entries/{symbol}")
+        async def entries(symbol: str):
+            async with AsyncSession(engine) as db:
+                db.add_all(FinancialData(symbol=symbol, date=date(2023, 1, day), open_price=1, close_price=1, volume=1) for day in range(1, 4))
+                await db.commit()
+                rows = (await db.execute(select(FinancialData.symbol, FinancialData.date).where(FinancialData.symbol == symbol))).all()
+                record_rows(len(rows))
+            return FastJSONResponse({"data": rows})
+
+        @app.get("/fail")
+        async def fail():
+            raise RuntimeError("fail")
+
+        cls.client = TestClient(app, raise_server_exceptions=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_server_timing(self):
+        response = self.client.get("/entries/IBM")
+
+        assert response.status_code == 200
+        assert len(response.json()["data"]) == 3
+        assert '"2 queries, 3 rows"' in response.headers["Server-Timing"]
+        assert "render;dur=" in response.headers["Server-Timing"]
+
+    def test_labelled_by_route(self):
+        self.client.get("/entries/AAPL")
+        self.client.get("/entries/MSFT")
+
+        assert ("/entries/{symbol}",) in request_queries.series
+        assert not any("/entries/MSFT" in labels for labels in request_queries.series)
+        assert request_rows.series[("/entries/{symbol}",)]["sum"] > 0
+
+    def test_errors_recorded(self):
+        response = self.client.get("/fail")
+
+        assert response.status_code == 500
+        assert 'http_request_duration_seconds_count{method="GET",route="/fail",status="500"} 1' in render_metrics({})
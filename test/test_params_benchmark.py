@@ -0,0 +1,11 @@
+import asyncio
+
+from benchmark.params import QUERY, call
+
+
+def test_current_matches_legacy():
+    async def compare():
+        for query in (QUERY, b"symbol=IBM&start_date=2020&end_date=2020-06-01", b"symbol=IBM&start_date=2020-06-01&end_date=2020-01-01"):
+            assert await call("/current", query) == await call("/legacy", query)
+
+    asyncio.run(compare())
@@ -0,0 +1,65 @@
+import unittest
+
+import pytest
+
+from decimal import Decimal
+
+from get_raw_data import check_rollups, persist_data, persist_data_bulk
+
+ENTRIES = [
+    ("IBM", "2019-12-31", "3.10", "3.12", "2231"),
+    ("IBM", "2020-01-01", "3.14", "3.18", "2232"),
+    ("IBM", "2020-01-02", "3.15", "3.19", "2233"),
+]
+
+
+@pytest.mark.usefixtures("postgres_schema")
+class PersistTestcase(unittest.TestCase):
+    """ Writes entries with persist_data and persist_data_bulk, in the schema of postgres_schema """
+
+    def check_persist(self, persist):
+        # New entries, over two yearly partitions.
+        assert persist(self.schema.db, "IBM", ENTRIES) == 3
+        assert self.schema.query("SELECT date::text, open_price, close_price, volume FROM financial_data ORDER BY date") == [
+            ("2019-12-31", 3.10, 3.12, 2231), ("2020-01-01", 3.14, 3.18, 2232), ("2020-01-02", 3.15, 3.19, 2233)]
+        assert self.schema.query("SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE 'financial_data_2%' ORDER BY 1") == [
+            ("financial_data_2019",), ("financial_data_2020",)]
+
+        # Entries stored with the same values are not written again.
+        assert persist(self.schema.db, "IBM", ENTRIES) == 0
+
+        # Only the changed entry is written, and the running totals follow it.
+        changed = ENTRIES[:2] + [("IBM", "2020-01-02", "4.15", "4.19", "3233")]
+        assert persist(self.schema.db, "IBM", changed) == 1
+        assert self.schema.query("SELECT cum_open_price, cum_close_price, cum_volume, cum_count FROM financial_data_rollup WHERE date = '2020-01-02'") == [
+            (Decimal("10.39"), Decimal("10.49"), Decimal(2231 + 2232 + 3233), 3)]
+        assert check_rollups(self.schema.db) == []
+
+    def test_persist_data(self):
+        self.check_persist(persist_data)
+
+    def test_persist_data_bulk(self):
+        self.check_persist(persist_data_bulk)
+
+    def test_upgrade_unpartitioned(self):
+        # Tables of a database created before financial_data was partitioned.
+        cursor = self.schema.db.cursor()
+        cursor.execute("""
+            DROP TABLE financial_data, financial_data_rollup;
+            CREATE TABLE financial_data (symbol char(10), date DATE, open_price FLOAT8, close_price FLOAT8, volume INT, PRIMARY KEY(symbol, date));
+            CREATE TABLE financial_data_rollup (symbol char(10), date DATE, cum_open_price NUMERIC, cum_close_price NUMERIC,
+                cum_volume NUMERIC, cum_count BIGINT, PRIMARY KEY(symbol, date));
+            INSERT INTO financial_data VALUES ('IBM', '2019-12-31', 3.10, 3.12, 2231), ('IBM', '2020-01-01', 3.14, 3.18, 2232);
+        """)
+        self.schema.db.commit()
+
+        # Running schema.sql again moves the entries to the partitions, and running it once more changes nothing.
+        for _ in range(2):
+            self.schema.run_schema_sql()
+        assert self.schema.query("SELECT symbol, date::text, volume FROM financial_data ORDER BY date") == [
+            ("IBM", "2019-12-31", 2231), ("IBM", "2020-01-01", 2232)]
+        assert self.schema.query("SELECT relname, relkind FROM pg_class WHERE relnamespace = current_schema()::regnamespace AND relname LIKE 'financial_data%' AND relkind IN ('r', 'p') ORDER BY 1") == [
+            ("financial_data", "p"), ("financial_data_2019", "r"), ("financial_data_2020", "r"), ("financial_data_rollup", "r")]
+        assert persist_data_bulk(self.schema.db, "IBM", ENTRIES) == 1
+        assert self.schema.query("SELECT format_type(atttypid, atttypmod) FROM pg_attribute WHERE attrelid = 'financial_data_rollup'::regclass AND attname = 'symbol'") == [
+            ("text",)]
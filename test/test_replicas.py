@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from financial import crud
+from financial.database import Base, replica_urls, settings
+from financial.models import FinancialData
+from financial.replicas import ReplicaSet, RoutingSession
+
+
+class ReplicaRoutingTestcase(unittest.IsolatedAsyncioTestCase):
+    """ Routes sessions between a primary and two replicas, each one a SQLite file with its own entries """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engines = {}
+
+        for name in ("primary", "replica1", "replica2"):
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, name)}.db")
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+                # The symbol tells which database answered.
+                await connection.execute(FinancialData.__table__.insert(), {"symbol": name, "date": date(2023, 1, 1), "open_price": 1, "close_price": 1, "volume": 1})
+            self.engines[name] = engine
+
+        self.replicas = ReplicaSet([self.engines["replica1"], self.engines["replica2"]], max_lag=5, check_interval=1)
+        self.SessionLocal = async_sessionmaker(bind=self.engines["primary"], autoflush=False, expire_on_commit=False,
+            sync_session_class=RoutingSession, replicas=self.replicas)
+
+    async def asyncTearDown(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.directory.cleanup()
+
+    async def read(self) -> str:
+        async with self.SessionLocal() as db:
+            return (await crud.get_financial_data_by_symbol(db, None, None, None, limit=1))[0].symbol
+
+    async def test_replicas_not_used_before_checked(self):
+        assert await self.read() == "primary"
+        assert self.replicas.fallbacks == 1
+
+    async def test_reads_round_robin(self):
+        await self.replicas.check_all()
+
+        assert [await self.read() for _ in range(4)] == ["replica1", "replica2", "replica1", "replica2"]
+        assert self.replicas.reads == 4
+
+    async def test_unavailable_replica_skipped(self):
+        missing = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'missing', 'replica3.db')}")
+        self.replicas = ReplicaSet([self.engines["replica1"], missing], max_lag=5, check_interval=1)
+        self.SessionLocal.configure(replicas=self.replicas)
+        await self.replicas.check_all()
+
+        assert [await self.read() for _ in range(3)] == ["replica1"] * 3
+        assert self.replicas.status()["replicas"][1]["healthy"] is False
+        assert self.replicas.status()["replicas"][1]["error"] is not None
+
+    async def test_lagging_replicas_fall_back_to_primary(self):
+        async def lagging_check(engine):
+            self.replicas.state[engine].update(healthy=False, lag=60.0)
+
+        self.replicas.check = lagging_check
+        await self.replicas.check_all()
+
+        assert await self.read() == "primary"
+
+    async def test_replica_kept_by_session(self):
+        await self.replicas.check_all()
+
+        async with self.SessionLocal() as db:
+            symbols = [(await crud.get_financial_data_by_symbol(db, None, None, None, limit=1))[0].symbol for _ in range(3)]
+
+        assert symbols == ["replica1"] * 3
+
+    async def test_writes_go_to_primary(self):
+        await self.replicas.check_all()
+
+        async with self.SessionLocal() as db:
+            db.add(FinancialData(symbol="IBM", date=date(2023, 1, 2), open_price=1, close_price=1, volume=1))
+            await db.commit()
+
+            # Locking reads are served by the primary too.
+            locked = await db.scalars(select(FinancialData.symbol).order_by(FinancialData.symbol).with_for_update())
+            assert locked.all() == ["IBM", "primary"]
+
+            # Reads of the session still go to the replica, which has not received the entry.
+            assert await crud.count_financial_data(db, "IBM", None, None) == 0
+
+
+class ReplicaUrlsTestcase(unittest.TestCase):
+
+    def test_replica_urls(self):
+        urls = replica_urls("replica1, replica2:5433,")
+
+        assert [(url.host, url.port) for url in urls] == [("replica1", settings.DATABASE_PORT), ("replica2", 5433)]
+
+    def test_no_replicas(self):
+        assert replica_urls(None) == []
+        assert replica_urls("") == []
@@ -25,3 +25,27 @@ class RequestSchemaDateTestcase(unittest.TestCase):
 
     def test_cross_validate_dates_fail(self):
         self.assertRaises(RequestValidationError, cross_validate_dates, "2018-06-01", "2018-05-01")
+
+
+class RequestSchemaBatchTestcase(unittest.TestCase):
+
+    def test_symbols_validation_success(self):
+        assert validated(parse_symbols, " IBM,AAPL,,IBM ", "symbols") == ["IBM", "AAPL"]
+
+    def test_symbols_validation_fail_empty(self):
+        self.assertRaises(RequestValidationError, validated, parse_symbols, " , ", "symbols")
+
+    def test_symbols_validation_fail_too_many(self):
+        self.assertRaises(RequestValidationError, validated, parse_symbols, ",".join(f"S{i}" for i in range(MAX_BATCH_SYMBOLS + 1)), "symbols")
+
+    def test_windows_validation_success(self):
+        assert validated(parse_windows, "2018-05-01:2018-05-20, 2019-01-01:2019-12-31", "windows") == [
+            (date(2018, 5, 1), date(2018, 5, 20)),
+            (date(2019, 1, 1), date(2019, 12, 31))
+        ]
+
+    def test_windows_validation_fail_separator(self):
+        self.assertRaises(RequestValidationError, validated, parse_windows, "2018-05-01", "windows")
+
+    def test_windows_validation_fail_date_range(self):
+        self.assertRaises(RequestValidationError, validated, parse_windows, "2018-06-01:2018-05-01", "windows")
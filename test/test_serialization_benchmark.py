@@ -0,0 +1,12 @@
+import json
+
+from sqlalchemy.orm import Session
+
+from benchmark.serialization import create_page_engine, orm_page, row_page
+
+LIMIT = 1000
+
+
+def test_row_page_matches_orm_page():
+    with Session(create_page_engine(LIMIT)) as db:
+        assert json.loads(row_page(db, LIMIT)) == json.loads(orm_page(db, LIMIT))
@@ -0,0 +1,34 @@
+import os
+import runpy
+
+from unittest import mock
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+
+
+def test_gunicorn_config():
+    with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "3", "WORKER_MAX_REQUESTS": "1000"}):
+        config = runpy.run_path(CONFIG)
+
+    assert config["preload_app"] is True
+    assert config["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert config["workers"] == 3
+    assert config["max_requests"] == 1000
+    assert config["max_requests_jitter"] == 100
+
+
+def test_gunicorn_config_workers_by_cpu():
+    with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "0"}):
+        config = runpy.run_path(CONFIG)
+
+    assert config["workers"] == os.cpu_count()
+
+
+def test_gunicorn_config_without_database_settings():
+    variables = ("POSTGRES_PASSWORD", "POSTGRES_USER", "POSTGRES_DB", "POSTGRES_HOST", "POSTGRES_HOSTNAME", "DATABASE_PORT", "API_KEY")
+    environ = {name: value for name, value in os.environ.items() if name not in variables}
+
+    with mock.patch.dict(os.environ, {**environ, "WEB_CONCURRENCY": "2"}, clear=True):
+        config = runpy.run_path(CONFIG)
+
+    assert config["workers"] == 2
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from benchmark.startup import import_times
+
+# Import time budgets in milliseconds, about twice the time measured when they were set
+# so they hold on slower machines. Modules that are only needed by some requests or
+# commands must not be imported with the app or the ingester.
+BUDGETS = {
+    "financial.main": (1200, {"numpy", "asyncpg", "financial.store", "financial.analytics"}),
+    "get_raw_data": (250, {"requests"}),
+}
+
+
+def test_import_time_budgets():
+    for module, (budget, deferred) in BUDGETS.items():
+        times = import_times(module)
+
+        assert times[module][1] / 1000 < budget, f"{module} took {times[module][1] / 1000:.0f}ms to import, over {budget}ms"
+        assert not deferred & times.keys(), f"{module} imported {', '.join(deferred & times.keys())}"
+
+
+def test_import_without_settings():
+    env = {name: value for name, value in os.environ.items() if not name.startswith(("POSTGRES_", "DATABASE_", "API_"))}
+    result = subprocess.run([sys.executable, "-c", "import financial.database, financial.crud, financial.main, get_raw_data"], env=env, capture_output=True, text=True,
+        cwd=os.path.join(os.path.dirname(__file__), ".."))
+
+    assert result.returncode == 0, result.stderr
+
+
+def test_help_without_settings():
+    env = {name: value for name, value in os.environ.items() if not name.startswith(("POSTGRES_", "DATABASE_", "API_"))}
+    result = subprocess.run([sys.executable, "get_raw_data.py", "--help"], env=env, capture_output=True, text=True,
+        cwd=os.path.join(os.path.dirname(__file__), ".."))
+
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,100 @@
+import os
+import pytest
+import tempfile
+import unittest
+
+from datetime import date, timedelta
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from financial import crud
+from financial.database import Base
+from financial.models import FinancialData
+from financial.store import ColumnStore
+
+
+def entries(symbol: str, first: date, days: int, price: float) -> list[dict]:
+    return [
+        {"symbol": symbol, "date": first + timedelta(days=day), "open_price": price + day / 7, "close_price": price + day / 3, "volume": 1000 + day}
+        for day in range(days)
+    ]
+
+
+class ColumnStoreTestcase(unittest.IsolatedAsyncioTestCase):
+    """ Checks that the column store answers as the crud functions, over the same SQLite database """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'store.db')}")
+
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.execute(insert(FinancialData), entries("IBM", date(2020, 1, 1), 60, 100) + entries("AAPL", date(2020, 1, 15), 30, 50))
+
+        self.store = ColumnStore(self.engine)
+        await self.store.reload()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.directory.cleanup()
+
+    async def test_serves(self):
+        assert self.store.serves("IBM")
+        assert not self.store.serves(None)
+        assert not ColumnStore(self.engine).serves("IBM")
+
+    async def test_count(self):
+        async with AsyncSession(self.engine) as db:
+            for symbol, start_date, end_date in [("IBM", None, None), ("IBM", date(2020, 1, 10), date(2020, 2, 10)), ("AAPL", date(2019, 1, 1), date(2020, 1, 20)),
+                    ("IBM", date(2021, 1, 1), None), ("MSFT", None, None)]:
+                assert self.store.count_financial_data(symbol, start_date, end_date) == await crud.count_financial_data(db, symbol, start_date, end_date)
+
+    async def test_pages(self):
+        async with AsyncSession(self.engine) as db:
+            for offset, limit in [(0, 5), (10, 20), (55, 10), (100, 5)]:
+                expected = await crud.get_financial_data_by_symbol(db, "IBM", date(2020, 1, 5), date(2020, 2, 20), offset=offset, limit=limit)
+                page = self.store.get_financial_data_by_symbol("IBM", date(2020, 1, 5), date(2020, 2, 20), offset=offset, limit=limit)
+
+                assert [entry._asdict() for entry in page] == [row._asdict() for row in expected]
+
+    async def test_pages_cursor(self):
+        async with AsyncSession(self.engine) as db:
+            for after in [(date(2020, 1, 20), "IBM"), (date(2020, 1, 20), "AAPL"), (date(2020, 1, 20), "MSFT"), (date(2021, 1, 1), "IBM")]:
+                expected = await crud.get_financial_data_by_symbol(db, "IBM", None, None, limit=5, after=after)
+                page = self.store.get_financial_data_by_symbol("IBM", None, None, limit=5, after=after)
+
+                assert [entry._asdict() for entry in page] == [row._asdict() for row in expected]
+
+    async def test_statistics(self):
+        async with AsyncSession(self.engine) as db:
+            for symbol, start_date, end_date in [("IBM", date(2020, 1, 10), date(2020, 2, 10)), ("AAPL", None, None)]:
+                expected = await crud.get_financial_statistics(db, symbol, start_date, end_date)
+                statistics = self.store.get_financial_statistics(symbol, start_date, end_date)
+
+                assert statistics.count == expected.count
+                for field in ("average_open_price", "average_close_price", "average_volume"):
+                    assert getattr(statistics, field) == pytest.approx(getattr(expected, field), rel=1e-12)
+
+    async def test_statistics_no_data(self):
+        assert self.store.get_financial_statistics("IBM", date(2021, 1, 1), date(2021, 2, 1)) == crud.EMPTY_STATISTICS
+        assert self.store.get_financial_statistics("MSFT", None, None) == crud.EMPTY_STATISTICS
+
+    async def test_refresh(self):
+        async with self.engine.begin() as connection:
+            await connection.execute(insert(FinancialData), entries("MSFT", date(2020, 3, 1), 10, 200))
+            await connection.execute(delete(FinancialData).where(FinancialData.symbol == "AAPL"))
+            await connection.execute(insert(FinancialData), entries("IBM", date(2020, 3, 1), 5, 100))
+
+        await self.store.refresh("MSFT")
+        await self.store.refresh("AAPL")
+
+        assert self.store.count_financial_data("MSFT", None, None) == 10
+        assert self.store.count_financial_data("AAPL", None, None) == 0
+        # Symbols not notified keep the entries read before.
+        assert self.store.count_financial_data("IBM", None, None) == 60
+
+        await self.store.refresh(None)
+
+        assert self.store.count_financial_data("IBM", None, None) == 65
+        assert self.store.status()["symbols"] == 2
+        assert self.store.status()["refreshes"] == 2